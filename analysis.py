@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file runs all the analyses of the project on a single parse of the map file.
+
+mapparser.count_tags, tags.process_map, users.process_map, audit_shanghai.audit
+and data_shanghai.process_map each parse the whole osm file on their own.
+Here the file is parsed only once and every element is sent to a list of
+registered analyzers.
+
+An analyzer is any object with:
+- a "name" attribute, used as key in the returned results
+- a "process(element)" method, called for every element at its end event
+  (the children of an element are visited before the element itself)
+- a "result()" method, called once the parsing is finished
+
+The output of analyze is a dictionary with the analyzer name as the key
+and the result of the analyzer as value.
+"""
+
+import pprint
+import io
+import json
+
+import tags
+import users
+import audit_shanghai
+import data_shanghai
+import osm_reader
+
+
+class TagCounter(object):
+    """Count the tags of the map, same as mapparser.count_tags"""
+    name = "tags"
+
+    def __init__(self):
+        self.tags = {}
+
+    def process(self, element):
+        tag_name = element.tag
+        if tag_name in self.tags:
+            self.tags[tag_name] = self.tags[tag_name] + 1
+        else:
+            self.tags[tag_name] = 1
+
+    def result(self):
+        return self.tags
+
+
+class KeyTypeClassifier(object):
+    """Classify the "k" values of the tags, same as tags.process_map"""
+    name = "keys"
+
+    def __init__(self):
+        self.keys = {"lower": 0,
+                     "lower_colon": 0,
+                     "problemchars": 0,
+                     "other": 0}
+
+    def process(self, element):
+        self.keys = tags.key_type(element, self.keys)
+
+    def result(self):
+        return self.keys
+
+
+class UserCollector(object):
+    """Collect the unique user ids, same as users.process_map"""
+    name = "users"
+
+    def __init__(self):
+        self.users = set()
+
+    def process(self, element):
+        user = users.get_user(element)
+        if user != None:
+            self.users.add(user)
+
+    def result(self):
+        return self.users
+
+
+class FieldAuditor(object):
+    """Collect the problem values of the fields, same as audit_shanghai.audit"""
+    name = "audit"
+
+    def __init__(self):
+        self.problems = audit_shanghai.init_problems()
+
+    def process(self, element):
+        audit_shanghai.audit_element(self.problems, element)
+
+    def result(self):
+        return self.problems
+
+
+class ShapeWriter(object):
+    """Shape the elements and write them into a json file,
+    same as data_shanghai.process_map"""
+    name = "shape"
+
+    def __init__(self, file_out):
+        self.file_out = file_out
+        # Opened with the first element, so nothing is left open if the
+        # parsing fails before
+        self.fo = None
+        self.count = 0
+
+    def process(self, element):
+        el = data_shanghai.shape_element(element)
+        if el:
+            if self.fo is None:
+                self.fo = io.open(self.file_out, "w", encoding="utf8")
+            # Make sure the Chinese characters can be correctly written
+            jdata = unicode(json.dumps(el, ensure_ascii=False))
+            self.fo.write(jdata + "\n")
+            self.count += 1
+
+    def close(self):
+        if self.fo is not None:
+            self.fo.close()
+            self.fo = None
+
+    def result(self):
+        if self.fo is None and self.count == 0:
+            # No document, same empty output as process_map
+            io.open(self.file_out, "w", encoding="utf8").close()
+        self.close()
+        return self.count
+
+
+def default_analyzers(file_in):
+    # All the analyses of the project, the shaped data is written
+    # next to the input file like data_shanghai.process_map does
+    return [TagCounter(),
+            KeyTypeClassifier(),
+            UserCollector(),
+            FieldAuditor(),
+            ShapeWriter("{0}.json".format(file_in))]
+
+
+def analyze(filename, analyzers, backend=osm_reader.DEFAULT_BACKEND, metrics=None):
+    # Iterative parsing, done only once for all the analyzers
+    try:
+        for element in osm_reader.iter_elements(filename, backend, metrics):
+            for analyzer in analyzers:
+                analyzer.process(element)
+    except:
+        # Release the files of the analyzers before failing
+        for analyzer in analyzers:
+            if hasattr(analyzer, "close"):
+                analyzer.close()
+        raise
+    # Collect the results
+    results = {}
+    for analyzer in analyzers:
+        results[analyzer.name] = analyzer.result()
+    return results
+
+
+if __name__ == "__main__":
+    results = analyze('example.osm', default_analyzers('example.osm'))
+    pprint.pprint(results["tags"])
+    pprint.pprint(results["keys"])
+    pprint.pprint(results["users"])
+    audit_shanghai.write_report(results["audit"], 'example.osm.audit.json')
@@ -18,12 +18,20 @@ For the "address" part:
 - "addr:housenumber" : check if the value contains only numbers or
                        in format of numbers-numbers
 
+The problem values are counted with bounded memory: for each field, only
+the TOP_K most frequent problem values are kept (see sketches.SpaceSaving),
+with their counts and a few example element ids. The report is written
+as json or csv.
 """
-import xml.etree.cElementTree as ET
-from collections import defaultdict
+import csv
+import io
+import json
 import re
 import pprint
 
+import osm_reader
+from sketches import SpaceSaving
+
 # REGULAR EXPRESSIONS
 street_type_re = re.compile(r'\S+[\.?|\D]$', re.IGNORECASE)
 chinese_char_re = re.compile(ur'[\u4e00-\u9fff]+')
@@ -36,6 +44,10 @@ expected_street = ["Street", "Avenue", "Boulevard", "Drive", "Court",
 expected_direction = ["North", "South", "East", "West"]
 expected_city = ["上海".decode('utf-8'), "Shanghai"]
 
+# number of problem values kept by field, and examples kept by value
+TOP_K = 100
+EXAMPLES = 3
+
 ########################### CHECK FUNCTIONS ################################
 def is_street(elem):
     return (elem.attrib["k"] == "addr:street")
@@ -57,110 +69,136 @@ def is_name_zh(elem):
 
 ########################### AUDIT FUNCTIONS ################################
 
-def audit_name_zh(pb_names_zh, name_value):
+def audit_name_zh(pb_names_zh, name_value, elem_id=None):
     m = chinese_char_re.search(name_value)
     # if can find chinese characters
     if m:
         # check if can find letters
          m = alphabet_re.search(name_value)
          if m:
-             pb_names_zh[name_value].add(name_value)
+             pb_names_zh.add(name_value, name_value, elem_id)
     # if no chinese characters
     else:
-        pb_names_zh[name_value].add(name_value)
+        pb_names_zh.add(name_value, name_value, elem_id)
    
-def audit_name_en(pb_names_en, name_value):
+def audit_name_en(pb_names_en, name_value, elem_id=None):
     m = chinese_char_re.search(name_value)
     # if can find chinese characters
     if m:
-        pb_names_en[name_value].add(name_value)
+        pb_names_en.add(name_value, name_value, elem_id)
     else:
     # if no chinese characters, check the street type and direction
         m = street_type_re.search(name_value)
         if m:
             street_type = m.group()
             if (street_type not in expected_street) and (street_type not in expected_direction):
-                pb_names_en[street_type].add(name_value)
+                pb_names_en.add(street_type, name_value, elem_id)
 
-def audit_city(pb_cities, city_name):
+def audit_city(pb_cities, city_name, elem_id=None):
     if city_name not in expected_city:
-        pb_cities[city_name].add(city_name)
+        pb_cities.add(city_name, city_name, elem_id)
     
 
-def audit_street(pb_streets, street_name):
+def audit_street(pb_streets, street_name, elem_id=None):
     m = number_re.search(street_name)
     if m:
-        pb_streets[street_name].add(street_name)
+        pb_streets.add(street_name, street_name, elem_id)
             
-def audit_postcode(pb_postcodes, postcode_value):
+def audit_postcode(pb_postcodes, postcode_value, elem_id=None):
     m = number_re.search(postcode_value)
     if m:
         number = m.group()
         if (number != postcode_value) or (len(number) != 6):
-            pb_postcodes[postcode_value].add(postcode_value)
+            pb_postcodes.add(postcode_value, postcode_value, elem_id)
 
-def audit_housenumber(pb_housenumbers, housenumber_value):
+def audit_housenumber(pb_housenumbers, housenumber_value, elem_id=None):
     m = number_re.search(housenumber_value)
     if m:
         number = m.group()
         if (number != housenumber_value) :
-            pb_housenumbers[housenumber_value].add(housenumber_value)
+            pb_housenumbers.add(housenumber_value, housenumber_value, elem_id)
     
         
-def audit(osmfile):
-    # open osm file
-    osm_file = open(osmfile, "r")
-    # initialize dictionaries
-    pb_names_zh = defaultdict(set)
-    pb_names_en = defaultdict(set)
-    pb_cities = defaultdict(set)
-    pb_streets = defaultdict(set)
-    pb_postcodes = defaultdict(set)
-    pb_housenumbers = defaultdict(set)
+########################### AUDIT DRIVER ###################################
+
+CATEGORIES = ["names_zh", "names_en", "cities", "streets", "postcodes", "housenumbers"]
+
+def init_problems(top_k=TOP_K, examples=EXAMPLES):
+    # one bounded counter of problem values per audited field
+    problems = {}
+    for category in CATEGORIES:
+        problems[category] = SpaceSaving(top_k, examples)
+    return problems
+
+def audit_tag(problems, tag, elem_id=None):
+    # audit name:zh
+    if is_name_zh(tag):
+        audit_name_zh(problems["names_zh"], tag.attrib["v"], elem_id)
+    # audit name:en
+    if is_name_en(tag):
+        audit_name_en(problems["names_en"], tag.attrib["v"], elem_id)
+    # audit city
+    if is_city_name(tag):
+        audit_city(problems["cities"], tag.attrib["v"], elem_id)
+    # audit street name
+    if is_street(tag):
+        audit_street(problems["streets"], tag.attrib["v"], elem_id)
+    # audit postcode
+    if is_postcode(tag):
+        audit_postcode(problems["postcodes"], tag.attrib["v"], elem_id)
+    # audit housenumber
+    if is_housenumber(tag):
+        audit_housenumber(problems["housenumbers"], tag.attrib["v"], elem_id)
+
+def audit_element(problems, elem):
+    if elem.tag == "node" or elem.tag == "way" :
+        elem_id = "{0}/{1}".format(elem.tag, elem.attrib.get("id"))
+        for tag in elem.iter("tag"):
+            audit_tag(problems, tag, elem_id)
+
+def make_report(problems):
+    # occurrence count and top problem values of each category
+    report = {}
+    for category in CATEGORIES:
+        report[category] = {"count": problems[category].total,
+                            "top": problems[category].top()}
+    return report
+
+def write_report(problems, path, fmt="json"):
+    report = make_report(problems)
+    if fmt == "json":
+        with io.open(path, "w", encoding="utf8") as fo:
+            fo.write(unicode(json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)))
+    elif fmt == "csv":
+        with open(path, "wb") as fo:
+            writer = csv.writer(fo)
+            writer.writerow(["category", "value", "count", "error", "examples"])
+            for category in CATEGORIES:
+                for item in report[category]["top"]:
+                    examples = " ".join(str(example["id"]) for example in item["examples"])
+                    writer.writerow([category, item["value"].encode("utf8"),
+                                     item["count"], item["error"], examples])
+    else:
+        raise ValueError("Unknown report format: {0}".format(fmt))
+
+def audit(osmfile, backend=osm_reader.DEFAULT_BACKEND, metrics=None,
+          report_path=None, fmt="json"):
+    """
+    Audit the fields of the map, the report is written into report_path
+    (by default "<osmfile>.audit.<fmt>", fmt being "json" or "csv").
+    """
+    # initialize the problem counters
+    problems = init_problems()
     
     # iterative parsing
-    for event, elem in ET.iterparse(osm_file, events=("start",)):
-        if elem.tag == "node" or elem.tag == "way" :
-            for tag in elem.iter("tag"):
-                # audit name:zh
-                if is_name_zh(tag):
-                    audit_name_zh(pb_names_zh, tag.attrib["v"])
-                # audit name:en
-                if is_name_en(tag):
-                    audit_name_en(pb_names_en, tag.attrib["v"])
-                # audit city
-                if is_city_name(tag):
-                    audit_city(pb_cities, tag.attrib["v"])
-                # audit street name
-                if is_street(tag):
-                    audit_street(pb_streets, tag.attrib["v"])
-                # audit postcode
-                if is_postcode(tag):
-                    audit_postcode(pb_postcodes, tag.attrib["v"])
-                # audit housenumber
-                if is_housenumber(tag):
-                    audit_housenumber(pb_housenumbers, tag.attrib["v"])
-        
+    for elem in osm_reader.iter_top_level(osmfile, backend, metrics):
+        audit_element(problems, elem)
                     
-    # print results
-    print "######## Problem Names in Chinese ###########"
-    for name in pb_names_zh:
-        print name
-    print "######## Problem Names in English ###########"
-    for name in pb_names_en:
-        print name 
-    print "######## Problem Cities #####################"
-    for city in pb_cities:
-        print city 
-    print "######## Problem Streets #########"
-    for street in pb_streets:
-        print street 
-    print "######## Problem Postcodes ##################"
-    for postcode in pb_postcodes:
-        print postcode
-    print "######## Problem Housenumbers ###############"
-    for housenumber in pb_housenumbers:
-        print housenumber
+    # write results
+    if report_path is None:
+        report_path = "{0}.audit.{1}".format(osmfile, fmt)
+    write_report(problems, report_path, fmt)
+    return problems
 
 if __name__ == '__main__':
     st_types = audit("example.osm")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file benchmarks the entry points of the project on synthetic osm files
+of several sizes, generated by synthetic_osm.
+
+Each function runs in a new python process, so its peak memory (maximum
+resident set size) is measured on its own. The results are written as json,
+one record per (size, function):
+
+{"function": "data_shanghai.process_map", "elements": 100000, "bytes": 11834527,
+ "seconds": 4.2, "elements_per_second": 23809.5, "peak_rss_kb": 10804}
+
+Usage: python benchmark.py [output.json] [size ...]
+"""
+
+import codecs
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import shutil
+
+import synthetic_osm
+
+SIZES = [10000, 100000, 1000000]
+
+FUNCTIONS = ["mapparser.count_tags",
+             "tags.process_map",
+             "users.process_map",
+             "audit_shanghai.audit",
+             "data_shanghai.process_map"]
+
+def run_function(name, filename):
+    # Run in the child process, the results go to stdout as json
+    module_name, function_name = name.split(".")
+    module = __import__(module_name)
+    function = getattr(module, function_name)
+    # audit prints its results, they are not part of the benchmark
+    stdout = sys.stdout
+    sys.stdout = codecs.getwriter("utf8")(open(os.devnull, "w"))
+    start = time.time()
+    try:
+        function(filename)
+    finally:
+        seconds = time.time() - start
+        sys.stdout.close()
+        sys.stdout = stdout
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print json.dumps({"seconds": seconds, "peak_rss_kb": peak})
+
+def measure(name, filename):
+    output = subprocess.check_output([sys.executable, __file__, "--run", name, filename])
+    return json.loads(output.splitlines()[-1])
+
+def benchmark(sizes=SIZES, functions=FUNCTIONS):
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            filename = os.path.join(directory, "synthetic_{0}.osm".format(size))
+            elements = synthetic_osm.generate(filename, size)
+            for name in functions:
+                result = measure(name, filename)
+                result["function"] = name
+                result["elements"] = elements
+                result["bytes"] = os.path.getsize(filename)
+                result["elements_per_second"] = elements / max(result["seconds"], 1e-9)
+                results.append(result)
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        run_function(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+    output = sys.argv[1] if len(sys.argv) > 1 else "benchmark_results.json"
+    sizes = [int(size) for size in sys.argv[2:]] or SIZES
+    results = benchmark(sizes)
+    with open(output, "w") as fo:
+        json.dump(results, fo, indent=2, sort_keys=True)
+    for result in results:
+        print "{0:28s} {1:9d} elements {2:8.2f} s {3:10.0f} elements/s {4:8d} KB".format(
+            result["function"], result["elements"], result["seconds"],
+            result["elements_per_second"], result["peak_rss_kb"])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file compares the speed of the osm_reader backends on the same input.
+
+For each available backend, the whole file is read several times and
+the best number of elements per second is printed. "events" is
+osm_reader.iter_events, which yields tuples instead of elements, the
+elements it counts are the "start", "tag" and "nd" events.
+
+A .pbf file is decoded by osm_pbf whatever the backend, so only the
+default one is timed. On the 100000 elements of synthetic_osm (247423
+elements with the tags and nd), the best of 3 runs:
+
+    syn.osm      18.5 MB  cache   380000-390000 elements/s
+                          etree   240000-290000 elements/s
+                          events  185000-190000 elements/s
+                          expat   170000-220000 elements/s
+    syn.osm.pbf   1.9 MB  osm_pbf 100000-115000 elements/s
+
+Yielding tuples saves the Element objects of the "expat" backend, but
+the C parser of "etree" stays faster than any handler written in python,
+so "events" isn't used by the other files.
+The pure python decoder of osm_pbf is about 2 times slower than the expat
+backend: a PBF extract is smaller to download and store, but converting it
+to xml (osmium cat) is faster if it is processed several times.
+
+Usage: python benchmark_readers.py [file.osm] [repeat]
+"""
+
+import sys
+import time
+
+import osm_reader
+
+def time_backend(filename, backend):
+    count = 0
+    start = time.time()
+    if backend == "events":
+        for event in osm_reader.iter_events(filename):
+            if event[0] != "end":
+                count += 1
+    else:
+        for elem in osm_reader.iter_elements(filename, backend):
+            if elem.tag != "osm":
+                count += 1
+    return count, time.time() - start
+
+def benchmark(filename, repeat=3):
+    results = {}
+    if osm_reader.is_pbf(filename):
+        backends = [osm_reader.DEFAULT_BACKEND]
+    else:
+        backends = osm_reader.available_backends() + ["events"]
+    for backend in backends:
+        best = None
+        for _ in range(repeat):
+            count, seconds = time_backend(filename, backend)
+            if best is None or seconds < best:
+                best = seconds
+        results[backend] = {"elements": count,
+                            "seconds": best,
+                            "elements_per_second": count / max(best, 1e-9)}
+    return results
+
+
+if __name__ == "__main__":
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'example.osm'
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    results = benchmark(filename, repeat)
+    for backend in sorted(results, key=lambda b: -results[b]["elements_per_second"]):
+        result = results[backend]
+        print "{0:6s} {1:10d} elements {2:8.3f} s {3:12.0f} elements/s".format(
+            backend, result["elements"], result["seconds"],
+            result["elements_per_second"])
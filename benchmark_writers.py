@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file compares the output formats of writers on the same input.
+
+The documents of the map are shaped once, then for each available format
+they are written and read back, and the time of both and the size of
+the output file are printed.
+
+Usage: python benchmark_writers.py [file.osm]
+"""
+
+import os
+import sys
+import time
+
+import data_shanghai
+import writers
+
+def benchmark(filename):
+    docs = list(data_shanghai.iter_shaped(filename))
+    results = {}
+    for fmt in writers.available_formats():
+        start = time.time()
+        with writers.open_writer(filename, fmt) as fo:
+            for doc in docs:
+                fo.write(doc)
+        write_seconds = time.time() - start
+        path = writers.output_path(filename, fmt)
+        start = time.time()
+        count = 0
+        for doc in writers.iter_documents(path, fmt):
+            count += 1
+        read_seconds = time.time() - start
+        results[fmt] = {"documents": count,
+                        "bytes": os.path.getsize(path),
+                        "write_seconds": write_seconds,
+                        "read_seconds": read_seconds}
+    return results
+
+
+if __name__ == "__main__":
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'example.osm'
+    results = benchmark(filename)
+    for fmt in sorted(results, key=lambda f: results[f]["bytes"]):
+        result = results[fmt]
+        print "{0:9s} {1:12d} bytes  write {2:8.3f} s  read {3:8.3f} s".format(
+            fmt, result["bytes"], result["write_seconds"], result["read_seconds"])
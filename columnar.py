@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file exports the shaped nodes and ways as columns, one .npy file by
+attribute, for the analyses which need a few attributes of all the
+elements (edit density by grid cell, timestamps by user...).
+
+The columns are written into the directory "<file_in>.columns":
+- nodes_id (int64), nodes_lat and nodes_lon (float64, from "pos"),
+  nodes_uid (int32), nodes_timestamp (int64, seconds since 1970),
+  nodes_version and nodes_changeset (int32),
+  nodes_amenity and nodes_source (int32 codes, -1 if there is no value)
+- the same columns for the ways, without lat and lon, and their node
+  references as a CSR pair: ways_refs_values (int64) has the references
+  of all the ways one after another, those of way i being
+  values[offsets[i]:offsets[i + 1]] with ways_refs_offsets (int64)
+- dictionaries.json, the values of the amenity and source codes
+
+The columns are written while the documents are shaped, with a constant
+memory, in the .npy format, without needing numpy. With numpy installed,
+load() memory-maps them, so the analyses are vectorized numpy operations
+which only read the needed columns from the disk, for example
+grid_counts() and user_timestamps(). to_npz bundles the columns into one
+.npz file.
+"""
+
+from array import array
+import io
+import json
+import os
+import struct
+import sys
+import zipfile
+
+import data_shanghai
+import osm_reader
+from compact_docs import parse_timestamp
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Number of values kept in memory by a column before being written
+BUFFER_SIZE = 64 * 1024
+# Size of the .npy header, so it can be written again with the final shape
+HEADER_SIZE = 128
+MISSING = -1
+
+ENDIAN = "<" if sys.byteorder == "little" else ">"
+# Type codes of the arrays of 64 bits (on 64 bits unix) and 32 bits integers
+INT64 = "l"
+INT32 = "i"
+
+def dtype(typecode):
+    kind = "f" if typecode == "d" else "i"
+    return "{0}{1}{2}".format(ENDIAN, kind, array(typecode).itemsize)
+
+
+class NpyColumn(object):
+    """A one dimension .npy file written by parts"""
+
+    def __init__(self, path, typecode):
+        self.path = path
+        self.typecode = typecode
+        self.buffer = array(typecode)
+        self.length = 0
+        self.f = io.open(path, "wb")
+        self.write_header()
+
+    def write_header(self):
+        header = "{{'descr': '{0}', 'fortran_order': False, 'shape': ({1},), }}".format(
+            dtype(self.typecode), self.length)
+        # magic, version 1.0, length of the header
+        prefix = b"\x93NUMPY\x01\x00" + struct.pack("<H", HEADER_SIZE - 10)
+        self.f.write(prefix + header.ljust(HEADER_SIZE - len(prefix) - 1) + "\n")
+
+    def append(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def extend(self, values):
+        self.buffer.extend(values)
+        if len(self.buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.f.write(self.buffer.tostring())
+        self.length += len(self.buffer)
+        self.buffer = array(self.typecode)
+
+    def close(self):
+        self.flush()
+        self.f.seek(0)
+        self.write_header()
+        self.f.close()
+
+
+class Dictionary(object):
+    """Integer codes of the values of a field"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        if value is None:
+            return MISSING
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+# Columns of each type: name and type code
+COLUMNS = {"node": [("id", INT64), ("lat", "d"), ("lon", "d"), ("uid", INT32),
+                    ("timestamp", INT64), ("version", INT32), ("changeset", INT32),
+                    ("amenity", INT32), ("source", INT32)],
+           "way": [("id", INT64), ("uid", INT32), ("timestamp", INT64),
+                   ("version", INT32), ("changeset", INT32),
+                   ("amenity", INT32), ("source", INT32)]}
+ENCODED_FIELDS = ["amenity", "source"]
+
+def columns_dir(file_in):
+    return "{0}.columns".format(file_in)
+
+def int_or_missing(value):
+    if value is None:
+        return MISSING
+    return int(value)
+
+def row(doc, dictionaries):
+    # Values of the columns of one document
+    created = doc.get("created", {})
+    timestamp = created.get("timestamp")
+    if timestamp is not None:
+        timestamp = parse_timestamp(timestamp)
+    values = {"id": int(doc["id"]),
+              "uid": int_or_missing(created.get("uid")),
+              "timestamp": int_or_missing(timestamp),
+              "version": int_or_missing(created.get("version")),
+              "changeset": int_or_missing(created.get("changeset"))}
+    if "pos" in doc:
+        values["lat"], values["lon"] = doc["pos"]
+    for field in ENCODED_FIELDS:
+        values[field] = dictionaries[field].code(doc.get(field))
+    return values
+
+def export_documents(docs, directory):
+    """Write the columns of the shaped documents, return the number of rows by type"""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    dictionaries = dict((field, Dictionary()) for field in ENCODED_FIELDS)
+    columns = {}
+    for doc_type in COLUMNS:
+        for name, typecode in COLUMNS[doc_type]:
+            columns[doc_type, name] = NpyColumn(
+                os.path.join(directory, "{0}s_{1}.npy".format(doc_type, name)), typecode)
+    offsets = NpyColumn(os.path.join(directory, "ways_refs_offsets.npy"), INT64)
+    refs = NpyColumn(os.path.join(directory, "ways_refs_values.npy"), INT64)
+    offsets.append(0)
+    count = {"node": 0, "way": 0}
+    try:
+        for doc in docs:
+            doc_type = doc["type"]
+            values = row(doc, dictionaries)
+            for name, typecode in COLUMNS[doc_type]:
+                columns[doc_type, name].append(values[name])
+            if doc_type == "way":
+                refs.extend(int(ref) for ref in doc["node_refs"])
+                offsets.append(refs.length + len(refs.buffer))
+            count[doc_type] += 1
+    finally:
+        for column in columns.values() + [offsets, refs]:
+            column.close()
+    with io.open(os.path.join(directory, "dictionaries.json"), "w", encoding="utf8") as fo:
+        fo.write(unicode(json.dumps(dict((field, dictionaries[field].values)
+                                         for field in ENCODED_FIELDS),
+                                    ensure_ascii=False, indent=2)))
+    return count
+
+def export(file_in, directory=None, backend=osm_reader.DEFAULT_BACKEND, metrics=None):
+    """Shape the map and write its columns into "<file_in>.columns" """
+    if directory is None:
+        directory = columns_dir(file_in)
+    return export_documents(data_shanghai.iter_shaped(file_in, backend, metrics), directory)
+
+def to_npz(directory, path):
+    # A .npz file is a zip of .npy files
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as z:
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".npy"):
+                z.write(os.path.join(directory, name), name)
+
+
+############################# ANALYSES ####################################
+
+def load(directory, mmap=True):
+    """The columns as numpy arrays, memory-mapped by default"""
+    if numpy is None:
+        raise ImportError("numpy is needed to load the columns")
+    columns = {}
+    for name in os.listdir(directory):
+        if name.endswith(".npy"):
+            columns[name[:-4]] = numpy.load(os.path.join(directory, name),
+                                            mmap_mode="r" if mmap else None)
+    with io.open(os.path.join(directory, "dictionaries.json"), "r", encoding="utf8") as f:
+        columns["dictionaries"] = json.load(f)
+    return columns
+
+def way_refs(columns, i):
+    # Node references of the way i
+    offsets = columns["ways_refs_offsets"]
+    return columns["ways_refs_values"][offsets[i]:offsets[i + 1]]
+
+def grid_counts(columns, cell_size=0.01):
+    """Number of nodes by grid cell, as ((lat cell, lon cell), count) arrays"""
+    cells = numpy.column_stack((numpy.floor(columns["nodes_lat"] / cell_size),
+                                numpy.floor(columns["nodes_lon"] / cell_size))).astype(numpy.int64)
+    return numpy.unique(cells, axis=0, return_counts=True)
+
+def user_timestamps(columns, uid, bins=12):
+    """Histogram of the timestamps of the nodes of a user"""
+    timestamps = columns["nodes_timestamp"][columns["nodes_uid"] == uid]
+    return numpy.histogram(timestamps, bins=bins)
+
+
+if __name__ == "__main__":
+    print export('example.osm')
+    if numpy is not None:
+        columns = load(columns_dir('example.osm'))
+        counts = grid_counts(columns)
+        print len(counts[1]), "cells"
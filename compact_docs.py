@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file provides a compact form of the shaped documents, for the programs
+which keep many of them in memory (process_map with keep_data, batches of
+documents given to other functions...).
+
+The same keys and values are found in millions of documents ("created_by",
+"source" = "PGS", the user names, the uids...), and each small dict, list
+or string of a document has its own python object overhead. A CompactDoc
+is a slotted object keeping:
+- layout  : the keys of the document and of its "created", "address" and
+            "name" dicts, with the kind of each value. The documents with
+            the same keys share the same layout.
+- numbers : an array of integers with the ids, the versions, the
+            changesets, the uids, the timestamps (as seconds) and the node
+            references, all the values which are integers written as strings
+- floats  : an array of doubles with the position
+- values  : a tuple of the other values, the repeated ones (users, types,
+            tag values...) being kept once in a StringPool
+
+to_dict() gives back the same dict as shape_element. It is an OrderedDict
+keeping the keys in the order of the original dict, so the writers, which
+call it when they encode a document, produce the same output.
+"""
+
+from array import array
+from collections import OrderedDict
+import calendar
+import re
+import sys
+import time
+
+# The longer values are rarely repeated (descriptions, notes...)
+MAX_POOLED_LENGTH = 64
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+timestamp_re = re.compile(r'^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ$')
+# Only ASCII digits, \d and isdigit also match the other unicode digits
+int_re = re.compile(r'^(0|[1-9][0-9]*)$')
+
+# Largest integer of the numbers arrays: "l" is only 32 bits on Windows, and
+# the arrays of python 2 have no "q", so the bigger integers stay strings
+MAX_INT = 2 ** (8 * array("l").itemsize - 1) - 1
+
+# Kinds of the values in a layout, the kind of a dict being its layout
+INT = "i"
+TIMESTAMP = "t"
+FLOATS = "f"
+INTS = "r"
+OTHER = "s"
+
+
+class StringPool(object):
+    """Keep one copy of each repeated string or layout"""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, value):
+        if isinstance(value, basestring) and len(value) > MAX_POOLED_LENGTH:
+            return value
+        return self.values.setdefault(value, value)
+
+    def size(self):
+        return sum(sys.getsizeof(value) for value in self.values)
+
+
+def is_int(value):
+    # Integer written as a string, which is written back the same way
+    return (isinstance(value, basestring) and len(value) < 19
+            and int_re.match(value) is not None and int(value) <= MAX_INT)
+
+def parse_timestamp(value):
+    # Seconds of an osm timestamp, or None if it can't be written back the same
+    if not isinstance(value, basestring) or not timestamp_re.match(value):
+        return None
+    try:
+        seconds = calendar.timegm(time.strptime(value, TIMESTAMP_FORMAT))
+    except ValueError:
+        return None
+    if format_timestamp(seconds) != value:
+        return None
+    return seconds
+
+def format_timestamp(seconds):
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds))
+
+
+class CompactDoc(object):
+    __slots__ = ("layout", "numbers", "floats", "values")
+
+    def __init__(self, doc, pool):
+        self.numbers = array("l")
+        self.floats = None
+        values = []
+        self.layout = self.pack(doc, pool, values)
+        self.values = tuple(values)
+
+    def pack(self, d, pool, values):
+        # Move the values of d into the arrays and values, return its layout
+        layout = []
+        for key, value in d.items():
+            if isinstance(value, dict):
+                kind = self.pack(value, pool, values)
+            elif is_int(value):
+                kind = INT
+                self.numbers.append(int(value))
+            elif (isinstance(value, list) and value
+                  and all(isinstance(v, float) for v in value)):
+                kind = FLOATS
+                if self.floats is None:
+                    self.floats = array("d")
+                self.numbers.append(len(value))
+                self.floats.extend(value)
+            elif (isinstance(value, list) and value
+                  and all(is_int(v) for v in value)):
+                kind = INTS
+                self.numbers.append(len(value))
+                self.numbers.extend(int(v) for v in value)
+            else:
+                seconds = parse_timestamp(value)
+                if seconds is not None and seconds <= MAX_INT:
+                    kind = TIMESTAMP
+                    self.numbers.append(seconds)
+                else:
+                    kind = OTHER
+                    if not isinstance(value, list):
+                        value = pool.get(value)
+                    values.append(value)
+            layout.append((pool.get(key), kind))
+        return pool.get(tuple(layout))
+
+    def unpack(self, layout, numbers, floats, values):
+        d = OrderedDict()
+        for key, kind in layout:
+            if kind == INT:
+                d[key] = str(next(numbers))
+            elif kind == TIMESTAMP:
+                d[key] = format_timestamp(next(numbers))
+            elif kind == FLOATS:
+                d[key] = [next(floats) for i in xrange(next(numbers))]
+            elif kind == INTS:
+                d[key] = [str(next(numbers)) for i in xrange(next(numbers))]
+            elif kind == OTHER:
+                d[key] = next(values)
+            else:
+                d[key] = self.unpack(kind, numbers, floats, values)
+        return d
+
+    def to_dict(self):
+        return self.unpack(self.layout, iter(self.numbers), iter(self.floats or ()),
+                           iter(self.values))
+
+    def __contains__(self, key):
+        for k, kind in self.layout:
+            if k == key:
+                return True
+        return False
+
+    def __getitem__(self, key):
+        return self.to_dict()[key]
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def size(self):
+        # Bytes of the objects owned by this document, the pooled values
+        # are counted by StringPool.size
+        size = sys.getsizeof(self) + sys.getsizeof(self.numbers) + sys.getsizeof(self.values)
+        if self.floats is not None:
+            size += sys.getsizeof(self.floats)
+        for value in self.values:
+            if isinstance(value, list) or (isinstance(value, basestring)
+                                           and len(value) > MAX_POOLED_LENGTH):
+                size += sys.getsizeof(value)
+        return size
+
+
+def compact(docs, pool=None):
+    """Yield the compact form of the documents"""
+    if pool is None:
+        pool = StringPool()
+    for doc in docs:
+        yield CompactDoc(doc, pool)
+
+def dict_size(value, seen=None):
+    # Bytes of a shaped document with all its keys and values, the objects
+    # shared with other documents are only counted once in seen
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += dict_size(k, seen) + dict_size(v, seen)
+    elif isinstance(value, list):
+        for v in value:
+            size += dict_size(v, seen)
+    return size
+
+
+if __name__ == "__main__":
+    import data_shanghai
+    pool = StringPool()
+    seen = set()
+    docs = list(data_shanghai.iter_shaped('example.osm'))
+    compacts = list(compact(docs, pool))
+    print "dicts", sum(dict_size(doc, seen) for doc in docs), "bytes"
+    print "compact", sum(doc.size() for doc in compacts) + pool.size(), "bytes"
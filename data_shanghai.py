@@ -69,54 +69,79 @@ that look like this:
     if the value is of format numbers;numbers or numbers～numbers, set it to numbers-numbers
     if the value is of format numbersChineseCharacters, set it to just numbers
     for other formats, ignore the tag
+- for a bank (amenity=bank): if a bank alias is found in its "brand" tag, or
+  else in its name, set "brand" to the canonical bank name, the name is kept
+  with its branch (工商银行(徐汇支行), ICBC ATM => "brand": "中国工商银行")
+
+The expected cities, street types, directions and bank names, with their
+aliases, are in the rules file canonical_rules.json. They are all found
+in one scan of each value by the Aho-Corasick automaton of matcher.
 
 """
 
-import xml.etree.ElementTree as ET
 import pprint
 import re
 import codecs
 import json
 import string
 import io
+import multiprocessing
+import time
+import os
+import collections
+import sys
+
+import osm_chunks
+import osm_reader
+import node_index
+import writers
+from rollups import StatsRollup
+import matcher
+import result_cache
+import compact_docs
+import pipeline
+import osm_query
+from writers import to_json_line
+from memo import memoize
+from metrics import Metrics
 
 lower = re.compile(r'^([a-z]|_)*$')
 lower_colon = re.compile(r'^([a-z]|_)*:([a-z]|_)*$')
 problem_char_re = re.compile(r'[=\+/&<>;\'"\?%#$@\,\. \t\r\n]')
 chinese_char_re = re.compile(ur'[\u4e00-\u9fff]+')
-street_type_re = re.compile(r'\S+[\.?|\D]$', re.IGNORECASE)
 number_re = re.compile(r'\d+\-*\d*')
 number_to_update_re = re.compile(r'\d+[;|～]\d+')
 number_chinese_re = re.compile(ur'\d+[\u4e00-\u9fff]+')
 
-mapping = { "St": "Street",
-            "St.": "Street",
-            "Ave" : "Avenue",
-            "Ave." : "Avenue",
-            "Rd" : "Road",
-            "Rd." : "Road",
-            "road" : "Road",
-            "Lu" : "Road",
-            "Hwy." : "Highway",
-            "highway" : "Highway",
-            "(N.)" : "North",
-            "(S.)" : "South",
-            "(E.)" : "East",
-            "(W.)" : "West",
-            "(N)" : "North",
-            "(S)" : "South",
-            "(E)" : "East",
-            "(W)" : "West"}
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "canonical_rules.json")
+rules = matcher.load_rules(RULES_FILE)
+
+# Street types and directions to update, e.g. "Rd." => "Road", "(N)" => "North"
+mapping = dict(rules.aliases("street_type"))
+mapping.update(rules.aliases("direction"))
 
 expected_street = ["Street", "Avenue", "Boulevard", "Drive", "Court",
                    "Place", "Square", "Lane", "Road", "Trail",
                    "Parkway", "Commons", "Highway"]
-expected_direction = ["North", "South", "East", "West"]
-expected_city = ["上海".decode('utf-8'), "Shanghai"]
+expected_direction = rules.canonical_values("direction")
+expected_city = rules.canonical_values("city")
+
+STREET_CATEGORIES = ["street_type", "direction"]
 
 CREATED = [ "version", "changeset", "timestamp", "user", "uid"]
 
-def shape_element(element):
+# Kinds of keys whose tags are ignored, see classify_key
+IGNORED_KINDS = ["problem_chars", "too_many_colons"]
+
+# Maximum number of distinct keys and (key, value) cleaning results cached
+KEY_CACHE_SIZE = 4096
+VALUE_CACHE_SIZE = 100000
+# Number of elements in each batch of the pipeline
+PIPELINE_BATCH_SIZE = 1000
+# Size of the input read between two checkpoints
+CHECKPOINT_SIZE = 4 * 1024 * 1024
+
+def shape_element(element, metrics=None):
 
     node = {}
     
@@ -136,7 +161,7 @@ def shape_element(element):
                 node["created"][attr] = element.attrib[attr]
 
         # Set address & name values
-        process_address_and_name(node, element)
+        process_address_and_name(node, element, metrics)
 
         if element.tag == "node":
             # Set tag type
@@ -153,33 +178,38 @@ def shape_element(element):
     else:
         return None
 
-def process_address_and_name(node, element):
+def process_address_and_name(node, element, metrics=None):
 
+    if metrics is not None:
+        start = time.time()
     address = {}
     name = {}
     
     for tag in element.iter("tag"):
         k = tag.attrib["k"]
         v = tag.attrib["v"]
-        if re.search(problem_char_re, k):
+        kind, key = classify_key(k)
+        if kind in IGNORED_KINDS:
+            if metrics is not None:
+                metrics.drop(kind)
             continue
-        if len(k.split(":")) > 2:
-            continue
-        if k.startswith("addr:"):
-            key = k[5:]
+        if kind == "address":
             # Process address items
-            v = process_address(key, v)
+            v = clean_value(kind, key, v)
             # If not None, set the value
             if v:
                 address[key] = v
-        elif k.startswith("name:"):
-            key = k[5:]
+            elif metrics is not None:
+                metrics.drop("invalid_" + k)
+        elif kind == "name":
             # Process name items
-            v = process_name(key, v)
+            v = clean_value(kind, key, v)
             # If not None, set the value
             if v:
                 name[key] = v
-        elif k == "name":
+            elif metrics is not None:
+                metrics.drop("invalid_" + k)
+        elif kind == "main":
             name["main"] = v
         else:
             node[k] = v
@@ -187,28 +217,85 @@ def process_address_and_name(node, element):
     # Assign address and name values 
     if len(address) != 0:
         node["address"] = address
+    # The canonical name of the banks, kept apart from their names
+    if node.get("amenity") == "bank":
+        value = node.get("brand", name.get("main"))
+        if value is not None:
+            brand = canonical_brand(value)
+            if brand is not None:
+                node["brand"] = brand
     if len(name) != 0:
         node["name"] = name
+    if metrics is not None:
+        metrics.add_time("clean", time.time() - start)
+
+@memoize(KEY_CACHE_SIZE)
+def classify_key(k):
+    """
+    Return the kind of the key and the key to use in the document:
+    ("address", key), ("name", key), ("main", "main"), ("other", k),
+    or for the ignored keys ("problem_chars", None), ("too_many_colons", None)
+    """
+    if re.search(problem_char_re, k):
+        return "problem_chars", None
+    if len(k.split(":")) > 2:
+        return "too_many_colons", None
+    if k.startswith("addr:"):
+        return "address", k[5:]
+    if k.startswith("name:"):
+        return "name", k[5:]
+    if k == "name":
+        return "main", "main"
+    return "other", k
+
+@memoize(VALUE_CACHE_SIZE)
+def clean_value(kind, key, value):
+    # Cached result of process_address or process_name
+    if kind == "address":
+        return process_address(key, value)
+    return process_name(key, value)
+
+@memoize(VALUE_CACHE_SIZE)
+def canonical_brand(value):
+    # The first bank name found in the value, or None
+    brands = rules.find(value, ["brand"])
+    if brands:
+        return brands[0][2]
+    return None
+
+def rules_hash(*options):
+    # Hash of the cleaning rules: the rules file, the expected values and
+    # the code of the modules making the output, with the options of the run
+    with open(RULES_FILE, "rb") as f:
+        rules_text = f.read()
+    code = []
+    for path in [__file__, matcher.__file__, writers.__file__, node_index.__file__]:
+        with open(os.path.splitext(os.path.abspath(path))[0] + ".py", "rb") as f:
+            code.append(f.read())
+    return result_cache.hash_values(rules_text, expected_street, expected_direction,
+                                    expected_city, code, options)
+
+def cache_stats():
+    # Hits, misses and hit rate of the cleaning caches
+    return {"keys": classify_key.cache.stats(),
+            "values": clean_value.cache.stats(),
+            "brands": canonical_brand.cache.stats()}
 
 def process_address(key, value):
 
     ######## Treat city #####################
     if key == "city":
         if value not in expected_city:
-            is_updated = False
-            # Loop on each expected city name
+            # Find the expected city names which are one part of the value
+            found = set(city[2] for city in rules.find(value, ["city"]))
+            # Set the value equal to expected city name, the first one of
+            # expected_city if there are several, or None if value doesn't
+            # have relation with the expected city names
+            value = None
             for city in expected_city:
-                # If one part of the value is the expected city name
-                if city in value:
-                    # Set the value equal to expected city name
-                    #print "City before : " + value
+                if city in found:
                     value = city
-                    is_updated = True
-                    #print "City after : " + value
-            # If value doesn't have relation with the expected city name
-            # return None
-            if not is_updated:
-                value = None
+                    break
 
     ####### Treat street type ################
     if key == "street":
@@ -228,13 +315,8 @@ def process_address(key, value):
                 value = value.split(number)[1].strip()
                 #print "English street after : " + value
 
-        # Treat the street type     
-        m = re.search(street_type_re, value)
-        if m:
-            street_type = m.group()
-            # Update the street type or direction
-            if street_type in mapping:
-                value = value.replace(street_type, mapping[street_type])
+        # Update the street type or direction, the last word of the value
+        value = rules.rewrite(value, STREET_CATEGORIES, last_token=True)
             
     ####### Treat postcode ###################
     if key == "postcode":
@@ -292,14 +374,8 @@ def process_name(key, value):
         if not re.search(chinese_char_re, value):
             value = None
     elif key == "en":
-        m = re.search(street_type_re, value)
-        if m:
-            street_type = m.group()
-            # Update the street type or direction
-            if street_type in mapping:
-                #print "Name english before : " + value
-                value = value.replace(street_type, mapping[street_type])
-                #print "Name english after : " + value
+        # Update the street type or direction, the last word of the value
+        value = rules.rewrite(value, STREET_CATEGORIES, last_token=True)
     # For other types of language, no treatment
     return value
 
@@ -309,23 +385,396 @@ def process_refs(element):
         refs.append(tag.attrib["ref"])
     return refs
     
-def process_map(file_in):
-    # Define output file
-    file_out = "{0}.json".format(file_in)
+def iter_shaped(file_in, backend=osm_reader.DEFAULT_BACKEND, metrics=None):
+    """
+    Yield the shaped documents one at a time.
+
+    Each top level element ("node", "way", "relation") is cleared from the
+    tree as soon as it has been shaped, so the peak memory is bounded by the
+    biggest single element of the file (plus the parser buffers) and does
+    not grow with the size of the file.
+    """
+    # Iterative parsing, the reader frees each element once handled
+    for element in osm_reader.iter_top_level(file_in, backend, metrics):
+        # Adapt the element to model
+        if metrics is None:
+            el = shape_element(element)
+        else:
+            start = time.time()
+            el = shape_element(element, metrics)
+            metrics.add_time("shape", time.time() - start)
+        if el:
+            yield el
+
+def process_map(file_in, keep_data=False, backend=osm_reader.DEFAULT_BACKEND,
+                geometry=False, fmt="json", metrics=None, stats=False,
+                translator=None, cache=False, compact=False, index=False,
+                pipelined=False, processes=0):
+    """
+    Write the shaped documents into "<file_in>.json", one per line.
+
+    The documents are streamed from iter_shaped, so the memory stays bounded.
+    Only if keep_data is True, the documents are also kept and returned
+    as a list, otherwise the number of written documents is returned.
+    If geometry is True, the node positions and the bounding box are added
+    to the ways, using a node index written into "<file_in>.nodes.idx".
+    fmt is one of the formats of writers, the output file is then
+    "<file_in>.<fmt>".
+    With metrics (a metrics.Metrics), the time of each stage is recorded.
+    If stats is True, the overview statistics of the documents are written
+    into "<file_in>.stats.json" (see rollups).
+    With translator (a translation.TranslationStage), the mixed Chinese-English
+    names are checked while the documents are written, and the accepted
+    splits are written into "<file_in>.name_splits.json". The failed and
+    unfinished batches are added to the metrics and printed, if all the
+    batches failed an IOError is raised instead of writing the splits.
+    If cache is True, the elements are read with the "cache" backend and,
+    unless the documents are needed (keep_data, stats or translator), the
+    output of a previous run with the same file and rules is reused.
+    If compact is True, the kept documents are compact_docs.CompactDoc,
+    which take several times less memory than the dicts.
+    If index is True and fmt is "json", the indexes of osm_query are built
+    while the documents are written, into "<file_in>.json.idx".
+    If pipelined is True, the documents are shaped and written by
+    process_map_pipelined (with processes), which only supports backend, fmt,
+    metrics and cache: the options needing the documents in this process
+    (keep_data, geometry, stats, translator, compact, index) and the
+    profilers of metrics raise ValueError.
+
+    The other variants are called directly and support fewer options:
+    process_map_parallel (backend, metrics) and process_map_checkpointed
+    (backend), both writing json.
+    """
+    if pipelined:
+        unsupported = [name for name, value in [
+            ("keep_data", keep_data), ("geometry", geometry), ("stats", stats),
+            ("translator", translator), ("compact", compact), ("index", index),
+            ("metrics.profile", metrics is not None and metrics.profile)] if value]
+        if unsupported:
+            raise ValueError("Options not supported by the pipelined processing: {0}".format(
+                ", ".join(unsupported)))
+    cached = None
+    if cache:
+        backend = "cache"
+        if not keep_data and not stats and translator is None:
+            cached = result_cache.result_path(file_in, rules_hash(geometry), fmt)
+            file_out = writers.output_path(file_in, fmt)
+            count = result_cache.fetch(cached, file_out)
+            if count is not None:
+                if index and fmt == "json":
+                    osm_query.build(file_out)
+                return count
+    if pipelined:
+        count = process_map_pipelined(file_in, fmt, backend, metrics, processes=processes)
+        if cached is not None:
+            result_cache.store(writers.output_path(file_in, fmt), cached, count)
+        return count
     data = []
-    # Iterative parsing
-    with io.open(file_out, "w", encoding="utf8") as fo:
-        for _, element in ET.iterparse(file_in):
-            # Adapt the element to model
+    pool = None
+    if keep_data and compact:
+        pool = compact_docs.StringPool()
+    count = 0
+    rollup = None
+    if stats:
+        rollup = StatsRollup()
+    builder = None
+    if index and fmt == "json":
+        builder = osm_query.IndexBuilder(writers.output_path(file_in, fmt))
+    docs = iter_shaped(file_in, backend, metrics)
+    if geometry:
+        docs = node_index.iter_with_geometry(docs, "{0}.nodes.idx".format(file_in))
+    with writers.open_writer(file_in, fmt) as fo:
+        for el in docs:
+            if keep_data:
+                if compact:
+                    data.append(compact_docs.CompactDoc(el, pool))
+                else:
+                    data.append(el)
+            if rollup is not None:
+                rollup.add(el)
+            if translator is not None:
+                translator.submit(el)
+            if builder is not None:
+                builder.add(el, fo.position)
+            if metrics is None:
+                fo.write(el)
+            else:
+                start = time.time()
+                fo.write(el)
+                metrics.add_time("serialize", time.time() - start)
+            count += 1
+    if builder is not None:
+        builder.write()
+    if cached is not None:
+        result_cache.store(writers.output_path(file_in, fmt), cached, count)
+    if rollup is not None:
+        rollup.write("{0}.stats.json".format(file_in))
+    if translator is not None:
+        write_splits(translator, file_in, metrics)
+    if keep_data:
+        return data
+    return count
+
+def write_splits(translator, file_in, metrics=None):
+    splits = translator.close()
+    stats = translator.stats()
+    if metrics is not None:
+        metrics.translation = stats
+    if stats["batches"] and stats["errors"] == stats["batches"]:
+        raise IOError("All the {0} translation batches failed".format(stats["batches"]))
+    if stats["errors"] or stats["unfinished"]:
+        sys.stderr.write("{0} of {1} translation batches failed, {2} workers unfinished, "
+                         "their names are sent again by the next run\n".format(
+                             stats["errors"], stats["batches"], stats["unfinished"]))
+    translator.write(splits, "{0}.name_splits.json".format(file_in))
+
+def read_stage(file_in, backend, metrics, parsed):
+    # Parse the file into batches of element records, the elements are
+    # freed by the reader so they are copied as records
+    batch = []
+    for element in osm_reader.iter_top_level(file_in, backend, metrics):
+        batch.append(osm_reader.to_record(element))
+        if len(batch) == PIPELINE_BATCH_SIZE:
+            parsed.put(batch)
+            batch = []
+    if batch:
+        parsed.put(batch)
+
+def shape_batch(args):
+    # Shape and encode a batch of element records into one block of bytes,
+    # can run in a worker process
+    batch, fmt = args
+    encode = writers.ENCODERS[fmt]
+    docs = []
+    for record in batch:
+        el = shape_element(osm_reader.from_record(record))
+        if el:
+            docs.append(encode(el))
+    return b"".join(docs), len(docs)
+
+def shape_stage(parsed, fmt, pool, window, encoded):
+    if pool is None:
+        for batch in parsed:
+            encoded.put(shape_batch((batch, fmt)))
+        return
+    # Keep a few batches in the workers, in the order of the file
+    pending = collections.deque()
+    for batch in parsed:
+        pending.append(pool.apply_async(shape_batch, ((batch, fmt),)))
+        if len(pending) >= window:
+            encoded.put(pending.popleft().get())
+    while pending:
+        encoded.put(pending.popleft().get())
+
+def write_stage(encoded, fo):
+    for data, count in encoded:
+        fo.write_encoded(data, count)
+
+def process_map_pipelined(file_in, fmt="json", backend=osm_reader.DEFAULT_BACKEND,
+                          metrics=None, queue_size=pipeline.QUEUE_SIZE, processes=0):
+    """
+    Same as process_map, with the parsing, the shaping and the writing done
+    by three threads linked by bounded queues (see pipeline). It is what
+    process_map runs with pipelined=True, which also handles the cache, the
+    other options of process_map aren't supported.
+
+    At most queue_size batches of PIPELINE_BATCH_SIZE elements wait in each
+    queue, so the memory stays bounded. With metrics, the time of each stage
+    and the depths of the queues are added to the report.
+    The shaping holds the interpreter lock, so with processes > 0 (or None
+    for one per CPU) the batches are shaped by a pool of processes instead.
+    The profilers of metrics only see the main thread, which only waits for
+    the stages here, so metrics.profile raises ValueError.
+    Returns the number of written documents.
+    """
+    if metrics is not None and metrics.profile:
+        raise ValueError("The profilers can't measure the threads of the pipelined processing")
+    pool = None
+    window = 0
+    if processes != 0:
+        pool = multiprocessing.Pool(processes)
+        window = 2 * (processes or multiprocessing.cpu_count())
+    stages = pipeline.Pipeline()
+    parsed = stages.queue("parsed", queue_size)
+    encoded = stages.queue("encoded", queue_size)
+    try:
+        with writers.open_writer(file_in, fmt) as fo:
+            stages.stage("read", read_stage, file_in, backend, metrics, parsed)
+            stages.stage("shape", shape_stage, parsed, fmt, pool, window, encoded)
+            stages.stage("write", write_stage, encoded, fo)
+            stages.run()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if metrics is not None:
+        metrics.pipeline = stages.stats()
+    return fo.count
+
+def document_id(el):
+    # Unique id of a document, a node and a way can have the same OSM id
+    return "{0}/{1}".format(el["type"], el["id"])
+
+def shape_chunk(chunk):
+    # Shape the elements of one chunk of the file, run in a worker process.
+    # Returns the json lines and the counters of the chunk metrics, if measured
+    file_in, start, end, backend, measured = chunk
+    lines = []
+    if not measured:
+        for element in osm_chunks.iter_chunk_elements(file_in, start, end, backend):
             el = shape_element(element)
             if el:
-                data.append(el)
-                # Make sure the Chinese characters can be correctly written
-                jdata = unicode(json.dumps(el, ensure_ascii=False))
-                fo.write(jdata + "\n")
-    return data
+                lines.append(to_json_line(el))
+        return u"".join(lines), None
+    # Never printing its progress, the main process does
+    metrics = Metrics("chunk", interval=float("inf"))
+    for element in osm_chunks.iter_chunk_elements(file_in, start, end, backend, metrics):
+        start_time = time.time()
+        el = shape_element(element, metrics)
+        metrics.add_time("shape", time.time() - start_time)
+        if el:
+            start_time = time.time()
+            lines.append(to_json_line(el))
+            metrics.add_time("serialize", time.time() - start_time)
+    # The bytes of the chunk in the file, without the <osm> root added to
+    # each chunk, which isn't counted as an element either
+    metrics.bytes_read = end - start
+    metrics.elements.pop("osm", None)
+    return u"".join(lines), metrics.counters()
+
+def process_map_parallel(file_in, processes=None, chunk_size=osm_chunks.CHUNK_SIZE,
+                         backend=osm_reader.DEFAULT_BACKEND, metrics=None):
+    """
+    Same as process_map, with the shaping done by a pool of processes.
+
+    The file is split into chunks of top level elements, each chunk is
+    shaped by a worker and the results are written in the order of the
+    chunks, so the output file is identical to the one of process_map.
+    With metrics, each worker measures its chunk and the counters are
+    merged into metrics as the chunks are written. The other options of
+    process_map aren't supported, the output is json, and the input must
+    be an uncompressed xml file (see osm_chunks).
+    Returns the number of written documents.
+    """
+    # Define output file
+    file_out = "{0}.json".format(file_in)
+    measured = metrics is not None
+    if measured and metrics.total_bytes is None:
+        metrics.total_bytes = os.path.getsize(file_in)
+    chunks = [(file_in, start, end, backend, measured)
+              for start, end in osm_chunks.find_chunks(file_in, chunk_size)]
+    count = 0
+    pool = multiprocessing.Pool(processes)
+    try:
+        with io.open(file_out, "w", encoding="utf8") as fo:
+            # imap keeps the order of the chunks
+            for text, counters in pool.imap(shape_chunk, chunks):
+                fo.write(text)
+                count += text.count("\n")
+                if counters is not None:
+                    metrics.merge(counters)
+    finally:
+        pool.close()
+        pool.join()
+    return count
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+def write_checkpoint(path, checkpoint):
+    # Written aside then renamed, so a checkpoint is never half written
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(path + ".tmp", path)
+
+def check_checkpoint(file_in, checkpoint):
+    # The checkpoint must have been written for this version of the file
+    stat = os.stat(file_in)
+    if checkpoint.get("input_size") != stat.st_size or \
+       checkpoint.get("input_mtime") != stat.st_mtime:
+        raise ValueError("{0} has changed since its checkpoint, "
+                         "process it again without resume".format(file_in))
+    if checkpoint["input_offset"] and checkpoint["last_id"] != \
+       osm_chunks.last_element_id(file_in, checkpoint["input_offset"]):
+        raise ValueError("The last element before the checkpoint of {0} isn't {1}, "
+                         "process it again without resume".format(file_in, checkpoint["last_id"]))
+
+def process_map_checkpointed(file_in, resume=False, chunk_size=CHECKPOINT_SIZE,
+                             backend=osm_reader.DEFAULT_BACKEND):
+    """
+    Same as process_map, with a checkpoint after each chunk of the file.
+
+    After each chunk (see osm_chunks), the output is flushed to disk and
+    "<file_in>.json.checkpoint" records the size and modification time of
+    the input file, the input offset of the next top level element, the
+    "<tag>/<id>" of the last element and the position in the output file.
+    If resume is True and a checkpoint exists, the output is truncated to the
+    recorded position and the processing continues from the recorded input
+    offset, so the output file is identical to the one of an uninterrupted run.
+    If the output file is missing or shorter than the recorded position, the
+    checkpoint is ignored and the whole file is processed again. If the input
+    file has changed since the checkpoint, or the element before the recorded
+    offset isn't the recorded one, a ValueError is raised: the file has to be
+    processed again without resume.
+    The checkpoint is removed at the end. The other options of process_map
+    aren't supported, the output is json, and the input must be an
+    uncompressed xml file (see osm_chunks).
+    Returns the number of documents written by this run.
+    """
+    # Define output file
+    file_out = "{0}.json".format(file_in)
+    checkpoint_path = "{0}.checkpoint".format(file_out)
+    checkpoint = None
+    if resume:
+        checkpoint = read_checkpoint(checkpoint_path)
+        # The output the checkpoint refers to must still be there
+        if checkpoint is not None and (not os.path.exists(file_out) or
+                                       os.path.getsize(file_out) < checkpoint["output_offset"]):
+            checkpoint = None
+        if checkpoint is not None:
+            check_checkpoint(file_in, checkpoint)
+    if checkpoint is None:
+        stat = os.stat(file_in)
+        checkpoint = {"input_size": stat.st_size, "input_mtime": stat.st_mtime,
+                      "input_offset": 0, "last_id": None, "output_offset": 0}
+    # Before opening the output, fails for a file which can't be split
+    chunks = osm_chunks.find_chunks(file_in, chunk_size, checkpoint["input_offset"])
+    if checkpoint["output_offset"] == 0:
+        fo = open(file_out, "wb")
+    else:
+        # Drop what was written after the checkpoint
+        fo = open(file_out, "r+b")
+        fo.truncate(checkpoint["output_offset"])
+        fo.seek(checkpoint["output_offset"])
+    count = 0
+    try:
+        for start, end in chunks:
+            for element in osm_chunks.iter_chunk_elements(file_in, start, end, backend):
+                # The raw id, the relations aren't shaped
+                checkpoint["last_id"] = "{0}/{1}".format(element.tag, element.attrib.get("id"))
+                el = shape_element(element)
+                if el:
+                    fo.write(to_json_line(el).encode("utf8"))
+                    count += 1
+            fo.flush()
+            os.fsync(fo.fileno())
+            checkpoint["input_offset"] = end
+            checkpoint["output_offset"] = fo.tell()
+            write_checkpoint(checkpoint_path, checkpoint)
+    finally:
+        fo.close()
+    # No chunk, so no checkpoint, for a file without elements
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return count
 
 
 if __name__ == "__main__":
-    data = process_map('example.osm')
-    #pprint.pprint(data)
+    # python data_shanghai.py [--resume], with --resume an interrupted run
+    # continues from its last checkpoint
+    process_map_checkpointed('example.osm', resume="--resume" in sys.argv)
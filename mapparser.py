@@ -9,13 +9,14 @@ The output is a dictionary with the tag name as the key
 and number of times this tag can be encountered in the map as value.
 """
 
-import xml.etree.ElementTree as ET
 import pprint
 
-def count_tags(filename):
+import osm_reader
+
+def count_tags(filename, backend=osm_reader.DEFAULT_BACKEND, metrics=None):
     tags = {}
     # iterative parsing
-    for event, elem in ET.iterparse(filename):
+    for elem in osm_reader.iter_elements(filename, backend, metrics):
         tag_name = elem.tag
         # if the tag exsits, increment the counter
         if tag_name in tags:
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file finds and rewrites the aliases of canonical values (cities,
+street types, directions, bank names...) in one scan of each value.
+
+The aliases are compiled into an Aho-Corasick automaton, so the cost of a
+scan depends on the length of the value and not on the number of aliases.
+
+The rules file is a json dictionary of categories, each one giving the
+aliases of its canonical values:
+
+{
+"street_type": {"Road": ["Rd", "Rd.", "road", "Lu"], ...},
+"brand": {"中国工商银行": ["工商银行", "中国工商银行", "ICBC"], ...}
+}
+
+When several aliases overlap, the leftmost and then longest one is used.
+With whole_token, an alias is only used if it isn't a part of a word,
+for example "Rd" in "Rd." or "Nanjing Rd" but not in "Rdx".
+With last_token, an alias is only used if it is the whole last word of the
+value, for example "Rd" in "Lu Xun Rd" but not "Lu" in "Lu Xun Park".
+"""
+
+from collections import OrderedDict
+import io
+import json
+
+
+class Matcher(object):
+
+    def __init__(self):
+        # transitions, failure links and outputs of the states
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self.categories = OrderedDict()
+        self.built = False
+
+    def add(self, alias, canonical, category):
+        state = 0
+        for ch in alias:
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[state][ch] = next_state
+            state = next_state
+        self.out[state].append((len(alias), canonical, category))
+        self.categories.setdefault(category, OrderedDict())[alias] = canonical
+        self.built = False
+
+    def build(self):
+        # Breadth first computation of the failure links
+        queue = list(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        i = 0
+        while i < len(queue):
+            state = queue[i]
+            i += 1
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and ch not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(ch, 0)
+                self.out[next_state] = self.out[next_state] + self.out[self.fail[next_state]]
+        self.built = True
+
+    def iter_matches(self, text):
+        """Yield (start, end, canonical, category) of all the aliases in text"""
+        if not self.built:
+            self.build()
+        goto = self.goto
+        fail = self.fail
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, canonical, category in self.out[state]:
+                yield i + 1 - length, i + 1, canonical, category
+
+    def find(self, text, categories=None, whole_token=False, last_token=False):
+        """The leftmost longest matches which don't overlap"""
+        matches = []
+        for match in self.iter_matches(text):
+            if categories is not None and match[3] not in categories:
+                continue
+            if whole_token and not is_whole_token(text, match[0], match[1]):
+                continue
+            if last_token and not is_last_token(text, match[0], match[1]):
+                continue
+            matches.append(match)
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+        selected = []
+        end = 0
+        for match in matches:
+            if match[0] >= end:
+                selected.append(match)
+                end = match[1]
+        return selected
+
+    def rewrite(self, text, categories=None, whole_token=False, last_token=False):
+        """Replace the aliases of text by their canonical values"""
+        parts = []
+        end = 0
+        for start, stop, canonical, _ in self.find(text, categories, whole_token, last_token):
+            parts.append(text[end:start])
+            parts.append(canonical)
+            end = stop
+        if not parts:
+            return text
+        parts.append(text[end:])
+        return u"".join(parts)
+
+    def canonical_values(self, category):
+        values = []
+        for canonical in self.categories.get(category, {}).values():
+            if canonical not in values:
+                values.append(canonical)
+        return values
+
+    def aliases(self, category):
+        # alias -> canonical value of a category
+        return self.categories.get(category, OrderedDict())
+
+
+def is_whole_token(text, start, end):
+    # The alias must not continue a word on the left or on the right
+    if start > 0 and text[start - 1].isalnum() and text[start].isalnum():
+        return False
+    if end < len(text) and text[end].isalnum() and text[end - 1].isalnum():
+        return False
+    return True
+
+def is_last_token(text, start, end):
+    # The alias must be all the characters after the last space
+    return end == len(text) and (start == 0 or text[start - 1].isspace())
+
+def load_rules(path):
+    """Return the Matcher of all the aliases of a rules file"""
+    with io.open(path, "r", encoding="utf8") as f:
+        rules = json.load(f, object_pairs_hook=OrderedDict)
+    matcher = Matcher()
+    for category, values in rules.items():
+        for canonical, aliases in values.items():
+            for alias in aliases:
+                matcher.add(alias, canonical, category)
+    matcher.build()
+    return matcher
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file provides a bounded cache to memoize the cleaning functions.
+
+The keys and values of the map are very repetitive (a few cities, a few
+thousand streets and postcodes, a few hundred keys), so caching the result
+of the regular expressions work by distinct value saves most of it.
+
+The decorator memoize(maxsize) caches the results of a function by its
+arguments. The cache of a decorated function is available as its "cache"
+attribute, and cache.stats() gives the hits, misses and hit rate.
+
+A hit is a single lookup in a plain dictionary: keeping the items in the
+order of use (an OrderedDict, pure python in python 2) costs as much as the
+regular expressions it saves. When the cache is full, it is emptied and
+filled again by the next values, so it follows the values of the part of
+the file being read.
+"""
+
+import functools
+
+
+class BoundedCache(object):
+    """Dictionary keeping at most maxsize items, it is emptied when full"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = {}
+        self.hits = 0
+        self.misses = 0
+        self.clears = 0
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if len(self.data) >= self.maxsize and key not in self.data:
+            self.data.clear()
+            self.clears += 1
+        self.data[key] = value
+
+    def clear(self):
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+        self.clears = 0
+
+    def stats(self):
+        calls = self.hits + self.misses
+        hit_rate = 0.0
+        if calls:
+            hit_rate = float(self.hits) / calls
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.data),
+                "maxsize": self.maxsize,
+                "clears": self.clears,
+                "hit_rate": hit_rate}
+
+
+# Marker of the values not found in a cache, as None can be a cached value
+MISSING = object()
+
+def memoize(maxsize):
+    def decorator(function):
+        cache = BoundedCache(maxsize)
+        # The hits are looked up in the dictionary itself, without a call
+        data = cache.data
+
+        @functools.wraps(function)
+        def wrapper(*args):
+            value = data.get(args, MISSING)
+            if value is MISSING:
+                cache.misses += 1
+                value = function(*args)
+                cache.put(args, value)
+            else:
+                cache.hits += 1
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file measures what happens while a map file is processed.
+
+A Metrics object can be given to all the entry points of the project
+(count_tags, tags.process_map, users.process_map, audit, process_map).
+It records:
+- the number of elements by tag, and the elements per second
+- the cumulative time spent in each stage: "parse" (osm_reader),
+  "shape" (shape_element), "clean" (cleaning of the tags, part of "shape")
+  and "serialize" (encoding and writing of the documents)
+- the bytes read from the input file, compared to its size to give an ETA
+- the peak memory (maximum resident set size)
+- the number of dropped tags by reason
+- with a pipeline (see pipeline), the time of each stage and the depth
+  and waiting times of each queue
+- with a translator (see translation), its sent, failed and unfinished
+  batches
+- with worker processes (process_map_parallel), the counters of each
+  worker are added with merge(), the stage times being summed over the
+  workers, and the peak memory of the biggest worker is reported
+
+While the file is processed, a progress line is printed every "interval"
+seconds. At the end, report() gives all the metrics as a dictionary,
+which write_report saves as json.
+
+A profiler can also run around the hot loop:
+- "cprofile" : cProfile, the stats are saved into "<profile_path>"
+- "sample"   : a sampling profiler, counting the running line every 5 ms
+               (CPU time), the 20 most frequent lines are in the report
+Both only see the main thread, so process_map_pipelined, whose stages run
+in other threads, refuses them.
+"""
+
+from collections import defaultdict
+import cProfile
+import json
+import os
+import resource
+import signal
+import sys
+import time
+
+# Number of elements between two checks of the progress interval
+CHECK_EVERY = 1000
+SAMPLE_INTERVAL = 0.005
+
+
+class CountingFile(object):
+    """File object counting the bytes read"""
+
+    def __init__(self, f, metrics):
+        self.f = f
+        self.metrics = metrics
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.metrics.bytes_read += len(data)
+        return data
+
+    # Used by gzip to find the end of the compressed data
+    def tell(self):
+        return self.f.tell()
+
+    def seek(self, offset, whence=0):
+        # Moving back in the file gives bytes which are read again
+        if whence == 1:
+            self.metrics.bytes_read += offset
+        return self.f.seek(offset, whence)
+
+    def close(self):
+        self.f.close()
+
+
+class Metrics(object):
+
+    def __init__(self, name="run", total_bytes=None, interval=10.0,
+                 stream=sys.stderr, profile=None, profile_path=None):
+        self.name = name
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.stream = stream
+        self.profile = profile
+        self.profile_path = profile_path
+        self.elements = defaultdict(int)
+        self.times = defaultdict(float)
+        self.dropped = defaultdict(int)
+        self.bytes_read = 0
+        self.count = 0
+        self.start = time.time()
+        self.last_progress = self.start
+        self.profiler = None
+        self.samples = defaultdict(int)
+        self.pipeline = None
+        self.translation = None
+        self.worker_peak_rss_kb = None
+
+    ######################### RECORDING ###################################
+
+    def wrap(self, f):
+        # Count the bytes read from an input file
+        if self.total_bytes is None and hasattr(f, "fileno"):
+            try:
+                self.total_bytes = os.fstat(f.fileno()).st_size
+            except (OSError, ValueError):
+                pass
+        return CountingFile(f, self)
+
+    def element(self, tag):
+        self.elements[tag] += 1
+        self.count += 1
+        if self.count % CHECK_EVERY == 0:
+            now = time.time()
+            if now - self.last_progress >= self.interval:
+                self.last_progress = now
+                self.print_progress(now)
+
+    def add_time(self, stage, seconds):
+        self.times[stage] += seconds
+
+    def drop(self, reason):
+        self.dropped[reason] += 1
+
+    def counters(self):
+        # What a worker process sends back to be merged, a Metrics object
+        # itself can't be pickled (stream, profiler)
+        return {"elements": dict(self.elements),
+                "times": dict(self.times),
+                "dropped": dict(self.dropped),
+                "bytes_read": self.bytes_read,
+                "peak_rss_kb": self.peak_rss_kb()}
+
+    def merge(self, counters):
+        """Add the counters() of a worker"""
+        for tag, count in counters["elements"].items():
+            self.elements[tag] += count
+            self.count += count
+        for stage, seconds in counters["times"].items():
+            self.times[stage] += seconds
+        for reason, count in counters["dropped"].items():
+            self.dropped[reason] += count
+        self.bytes_read += counters["bytes_read"]
+        self.worker_peak_rss_kb = max(self.worker_peak_rss_kb, counters["peak_rss_kb"])
+        now = time.time()
+        if now - self.last_progress >= self.interval:
+            self.last_progress = now
+            self.print_progress(now)
+
+    ########################## PROFILING ##################################
+
+    def sample(self, signum, frame):
+        self.samples["{0}:{1}:{2}".format(os.path.basename(frame.f_code.co_filename),
+                                          frame.f_code.co_name, frame.f_lineno)] += 1
+
+    def start_profile(self):
+        if self.profile == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.profile == "sample":
+            signal.signal(signal.SIGPROF, self.sample)
+            signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+
+    def stop_profile(self):
+        if self.profile == "cprofile" and self.profiler is not None:
+            self.profiler.disable()
+            if self.profile_path:
+                self.profiler.dump_stats(self.profile_path)
+        elif self.profile == "sample":
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    ########################### REPORTING #################################
+
+    def peak_rss_kb(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def eta(self, elapsed):
+        if not self.total_bytes or not self.bytes_read:
+            return None
+        return elapsed * (self.total_bytes - self.bytes_read) / float(self.bytes_read)
+
+    def print_progress(self, now=None):
+        if now is None:
+            now = time.time()
+        elapsed = now - self.start
+        line = "[{0}] {1:.0f} s, {2} elements ({3:.0f}/s)".format(
+            self.name, elapsed, self.count, self.count / max(elapsed, 1e-9))
+        if self.total_bytes:
+            line += ", {0:.1f}% read".format(100.0 * self.bytes_read / self.total_bytes)
+            eta = self.eta(elapsed)
+            if eta is not None:
+                line += ", ETA {0:.0f} s".format(eta)
+        line += ", peak RSS {0} MB".format(self.peak_rss_kb() // 1024)
+        self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def report(self):
+        elapsed = time.time() - self.start
+        rates = {}
+        for tag in self.elements:
+            rates[tag] = self.elements[tag] / max(elapsed, 1e-9)
+        report = {"name": self.name,
+                  "seconds": elapsed,
+                  "elements": dict(self.elements),
+                  "elements_per_second": rates,
+                  "stage_seconds": dict(self.times),
+                  "bytes_read": self.bytes_read,
+                  "total_bytes": self.total_bytes,
+                  "peak_rss_kb": self.peak_rss_kb(),
+                  "dropped_tags": dict(self.dropped)}
+        if self.pipeline is not None:
+            report["pipeline"] = self.pipeline
+        if self.translation is not None:
+            report["translation"] = self.translation
+        if self.worker_peak_rss_kb is not None:
+            report["worker_peak_rss_kb"] = self.worker_peak_rss_kb
+        if self.samples:
+            top = sorted(self.samples.items(), key=lambda item: -item[1])[:20]
+            report["samples"] = [{"line": line, "count": count} for line, count in top]
+        return report
+
+    def write_report(self, path):
+        with open(path, "w") as fo:
+            json.dump(self.report(), fo, indent=2, sort_keys=True)
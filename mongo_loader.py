@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file loads the shaped documents directly into MongoDB, without writing
+the json file and running mongoimport on it.
+
+- the documents are streamed from data_shanghai.iter_shaped
+- they are inserted by batches of unordered inserts, over the connection
+  pool of the MongoClient
+- each document gets "_id" = "<type>/<id>" (a node and a way can have
+  the same OSM id), so loading the same document twice is harmless
+- after each batch, the "_id" of its last document is saved in the
+  "load_state" collection. After a crash, the load starts again after this
+  document, the elements before it are skipped without being shaped. The documents of the interrupted batch which were already
+  inserted are ignored as duplicates. The state is removed once the
+  load is complete.
+- the "pos" 2d index and the "type", "created.user", "amenity" indexes
+  are created once all the documents are loaded
+
+A client can be given to the functions, for example a mongomock.MongoClient
+to run the loader without a running mongod.
+"""
+
+from pymongo import MongoClient, ASCENDING, GEO2D
+from pymongo.errors import BulkWriteError
+
+import data_shanghai
+import osm_reader
+
+DUPLICATE_KEY = 11000
+
+INDEXES = [[("pos", GEO2D)],
+           [("type", ASCENDING)],
+           [("created.user", ASCENDING)],
+           [("amenity", ASCENDING)]]
+
+def insert_batch(collection, batch):
+    # Unordered inserts, the duplicates of a resumed batch are ignored
+    try:
+        result = collection.insert_many(batch, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        for error in errors:
+            if error["code"] != DUPLICATE_KEY:
+                raise
+        return e.details["nInserted"]
+
+def get_last_id(db, file_in):
+    state = db.load_state.find_one({"_id": file_in})
+    if state:
+        return state["last_id"]
+    return None
+
+def set_last_id(db, file_in, last_id):
+    db.load_state.replace_one({"_id": file_in}, {"_id": file_in, "last_id": last_id},
+                              upsert=True)
+
+def iter_after(elements, last_id):
+    # Skip the elements until the last committed one included, on their
+    # raw "<tag>/<id>" so they don't have to be shaped
+    found = last_id is None
+    for element in elements:
+        if found:
+            yield element
+        elif "{0}/{1}".format(element.tag, element.attrib.get("id")) == last_id:
+            found = True
+    if not found:
+        raise ValueError("The last loaded document {0} isn't in the file".format(last_id))
+
+def create_indexes(collection):
+    for keys in INDEXES:
+        collection.create_index(keys)
+
+def load(file_in, db_name="osm", collection_name="osm", client=None,
+         uri="mongodb://localhost:27017", batch_size=1000, resume=True,
+         backend=osm_reader.DEFAULT_BACKEND):
+    """
+    Load the shaped documents of file_in into db_name.collection_name.
+    Returns the number of inserted documents.
+    """
+    if client is None:
+        client = MongoClient(uri)
+    db = client[db_name]
+    collection = db[collection_name]
+
+    last_id = None
+    if resume:
+        last_id = get_last_id(db, file_in)
+
+    count = 0
+    batch = []
+    for element in iter_after(osm_reader.iter_top_level(file_in, backend), last_id):
+        doc = data_shanghai.shape_element(element)
+        if not doc:
+            continue
+        doc["_id"] = data_shanghai.document_id(doc)
+        batch.append(doc)
+        if len(batch) == batch_size:
+            count += insert_batch(collection, batch)
+            set_last_id(db, file_in, batch[-1]["_id"])
+            batch = []
+    if batch:
+        count += insert_batch(collection, batch)
+        set_last_id(db, file_in, batch[-1]["_id"])
+
+    create_indexes(collection)
+    # The load is complete, a new load will start from the beginning
+    db.load_state.delete_one({"_id": file_in})
+    return count
+
+
+if __name__ == "__main__":
+    print load('example.osm')
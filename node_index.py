@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file builds a compact index of the node coordinates, to resolve the
+geometry of the ways without looking up each node in MongoDB.
+
+The index is a binary file, memory mapped when it is read:
+
+- header : "OSMNIDX1" followed by the number of nodes (int64)
+- ids    : the sorted node ids (int64)
+- coords : the latitude and longitude of each node, in the same order,
+           as fixed point numbers (int32, degrees * 10^7)
+
+So each node takes 16 bytes (about 27 MB for the 1.7M nodes of Shanghai),
+and a lookup is a binary search on the memory mapped ids.
+
+In an osm file, all the nodes come before the ways. The function
+iter_with_geometry uses it to build the index during the node pass, then
+adds to each way document:
+
+"node_pos": [[31.2, 121.4], [31.21, 121.41], ...]   (None if not found)
+"bbox": [min_lat, min_lon, max_lat, max_lon]
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import shutil
+
+MAGIC = "OSMNIDX1"
+HEADER = struct.Struct("<8sq")
+ID = struct.Struct("<q")
+COORDS = struct.Struct("<ii")
+SCALE = 10000000
+# Number of nodes packed before each write
+BATCH_SIZE = 10000
+
+
+def to_fixed(degrees):
+    return int(round(degrees * SCALE))
+
+def to_degrees(fixed):
+    return float(fixed) / SCALE
+
+
+class NodeIndexBuilder(object):
+    """Write the index file, the nodes are added one by one"""
+
+    def __init__(self, path):
+        self.path = path
+        self.ids_file = open(path + ".ids.tmp", "wb")
+        self.coords_file = open(path + ".coords.tmp", "wb")
+        self.ids = []
+        self.coords = []
+        self.count = 0
+        self.last_id = None
+        self.is_sorted = True
+
+    def add(self, node_id, lat, lon):
+        if self.last_id is not None and node_id <= self.last_id:
+            self.is_sorted = False
+        self.last_id = node_id
+        self.ids.append(ID.pack(node_id))
+        self.coords.append(COORDS.pack(to_fixed(lat), to_fixed(lon)))
+        self.count += 1
+        if len(self.ids) == BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.ids_file.write("".join(self.ids))
+        self.coords_file.write("".join(self.coords))
+        self.ids = []
+        self.coords = []
+
+    def finish(self):
+        """Write the index file and return it opened as a NodeIndex"""
+        self.flush()
+        self.ids_file.close()
+        self.coords_file.close()
+        if not self.is_sorted:
+            sort_records(self.ids_file.name, self.coords_file.name, self.count)
+        with open(self.path, "wb") as fo:
+            fo.write(HEADER.pack(MAGIC, self.count))
+            for name in [self.ids_file.name, self.coords_file.name]:
+                with open(name, "rb") as fi:
+                    shutil.copyfileobj(fi, fo)
+                os.remove(name)
+        return NodeIndex(self.path)
+
+
+def sort_records(ids_name, coords_name, count):
+    # Only for the files whose nodes are not sorted by id,
+    # the records are sorted in memory
+    with open(ids_name, "rb") as f:
+        ids = f.read()
+    with open(coords_name, "rb") as f:
+        coords = f.read()
+    records = sorted((ID.unpack_from(ids, i * ID.size)[0], i) for i in xrange(count))
+    with open(ids_name, "wb") as f:
+        f.write("".join(ID.pack(node_id) for node_id, _ in records))
+    with open(coords_name, "wb") as f:
+        f.write("".join(coords[i * COORDS.size:(i + 1) * COORDS.size]
+                        for _, i in records))
+
+
+class SortedIds(object):
+    """Sequence view of the memory mapped ids, for the binary search"""
+
+    def __init__(self, mm, count):
+        self.mm = mm
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return ID.unpack_from(self.mm, HEADER.size + i * ID.size)[0]
+
+
+class NodeIndex(object):
+    """Read only access to an index file"""
+
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a node index file: {0}".format(path))
+        self.ids = SortedIds(self.mm, self.count)
+        self.coords_offset = HEADER.size + self.count * ID.size
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, node_id):
+        """Return the (lat, lon) of a node, or None if it is unknown"""
+        i = bisect.bisect_left(self.ids, node_id)
+        if i == self.count or self.ids[i] != node_id:
+            return None
+        lat, lon = COORDS.unpack_from(self.mm, self.coords_offset + i * COORDS.size)
+        return to_degrees(lat), to_degrees(lon)
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+
+def attach_geometry(doc, index):
+    # Set the positions of the nodes and the bounding box of a way
+    node_pos = []
+    lats = []
+    lons = []
+    for ref in doc["node_refs"]:
+        pos = index.lookup(int(ref))
+        if pos is None:
+            node_pos.append(None)
+        else:
+            node_pos.append([pos[0], pos[1]])
+            lats.append(pos[0])
+            lons.append(pos[1])
+    doc["node_pos"] = node_pos
+    if lats:
+        doc["bbox"] = [min(lats), min(lons), max(lats), max(lons)]
+
+def iter_with_geometry(docs, index_path):
+    """
+    Yield the shaped documents, with the geometry added to the ways.
+    The index is built from the nodes seen before the first way.
+    """
+    builder = NodeIndexBuilder(index_path)
+    index = None
+    for doc in docs:
+        if doc["type"] == "node":
+            # The nodes after the first way can't be used any more
+            if index is None:
+                builder.add(int(doc["id"]), doc["pos"][0], doc["pos"][1])
+        elif doc["type"] == "way":
+            if index is None:
+                index = builder.finish()
+            attach_geometry(doc, index)
+        yield doc
+    if index is None:
+        index = builder.finish()
+    index.close()
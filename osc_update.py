@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file updates the shaped data with an OSM change file (.osc) instead of
+processing the whole map again.
+
+Only the created and modified nodes and ways are shaped with
+data_shanghai.shape_element. Each change gives an operation:
+
+{"op": "upsert", "_id": "node/2406124091", "version": "3", "doc": {...}}
+{"op": "delete", "_id": "way/191109", "version": "2"}
+
+"_id" is the same as the one given by mongo_loader, so the operations can be
+applied either to the json file written by data_shanghai.process_map or
+to the MongoDB collection loaded by mongo_loader.
+"""
+
+import io
+import json
+import os
+import pprint
+import re
+
+import data_shanghai
+import osm_reader
+
+# The "id" of a json line, as written by json.dumps
+id_re = re.compile(r'"id": "([^"\\]*)"')
+
+def version_number(version):
+    # The versions are strings, a missing version is the oldest one
+    if version is None:
+        return 0
+    return int(version)
+
+def iter_operations(osc_file):
+    """Yield the upsert and delete operations of an osm change file"""
+    for action, element in osm_reader.iter_changes(osc_file):
+        if action == "delete":
+            if element.tag in ["node", "way"]:
+                yield {"op": "delete",
+                       "_id": "{0}/{1}".format(element.tag, element.attrib["id"]),
+                       "version": element.attrib.get("version")}
+        else:
+            el = data_shanghai.shape_element(element)
+            if el:
+                yield {"op": "upsert",
+                       "_id": data_shanghai.document_id(el),
+                       "version": el["created"].get("version"),
+                       "doc": el}
+
+def latest_operations(operations):
+    # Keep only the operation of the latest version for each document
+    latest = {}
+    for op in operations:
+        previous = latest.get(op["_id"])
+        if previous is None or \
+           version_number(op["version"]) >= version_number(previous["version"]):
+            latest[op["_id"]] = op
+    return latest
+
+def apply_to_json(operations, json_file):
+    """
+    Apply the operations to a json file written by data_shanghai.process_map.
+    The unchanged lines are copied as they are, the updated documents stay
+    at their place and the new ones are appended at the end.
+    Only the lines having the id of an operation are decoded, the others
+    are copied without being parsed.
+    Returns the number of upserted and deleted documents.
+    """
+    latest = latest_operations(operations)
+    changed_ids = set(_id.split("/", 1)[1] for _id in latest)
+    upserted = 0
+    deleted = 0
+    tmp_file = json_file + ".tmp"
+    with io.open(json_file, "r", encoding="utf8") as fi, \
+         io.open(tmp_file, "w", encoding="utf8") as fo:
+        for line in fi:
+            if not changed_ids.intersection(id_re.findall(line)):
+                fo.write(line)
+                continue
+            el = json.loads(line)
+            op = latest.pop(data_shanghai.document_id(el), None)
+            # Ignore the operations older than the document
+            if op is None or version_number(op["version"]) < \
+               version_number(el["created"].get("version")):
+                fo.write(line)
+            elif op["op"] == "upsert":
+                fo.write(data_shanghai.to_json_line(op["doc"]))
+                upserted += 1
+            else:
+                deleted += 1
+        # Append the created documents
+        for _id in sorted(latest):
+            op = latest[_id]
+            if op["op"] == "upsert":
+                fo.write(data_shanghai.to_json_line(op["doc"]))
+                upserted += 1
+    os.rename(tmp_file, json_file)
+    return {"upserted": upserted, "deleted": deleted}
+
+def current_versions(collection, ids):
+    # Version of the documents already in the collection
+    versions = {}
+    for doc in collection.find({"_id": {"$in": ids}}, {"created.version": 1}):
+        versions[doc["_id"]] = doc.get("created", {}).get("version")
+    return versions
+
+def apply_batch_to_mongo(collection, batch):
+    # Only needed here, the json updates don't need pymongo
+    from pymongo import ReplaceOne, DeleteOne
+
+    latest = latest_operations(batch)
+    versions = current_versions(collection, list(latest))
+    requests = []
+    for _id in sorted(latest):
+        op = latest[_id]
+        # Ignore the operations older than the document
+        if _id in versions and version_number(op["version"]) < \
+           version_number(versions[_id]):
+            continue
+        if op["op"] == "upsert":
+            doc = op["doc"]
+            doc["_id"] = _id
+            requests.append(ReplaceOne({"_id": _id}, doc, upsert=True))
+        else:
+            requests.append(DeleteOne({"_id": _id}))
+    if not requests:
+        return 0, 0
+    result = collection.bulk_write(requests, ordered=False)
+    return result.upserted_count + result.modified_count, result.deleted_count
+
+def apply_to_mongo(operations, collection, batch_size=1000):
+    """
+    Apply the operations to a collection loaded by mongo_loader, by batches
+    of bulk writes. As for the json file, the operations older than the
+    document in the collection are ignored.
+    Returns the number of upserted and deleted documents.
+    """
+    upserted = 0
+    deleted = 0
+    batch = []
+    for op in operations:
+        batch.append(op)
+        if len(batch) == batch_size:
+            u, d = apply_batch_to_mongo(collection, batch)
+            upserted += u
+            deleted += d
+            batch = []
+    if batch:
+        u, d = apply_batch_to_mongo(collection, batch)
+        upserted += u
+        deleted += d
+    return {"upserted": upserted, "deleted": deleted}
+
+def write_operations(operations, file_out):
+    # Write the operations as json lines
+    count = 0
+    with io.open(file_out, "w", encoding="utf8") as fo:
+        for op in operations:
+            fo.write(data_shanghai.to_json_line(op))
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    result = apply_to_json(iter_operations('example.osc'), 'example.osm.json')
+    pprint.pprint(result)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file splits an osm file into independent chunks of top level elements.
+
+The top level elements ("node", "way", "relation") of an osm file are never
+nested into each other, and the "<" character is always escaped inside the
+attribute values. So the byte offset of each "<node", "<way" or "<relation"
+found in the file is a safe boundary between two elements.
+
+A chunk is a (start, end) pair of byte offsets. Each chunk can be parsed on
+its own by wrapping its bytes into an "<osm>" root element, which allows to
+process the chunks in different processes, or to restart from the beginning
+of any chunk.
+
+Only the plain xml files can be split: the byte offsets of a compressed
+(".gz", ".bz2") or a PBF file aren't the ones of the xml, so find_chunks
+raises a ValueError for them. They can be read by osm_reader, which
+decompresses them as a stream.
+"""
+
+import re
+import os
+import io
+
+import osm_reader
+
+element_start_re = re.compile(r'<(node|way|relation)[\s/>]')
+id_re = re.compile(r'\sid=["\']([^"\']*)["\']')
+osm_end = "</osm>"
+
+# Size of the blocks read when looking for a boundary
+BLOCK_SIZE = 64 * 1024
+# Default size of a chunk
+CHUNK_SIZE = 16 * 1024 * 1024
+# Extensions of the files which can't be split into chunks
+UNSPLITTABLE = [".gz", ".bz2", ".pbf"]
+
+def find_element_start(f, offset, limit):
+    # Return the offset of the first top level element starting at
+    # or after the given offset, or limit if there is none
+    f.seek(offset)
+    data = ""
+    while offset + len(data) < limit:
+        block = f.read(BLOCK_SIZE)
+        if not block:
+            break
+        data += block
+        m = element_start_re.search(data)
+        if m:
+            return min(offset + m.start(), limit)
+    return limit
+
+def find_osm_end(f, size):
+    # Return the offset of the closing "</osm>" tag
+    offset = max(0, size - BLOCK_SIZE)
+    f.seek(offset)
+    position = f.read().rfind(osm_end)
+    if position == -1:
+        return size
+    return offset + position
+
+def find_chunks(filename, chunk_size=CHUNK_SIZE, offset=0):
+    """
+    Return the list of (start, end) chunks of the top level elements
+    starting at or after the given offset.
+    Raises ValueError for a compressed or a PBF file.
+    """
+    if os.path.splitext(filename)[1] in UNSPLITTABLE:
+        raise ValueError("Can't split a compressed or PBF file into chunks: {0}, "
+                         "decompress it first".format(filename))
+    size = os.path.getsize(filename)
+    chunks = []
+    with open(filename, "rb") as f:
+        end = find_osm_end(f, size)
+        start = find_element_start(f, offset, end)
+        while start < end:
+            # Move the boundary to the next element after the chunk size
+            next_start = find_element_start(f, start + chunk_size, end)
+            chunks.append((start, next_start))
+            start = next_start
+    return chunks
+
+def last_element_id(filename, offset):
+    """
+    Return "<tag>/<id>" of the last top level element starting before the
+    given offset, or None if there is none.
+    """
+    size = BLOCK_SIZE
+    with open(filename, "rb") as f:
+        while True:
+            start = max(0, offset - size)
+            f.seek(start)
+            data = f.read(offset - start)
+            matches = list(element_start_re.finditer(data))
+            if matches:
+                m = matches[-1]
+                # The id is an attribute of the start tag
+                tag_end = data.find(">", m.start())
+                if tag_end == -1:
+                    tag_end = len(data)
+                id_match = id_re.search(data, m.start(), tag_end)
+                if id_match is None:
+                    return None
+                return "{0}/{1}".format(m.group(1), id_match.group(1))
+            if start == 0:
+                return None
+            size *= 2
+
+def read_chunk(filename, start, end):
+    with open(filename, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+def iter_chunk_elements(filename, start, end, backend=osm_reader.DEFAULT_BACKEND,
+                        metrics=None):
+    """
+    Yield the top level elements of one chunk, measured as with
+    osm_reader.iter_top_level if metrics is given.
+
+    As with osm_reader.iter_top_level, the elements are cleared once they
+    have been handled by the caller.
+    """
+    data = ("<?xml version='1.0' encoding='UTF-8'?>\n<osm>"
+            + read_chunk(filename, start, end) + osm_end)
+    return osm_reader.iter_top_level(io.BytesIO(data), backend, metrics)
+
+
+if __name__ == "__main__":
+    for chunk in find_chunks('example.osm'):
+        print chunk
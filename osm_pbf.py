@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file reads the OSM PBF format (.osm.pbf) and yields the same elements
+as the expat backend of osm_reader, so the rest of the project can use a PBF
+extract as if it was an osm file.
+
+A PBF file is a sequence of blobs, each one preceded by its header:
+- 4 bytes : length of the BlobHeader (big endian)
+- BlobHeader : type ("OSMHeader" or "OSMData") and size of the Blob
+- Blob : a zlib compressed (or raw) HeaderBlock or PrimitiveBlock
+
+The protocol buffers messages are decoded here without any dependency,
+only the fields used by the project are read:
+- the bounding box of the HeaderBlock, yielded as the "bounds" element
+- the nodes, dense nodes, ways and relations of the PrimitiveBlocks,
+  with their tags and metadata (version, timestamp, changeset, uid, user)
+
+The attributes are strings, formatted as in the osm files
+(7 decimals for the coordinates, "2013-08-03T16:43:42Z" for the timestamps).
+"""
+
+import struct
+import time
+import zlib
+
+import osm_reader
+
+MEMBER_TYPES = ["node", "way", "relation"]
+
+########################### PROTOCOL BUFFERS ###############################
+
+def read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = ord(buf[pos])
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+def zigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+def signed(n):
+    # Plain int32/int64 varints are stored in two's complement on 64 bits
+    if n >= 1 << 63:
+        return n - (1 << 64)
+    return n
+
+def iter_fields(buf):
+    """Yield (field number, value) of a message, the value is an integer
+    for the varints and a string for the length delimited fields"""
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        number = key >> 3
+        wire_type = key & 7
+        if wire_type == 0:
+            value, pos = read_varint(buf, pos)
+        elif wire_type == 2:
+            length, pos = read_varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire_type == 1:
+            value = struct.unpack_from("<q", buf, pos)[0]
+            pos += 8
+        elif wire_type == 5:
+            value = struct.unpack_from("<i", buf, pos)[0]
+            pos += 4
+        else:
+            raise ValueError("Unsupported wire type: {0}".format(wire_type))
+        yield number, value
+
+def read_packed(value):
+    # Packed repeated varints, or a single not packed varint
+    if isinstance(value, (int, long)):
+        return [value]
+    values = []
+    pos = 0
+    end = len(value)
+    while pos < end:
+        n, pos = read_varint(value, pos)
+        values.append(n)
+    return values
+
+def delta_decode(values):
+    decoded = []
+    last = 0
+    for value in values:
+        last += value
+        decoded.append(last)
+    return decoded
+
+############################## OSM FORMAT ##################################
+
+def format_coordinate(nano):
+    return "{0:.7f}".format(nano * 1e-9)
+
+def format_timestamp(seconds):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+def set_info(attrib, version, timestamp, changeset, uid, user, visible):
+    attrib["version"] = str(version)
+    attrib["timestamp"] = format_timestamp(timestamp)
+    attrib["changeset"] = str(changeset)
+    attrib["uid"] = str(uid)
+    attrib["user"] = user
+    if visible is not None:
+        attrib["visible"] = "true" if visible else "false"
+
+def read_info(buf, strings, date_granularity, attrib):
+    info = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0, 6: None}
+    for number, value in iter_fields(buf):
+        info[number] = value
+    set_info(attrib, signed(info[1]), signed(info[2]) * date_granularity / 1000,
+             signed(info[3]), signed(info[4]), strings[info[5]], info[6])
+
+def add_tags(elem, strings, keys, vals):
+    for k, v in zip(keys, vals):
+        elem.children.append(osm_reader.Element("tag", {"k": strings[k], "v": strings[v]}))
+
+def read_blocks(f):
+    """Yield (type, data) of the blobs of a PBF file"""
+    while True:
+        header_size = f.read(4)
+        if len(header_size) < 4:
+            return
+        header = f.read(struct.unpack(">i", header_size)[0])
+        blob_type = None
+        data_size = 0
+        for number, value in iter_fields(header):
+            if number == 1:
+                blob_type = value
+            elif number == 3:
+                data_size = value
+        blob = f.read(data_size)
+        data = None
+        for number, value in iter_fields(blob):
+            if number == 1:
+                data = value
+            elif number == 3:
+                data = zlib.decompress(value)
+        if data is None:
+            raise ValueError("Unsupported blob compression")
+        yield blob_type, data
+
+class Block(object):
+    """Decoding context of a PrimitiveBlock"""
+
+    def __init__(self, data):
+        self.strings = []
+        self.groups = []
+        self.granularity = 100
+        self.lat_offset = 0
+        self.lon_offset = 0
+        self.date_granularity = 1000
+        for number, value in iter_fields(data):
+            if number == 1:
+                self.strings = [s.decode("utf8") for n, s in iter_fields(value) if n == 1]
+            elif number == 2:
+                self.groups.append(value)
+            elif number == 17:
+                self.granularity = value
+            elif number == 18:
+                self.date_granularity = value
+            elif number == 19:
+                self.lat_offset = signed(value)
+            elif number == 20:
+                self.lon_offset = signed(value)
+
+    def position(self, lat, lon):
+        return (format_coordinate(self.lat_offset + self.granularity * lat),
+                format_coordinate(self.lon_offset + self.granularity * lon))
+
+    def iter_elements(self):
+        for group in self.groups:
+            for number, value in iter_fields(group):
+                if number == 1:
+                    yield self.read_node(value)
+                elif number == 2:
+                    for elem in self.read_dense(value):
+                        yield elem
+                elif number == 3:
+                    yield self.read_way(value)
+                elif number == 4:
+                    yield self.read_relation(value)
+
+    def read_node(self, buf):
+        node_id = lat = lon = 0
+        keys, vals, info = [], [], None
+        for number, value in iter_fields(buf):
+            if number == 1:
+                node_id = zigzag(value)
+            elif number == 2:
+                keys.extend(read_packed(value))
+            elif number == 3:
+                vals.extend(read_packed(value))
+            elif number == 4:
+                info = value
+            elif number == 8:
+                lat = zigzag(value)
+            elif number == 9:
+                lon = zigzag(value)
+        attrib = {"id": str(node_id)}
+        attrib["lat"], attrib["lon"] = self.position(lat, lon)
+        if info is not None:
+            read_info(info, self.strings, self.date_granularity, attrib)
+        elem = osm_reader.Element("node", attrib)
+        add_tags(elem, self.strings, keys, vals)
+        return elem
+
+    def read_dense(self, buf):
+        ids, lats, lons, keys_vals = [], [], [], []
+        info = None
+        for number, value in iter_fields(buf):
+            if number == 1:
+                ids.extend(read_packed(value))
+            elif number == 5:
+                info = read_dense_info(value)
+            elif number == 8:
+                lats.extend(read_packed(value))
+            elif number == 9:
+                lons.extend(read_packed(value))
+            elif number == 10:
+                keys_vals.extend(read_packed(value))
+        ids = delta_decode([zigzag(n) for n in ids])
+        lats = delta_decode([zigzag(n) for n in lats])
+        lons = delta_decode([zigzag(n) for n in lons])
+        kv = 0
+        for i in xrange(len(ids)):
+            attrib = {"id": str(ids[i])}
+            attrib["lat"], attrib["lon"] = self.position(lats[i], lons[i])
+            if info is not None:
+                versions, timestamps, changesets, uids, users, visibles = info
+                visible = visibles[i] if visibles else None
+                set_info(attrib, versions[i],
+                         timestamps[i] * self.date_granularity / 1000,
+                         changesets[i], uids[i], self.strings[users[i]], visible)
+            elem = osm_reader.Element("node", attrib)
+            # The keys and values of all the nodes, separated by 0
+            while kv < len(keys_vals) and keys_vals[kv] != 0:
+                elem.children.append(osm_reader.Element("tag", {"k": self.strings[keys_vals[kv]],
+                                                     "v": self.strings[keys_vals[kv + 1]]}))
+                kv += 2
+            kv += 1
+            yield elem
+
+    def read_way(self, buf):
+        way_id = 0
+        keys, vals, refs, info = [], [], [], None
+        for number, value in iter_fields(buf):
+            if number == 1:
+                way_id = signed(value)
+            elif number == 2:
+                keys.extend(read_packed(value))
+            elif number == 3:
+                vals.extend(read_packed(value))
+            elif number == 4:
+                info = value
+            elif number == 8:
+                refs.extend(read_packed(value))
+        attrib = {"id": str(way_id)}
+        if info is not None:
+            read_info(info, self.strings, self.date_granularity, attrib)
+        elem = osm_reader.Element("way", attrib)
+        for ref in delta_decode([zigzag(n) for n in refs]):
+            elem.children.append(osm_reader.Element("nd", {"ref": str(ref)}))
+        add_tags(elem, self.strings, keys, vals)
+        return elem
+
+    def read_relation(self, buf):
+        relation_id = 0
+        keys, vals, roles, memids, types, info = [], [], [], [], [], None
+        for number, value in iter_fields(buf):
+            if number == 1:
+                relation_id = signed(value)
+            elif number == 2:
+                keys.extend(read_packed(value))
+            elif number == 3:
+                vals.extend(read_packed(value))
+            elif number == 4:
+                info = value
+            elif number == 8:
+                roles.extend(read_packed(value))
+            elif number == 9:
+                memids.extend(read_packed(value))
+            elif number == 10:
+                types.extend(read_packed(value))
+        attrib = {"id": str(relation_id)}
+        if info is not None:
+            read_info(info, self.strings, self.date_granularity, attrib)
+        elem = osm_reader.Element("relation", attrib)
+        memids = delta_decode([zigzag(n) for n in memids])
+        for role, ref, member_type in zip(roles, memids, types):
+            elem.children.append(osm_reader.Element("member", {"type": MEMBER_TYPES[member_type],
+                                                    "ref": str(ref),
+                                                    "role": self.strings[role]}))
+        add_tags(elem, self.strings, keys, vals)
+        return elem
+
+def read_dense_info(buf):
+    versions, timestamps, changesets, uids, users, visibles = [], [], [], [], [], []
+    for number, value in iter_fields(buf):
+        if number == 1:
+            versions.extend(read_packed(value))
+        elif number == 2:
+            timestamps.extend(read_packed(value))
+        elif number == 3:
+            changesets.extend(read_packed(value))
+        elif number == 4:
+            uids.extend(read_packed(value))
+        elif number == 5:
+            users.extend(read_packed(value))
+        elif number == 6:
+            visibles.extend(read_packed(value))
+    return ([signed(n) for n in versions],
+            delta_decode([zigzag(n) for n in timestamps]),
+            delta_decode([zigzag(n) for n in changesets]),
+            delta_decode([zigzag(n) for n in uids]),
+            delta_decode([zigzag(n) for n in users]),
+            visibles)
+
+def read_bounds(data):
+    # Bounding box of the HeaderBlock, in nanodegrees
+    for number, value in iter_fields(data):
+        if number == 1:
+            bbox = {}
+            for n, v in iter_fields(value):
+                bbox[n] = zigzag(v)
+            return osm_reader.Element("bounds", {"minlat": format_coordinate(bbox.get(4, 0)),
+                                      "minlon": format_coordinate(bbox.get(1, 0)),
+                                      "maxlat": format_coordinate(bbox.get(3, 0)),
+                                      "maxlon": format_coordinate(bbox.get(2, 0))})
+    return None
+
+def iter_pbf(f):
+    """
+    Yield the elements of a PBF file object, in the same order as
+    osm_reader.iter_elements: the children of an element before the element,
+    and the "osm" root element at the end.
+    """
+    for blob_type, data in read_blocks(f):
+        if blob_type == "OSMHeader":
+            bounds = read_bounds(data)
+            if bounds is not None:
+                yield bounds
+        elif blob_type == "OSMData":
+            for elem in Block(data).iter_elements():
+                for child in elem.children:
+                    yield child
+                yield elem
+    yield osm_reader.Element("osm", {})
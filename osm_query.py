@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file answers the queries of the exploration of the data (counts,
+filters, group by, distinct) from the json output of process_map, with
+indexes kept on the disk, without loading the data into MongoDB.
+
+The indexes of "<file>.json" are written into the directory "<file>.json.idx":
+- "keys"   : for each key of the documents, and each key of their "name" and
+             "address" dicts ("name.en", "address.city"...), the documents
+             having it
+- "values" : for each value of the top level fields (type, amenity, source,
+             created_by...), of "created.user" and of "name.main", the
+             documents having it
+- "cells"  : for each cell of a grid of CELL_SIZE degrees, the nodes whose
+             "pos" is in it
+- "offsets": the position of each document in the json file, to read it
+
+The lists of documents (postings) are arrays of document numbers written one
+after another in "postings.bin", "catalog.json" giving the position of each
+one. They are built while process_map writes the json (index=True), or
+afterwards by build().
+
+The queries use a small part of the MongoDB query language:
+
+db = open_index("example.osm.json")
+db.find({"type": "node"}).count()
+db.find({"name.en": {"$exists": 1}}).count()
+db.find({"amenity": "bank"}).group_by("brand")
+db.find().distinct("created.user")
+db.find({"pos": {"$within": [31.0, 121.0, 31.5, 121.5]}}).docs()
+
+A condition is a value, {"$exists": 1 or 0}, {"$in": [values]} or, for
+"pos", {"$within": [min lat, min lon, max lat, max lon]}. The conditions on
+fields which are not indexed are checked by reading the documents.
+"""
+
+from array import array
+import io
+import json
+import math
+import mmap
+import os
+
+CELL_SIZE = 0.01
+# Fields whose values are indexed, besides the top level ones
+NESTED_VALUES = ["created.user", "name.main"]
+# Top level fields whose values are not indexed
+UNINDEXED_VALUES = ["id", "pos", "node_refs", "created", "name", "address"]
+# Dicts whose keys are indexed
+NESTED_KEYS = ["name", "address"]
+TYPECODE = "l"
+
+def index_dir(json_path):
+    return "{0}.idx".format(json_path)
+
+def get_path(doc, path):
+    # Value of a dotted path ("name.en"), or None
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def cell_of(lat, lon, cell_size):
+    return "{0},{1}".format(int(math.floor(lat / cell_size)), int(math.floor(lon / cell_size)))
+
+
+class IndexBuilder(object):
+    """Collect the postings of the documents, then write them"""
+
+    def __init__(self, json_path, cell_size=CELL_SIZE):
+        self.json_path = json_path
+        self.cell_size = cell_size
+        self.offsets = array(TYPECODE)
+        self.keys = {}
+        self.values = {}
+        self.cells = {}
+
+    def post(self, postings, key, number):
+        ids = postings.get(key)
+        if ids is None:
+            ids = postings[key] = array(TYPECODE)
+        ids.append(number)
+
+    def add(self, doc, offset):
+        """Index a document written at offset in the json file"""
+        number = len(self.offsets)
+        self.offsets.append(offset)
+        for key, value in doc.items():
+            self.post(self.keys, key, number)
+            if key in NESTED_KEYS and isinstance(value, dict):
+                for nested_key in value:
+                    self.post(self.keys, key + "." + nested_key, number)
+            if key not in UNINDEXED_VALUES and not isinstance(value, (dict, list)):
+                self.post(self.values.setdefault(key, {}), value, number)
+        for path in NESTED_VALUES:
+            value = get_path(doc, path)
+            if value is not None and not isinstance(value, (dict, list)):
+                self.post(self.values.setdefault(path, {}), value, number)
+        if "pos" in doc:
+            self.post(self.cells, cell_of(doc["pos"][0], doc["pos"][1], self.cell_size), number)
+
+    def write(self):
+        directory = index_dir(self.json_path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        catalog = {"documents": len(self.offsets),
+                   "cell_size": self.cell_size,
+                   "json_size": os.path.getsize(self.json_path),
+                   "json_mtime": os.path.getmtime(self.json_path)}
+        position = [0]
+        with io.open(os.path.join(directory, "postings.bin"), "wb") as fo:
+
+            def write_postings(ids):
+                fo.write(ids.tostring())
+                entry = [position[0], len(ids)]
+                position[0] += len(ids) * ids.itemsize
+                return entry
+
+            catalog["offsets"] = write_postings(self.offsets)
+            catalog["keys"] = dict((key, write_postings(ids)) for key, ids in self.keys.items())
+            catalog["values"] = dict((path, dict((value, write_postings(ids))
+                                                 for value, ids in values.items()))
+                                     for path, values in self.values.items())
+            catalog["cells"] = dict((cell, write_postings(ids)) for cell, ids in self.cells.items())
+        # The catalog is written last, an index without it is incomplete
+        with io.open(os.path.join(directory, "catalog.json"), "w", encoding="utf8") as fo:
+            fo.write(unicode(json.dumps(catalog, ensure_ascii=False)))
+
+
+def build(json_path, cell_size=CELL_SIZE):
+    """Build the indexes of a json output of process_map"""
+    builder = IndexBuilder(json_path, cell_size)
+    offset = 0
+    with io.open(json_path, "rb") as f:
+        for line in f:
+            if line.strip():
+                builder.add(json.loads(line), offset)
+            offset += len(line)
+    builder.write()
+    return builder
+
+def open_index(json_path, rebuild=True):
+    """The Index of a json file, built first if it is missing or outdated"""
+    path = os.path.join(index_dir(json_path), "catalog.json")
+    if rebuild:
+        outdated = True
+        if os.path.exists(path):
+            with io.open(path, "r", encoding="utf8") as f:
+                catalog = json.load(f)
+            outdated = (catalog["json_size"] != os.path.getsize(json_path)
+                        or catalog["json_mtime"] != os.path.getmtime(json_path))
+        if outdated:
+            build(json_path)
+    return Index(json_path)
+
+
+class Index(object):
+
+    def __init__(self, json_path):
+        self.json_path = json_path
+        directory = index_dir(json_path)
+        with io.open(os.path.join(directory, "catalog.json"), "r", encoding="utf8") as f:
+            self.catalog = json.load(f)
+        self.postings_file = open(os.path.join(directory, "postings.bin"), "rb")
+        if os.fstat(self.postings_file.fileno()).st_size:
+            self.postings = mmap.mmap(self.postings_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.postings = ""
+        self.offsets = self.read_postings(self.catalog["offsets"])
+        self.json_file = io.open(json_path, "rb")
+
+    def close(self):
+        if self.postings:
+            self.postings.close()
+        self.postings_file.close()
+        self.json_file.close()
+
+    def read_postings(self, entry):
+        ids = array(TYPECODE)
+        if entry is not None:
+            start, length = entry
+            ids.fromstring(self.postings[start:start + length * ids.itemsize])
+        return ids
+
+    def all(self):
+        return set(xrange(self.catalog["documents"]))
+
+    def with_key(self, path):
+        return set(self.read_postings(self.catalog["keys"].get(path)))
+
+    def with_value(self, path, value):
+        return set(self.read_postings(self.catalog["values"][path].get(value)))
+
+    def within(self, min_lat, min_lon, max_lat, max_lon):
+        # Nodes of the cells touching the box, checked by reading them
+        size = self.catalog["cell_size"]
+        candidates = set()
+        for i in xrange(int(math.floor(min_lat / size)), int(math.floor(max_lat / size)) + 1):
+            for j in xrange(int(math.floor(min_lon / size)), int(math.floor(max_lon / size)) + 1):
+                candidates.update(self.read_postings(self.catalog["cells"].get("{0},{1}".format(i, j))))
+        condition = {"$within": [min_lat, min_lon, max_lat, max_lon]}
+        return set(number for number in candidates
+                   if matches(self.doc(number).get("pos"), condition))
+
+    def doc(self, number):
+        self.json_file.seek(self.offsets[number])
+        return json.loads(self.json_file.readline())
+
+    def match(self, path, condition):
+        """Documents matching one condition, None if it isn't indexed"""
+        if isinstance(condition, dict):
+            if "$exists" in condition:
+                if "." not in path or path.split(".")[0] in NESTED_KEYS:
+                    matched = self.with_key(path)
+                    if condition["$exists"]:
+                        return matched
+                    return self.all() - matched
+                return None
+            if "$in" in condition and path in self.catalog["values"]:
+                matched = set()
+                for value in condition["$in"]:
+                    matched |= self.with_value(path, value)
+                return matched
+            if "$within" in condition and path == "pos":
+                return self.within(*condition["$within"])
+            return None
+        if path in self.catalog["values"]:
+            return self.with_value(path, condition)
+        if path in UNINDEXED_VALUES or "." in path:
+            return None
+        # A top level field without indexed values is never a scalar
+        return set()
+
+    def find(self, query=None):
+        numbers = None
+        unindexed = []
+        for path, condition in (query or {}).items():
+            matched = self.match(path, condition)
+            if matched is None:
+                unindexed.append((path, condition))
+            elif numbers is None:
+                numbers = matched
+            else:
+                numbers &= matched
+        if numbers is None:
+            numbers = self.all()
+        if unindexed:
+            numbers = set(number for number in numbers
+                          if all(matches(get_path(self.doc(number), path), condition)
+                                 for path, condition in unindexed))
+        return Query(self, numbers)
+
+
+def matches(value, condition):
+    # Check a condition on a value read from a document
+    if isinstance(condition, dict):
+        if "$exists" in condition:
+            return (value is not None) == bool(condition["$exists"])
+        if "$in" in condition:
+            return value in condition["$in"]
+        if "$within" in condition:
+            min_lat, min_lon, max_lat, max_lon = condition["$within"]
+            return value is not None and min_lat <= value[0] <= max_lat and min_lon <= value[1] <= max_lon
+    return value == condition
+
+
+class Query(object):
+
+    def __init__(self, index, numbers):
+        self.index = index
+        self.numbers = numbers
+
+    def count(self):
+        return len(self.numbers)
+
+    def docs(self, limit=None):
+        numbers = sorted(self.numbers)
+        if limit is not None:
+            numbers = numbers[:limit]
+        return [self.index.doc(number) for number in numbers]
+
+    def group_by(self, path, limit=None):
+        """[{"_id": value, "count": count}] sorted by count, as $group and $sort"""
+        counts = {}
+        values = self.index.catalog["values"].get(path, {})
+        # Intersect the postings of each value, unless there are less
+        # documents to read than values
+        if path in self.index.catalog["values"] and len(values) <= len(self.numbers):
+            for value, entry in values.items():
+                count = len(self.numbers.intersection(self.index.read_postings(entry)))
+                if count:
+                    counts[value] = count
+            missing = len(self.numbers) - sum(counts.values())
+            if missing:
+                counts[None] = missing
+        else:
+            for number in self.numbers:
+                value = get_path(self.index.doc(number), path)
+                counts[value] = counts.get(value, 0) + 1
+        items = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        if limit is not None:
+            items = items[:limit]
+        return [{"_id": value, "count": count} for value, count in items]
+
+    def distinct(self, path):
+        return sorted(item["_id"] for item in self.group_by(path) if item["_id"] is not None)
+
+
+if __name__ == "__main__":
+    db = open_index('example.osm.json')
+    print db.find({"type": "node"}).count()
+    print db.find({"name.en": {"$exists": 1}}).count()
+    print len(db.find().distinct("created.user"))
+    print db.find({"amenity": "bank"}).group_by("brand", 10)
@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file is the shared reader of the osm files used by all the other files.
+
+The function iter_elements yields every element of the map at its end event,
+so the children of an element ("tag", "nd", "member") are always yielded
+before the element itself, same as the iterative parsing of ElementTree.
+Once a top level element ("node", "way", "relation") has been yielded,
+it is freed, so the memory doesn't grow with the size of the file.
+
+Three backends can be selected:
+- "etree" : xml.etree.cElementTree iterparse (the default)
+- "expat" : a low level expat handler building light elements, which only
+            keep the children of the top level elements
+- "lxml"  : lxml.etree iterparse, only if lxml is installed
+- "cache" : the elements saved by a previous run in the cache directory
+            (see result_cache), the file is parsed by "etree" the first time.
+            Each top level element is saved by marshal as (tag, attributes,
+            [(child tag, child attributes)...]) into "<file hash>.tokens",
+            reading them back is much faster than parsing the xml
+
+All the backends yield objects with the same interface as far as this
+project uses it: "tag", "attrib" and "iter(tag)".
+
+iter_events is not a backend: it is an expat handler which creates no
+element at all and yields plain tuples for the top level elements, their
+tags and their node references only:
+- ("start", tag, attrib) : start of a "node", "way" or "relation"
+- ("tag", key, value)    : a "tag" child
+- ("nd", ref)            : a "nd" child
+- ("end", tag)           : end of a "node", "way" or "relation"
+It is faster than the "expat" backend, but still slower than "etree", whose
+parser builds the elements in C: on the synthetic map, counting the tag keys
+as tags.process_map does takes 1.22 s with iter_events against 1.17 s with
+"etree" (see benchmark_readers). So no entry point of this project uses it.
+
+The file names can also be compressed extracts, which are decompressed
+while they are read, without temporary files:
+- ".gz"  : gzip
+- ".bz2" : bzip2, decompressed in parallel by lbzip2 or pbzip2 if one of
+           them is installed, else by the bz2 module (all the streams of
+           a multi-stream file are read)
+- ".pbf" : OSM PBF format, decoded by osm_pbf whatever the backend
+"""
+
+import xml.etree.cElementTree as ET
+from xml.parsers import expat
+import bz2
+import gzip
+import marshal
+import os
+import pprint
+import subprocess
+import time
+from distutils.spawn import find_executable
+
+import osm_pbf
+import result_cache
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+TOP_LEVEL_TAGS = ["node", "way", "relation"]
+# Actions of an osm change file
+CHANGE_ACTIONS = ["create", "modify", "delete"]
+# Children of the top level elements, saved with them by the cache backend
+CHILD_TAGS = ["tag", "nd", "member"]
+
+# Size of the blocks fed to the expat parser
+BLOCK_SIZE = 64 * 1024
+
+DEFAULT_BACKEND = "etree"
+
+
+class Element(object):
+    """Light element built by the expat backend"""
+    __slots__ = ("tag", "attrib", "children")
+
+    def __init__(self, tag, attrib):
+        self.tag = tag
+        self.attrib = attrib
+        self.children = []
+
+    def iter(self, tag=None):
+        # Same order as ElementTree: the element itself, then its children
+        if tag is None or self.tag == tag:
+            yield self
+        for child in self.children:
+            for elem in child.iter(tag):
+                yield elem
+
+    def clear(self):
+        self.attrib = {}
+        self.children = []
+
+
+# Programs decompressing the bzip2 blocks in parallel
+PARALLEL_BZIP2 = ["lbzip2", "pbzip2"]
+
+
+class MultiStreamBZ2File(object):
+    """Read all the streams of a bzip2 file, the BZ2File of python 2
+    stops at the end of the first one"""
+
+    def __init__(self, f):
+        self.f = f
+        self.decompressor = bz2.BZ2Decompressor()
+        self.buffer = ""
+
+    def read(self, size=BLOCK_SIZE):
+        while len(self.buffer) < size:
+            data = self.f.read(BLOCK_SIZE)
+            if not data:
+                break
+            self.decompress(data)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def decompress(self, data):
+        while data:
+            try:
+                self.buffer += self.decompressor.decompress(data)
+            except EOFError:
+                # The previous stream is finished, start a new one
+                self.decompressor = bz2.BZ2Decompressor()
+                continue
+            # The data after the end of a stream starts the next one
+            data = self.decompressor.unused_data
+            if data:
+                self.decompressor = bz2.BZ2Decompressor()
+
+    def close(self):
+        self.f.close()
+
+
+class GzipInput(object):
+    """Gzip file read from a file object, both are closed together"""
+
+    def __init__(self, f):
+        self.f = f
+        self.gzip_file = gzip.GzipFile(fileobj=f, mode="rb")
+
+    def read(self, size=BLOCK_SIZE):
+        return self.gzip_file.read(size)
+
+    def close(self):
+        self.gzip_file.close()
+        self.f.close()
+
+
+class ProcessOutput(object):
+    """Output of a decompression program, read as a file"""
+
+    def __init__(self, args):
+        self.args = args
+        self.process = subprocess.Popen(args, stdout=subprocess.PIPE)
+        self.finished = False
+
+    def read(self, size=BLOCK_SIZE):
+        data = self.process.stdout.read(size)
+        if not data:
+            self.finished = True
+        return data
+
+    def close(self):
+        self.process.stdout.close()
+        code = self.process.wait()
+        # A program stopped before the end of its output is killed by
+        # SIGPIPE, it is only an error when the whole output was read
+        if code != 0 and self.finished:
+            raise IOError("{0} failed with exit code {1}".format(" ".join(self.args), code))
+
+
+def find_parallel_bzip2():
+    for program in PARALLEL_BZIP2:
+        path = find_executable(program)
+        if path:
+            return path
+    return None
+
+def open_source(source, metrics=None):
+    """
+    Return a file object and if it has to be closed by the reader.
+    With metrics, the bytes read from the input file are counted (except
+    when the file is decompressed by an external program).
+    """
+    if hasattr(source, "read"):
+        if metrics is not None:
+            return metrics.wrap(source), False
+        return source, False
+    if source.endswith(".bz2"):
+        program = find_parallel_bzip2()
+        if program:
+            return ProcessOutput([program, "-dc", source]), True
+    f = open(source, "rb")
+    if metrics is not None:
+        f = metrics.wrap(f)
+    if source.endswith(".gz"):
+        return GzipInput(f), True
+    if source.endswith(".bz2"):
+        return MultiStreamBZ2File(f), True
+    return f, True
+
+def is_pbf(source):
+    return not hasattr(source, "read") and source.endswith(".pbf")
+
+def iter_etree(f):
+    context = ET.iterparse(f, events=("start", "end"))
+    # The first start event gives the root element
+    _, root = next(context)
+    for event, elem in context:
+        if event == "end":
+            yield elem
+            # Free the finished element and its children
+            if elem.tag in TOP_LEVEL_TAGS:
+                elem.clear()
+                del root[:]
+
+def iter_expat(f):
+    finished = []
+    # Elements not yet finished, the first one is the root element
+    stack = []
+
+    def start(tag, attrib):
+        elem = Element(tag, attrib)
+        # Only the children of the top level elements are kept
+        if len(stack) > 1:
+            stack[-1].children.append(elem)
+        stack.append(elem)
+
+    def end(tag):
+        finished.append(stack.pop())
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    while True:
+        block = f.read(BLOCK_SIZE)
+        parser.Parse(block, not block)
+        for elem in finished:
+            yield elem
+        del finished[:]
+        if not block:
+            break
+
+def iter_events(source, metrics=None):
+    """Yield the event tuples of an osm file name or file object"""
+    f, to_close = open_source(source, metrics)
+    events = []
+    append = events.append
+
+    def start(tag, attrib):
+        if tag == "tag":
+            append(("tag", attrib.get("k"), attrib.get("v")))
+        elif tag == "nd":
+            append(("nd", attrib.get("ref")))
+        elif tag in TOP_LEVEL_TAGS:
+            append(("start", tag, attrib))
+
+    def end(tag):
+        if tag in TOP_LEVEL_TAGS:
+            append(("end", tag))
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    try:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            parser.Parse(block, not block)
+            for event in events:
+                yield event
+            del events[:]
+            if not block:
+                break
+    finally:
+        if to_close:
+            f.close()
+
+def iter_lxml(f):
+    for _, elem in lxml_etree.iterparse(f, events=("end",)):
+        yield elem
+        # Free the finished element and the previous ones
+        if elem.tag in TOP_LEVEL_TAGS:
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+BACKENDS = {"etree": iter_etree,
+            "expat": iter_expat,
+            "lxml": iter_lxml}
+
+def available_backends():
+    backends = ["etree", "expat"]
+    if lxml_etree is not None:
+        backends.append("lxml")
+    backends.append("cache")
+    return backends
+
+def iter_measured(elements, metrics):
+    # Count the elements and the time spent to parse them,
+    # the time spent by the caller between two elements isn't counted
+    start = time.time()
+    for elem in elements:
+        metrics.add_time("parse", time.time() - start)
+        metrics.element(elem.tag)
+        yield elem
+        start = time.time()
+
+def iter_elements(source, backend=DEFAULT_BACKEND, metrics=None):
+    """
+    Yield all the elements of an osm file name or file object.
+
+    The top level elements are cleared after being yielded, so they have
+    to be handled before asking for the next element.
+    With metrics (a metrics.Metrics), the elements, the parse time and the
+    bytes read are recorded.
+    """
+    if backend not in available_backends():
+        raise ValueError("Unknown or unavailable backend: {0}".format(backend))
+    if backend == "cache":
+        for elem in iter_cached_elements(source, metrics):
+            yield elem
+        return
+    f, to_close = open_source(source, metrics)
+    try:
+        if is_pbf(source):
+            elements = osm_pbf.iter_pbf(f)
+        else:
+            elements = BACKENDS[backend](f)
+        if metrics is not None:
+            elements = iter_measured(elements, metrics)
+            # The profiler runs around the whole loop of the caller
+            metrics.start_profile()
+        for elem in elements:
+            yield elem
+    finally:
+        if metrics is not None:
+            metrics.stop_profile()
+        if to_close:
+            f.close()
+
+def iter_top_level(source, backend=DEFAULT_BACKEND, metrics=None):
+    """Yield only the top level elements of an osm file"""
+    for elem in iter_elements(source, backend, metrics):
+        if elem.tag in TOP_LEVEL_TAGS:
+            yield elem
+
+def iter_changes(source):
+    """
+    Yield (action, element) for the top level elements of an osm change
+    file (.osc), action being "create", "modify" or "delete".
+    The elements are cleared after being yielded.
+    """
+    f, to_close = open_source(source)
+    try:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        action = None
+        for event, elem in context:
+            if event == "start":
+                if elem.tag in CHANGE_ACTIONS:
+                    action = elem
+            elif elem.tag in TOP_LEVEL_TAGS and action is not None:
+                yield action.tag, elem
+                # Free the finished element
+                elem.clear()
+                del action[:]
+            elif elem.tag in CHANGE_ACTIONS:
+                action = None
+                del root[:]
+    finally:
+        if to_close:
+            f.close()
+
+
+########################### TOKENS ########################################
+
+def to_record(elem):
+    children = [(child.tag, dict(child.attrib)) for child in elem.iter() if child is not elem]
+    return elem.tag, dict(elem.attrib), children
+
+def from_record(record):
+    tag, attrib, children = record
+    elem = Element(tag, attrib)
+    elem.children = [Element(child_tag, child_attrib)
+                     for child_tag, child_attrib in children]
+    return elem
+
+def iter_records(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield marshal.load(f)
+            except EOFError:
+                return
+
+def iter_replayed(path):
+    # Same order as the parsers: the children, then the element
+    for record in iter_records(path):
+        elem = from_record(record)
+        for child in elem.children:
+            yield child
+        yield elem
+
+def iter_recorded(filename, path, metrics=None):
+    # Parse the file and save its elements into the tokens entry
+    complete = False
+    fo = open(path + ".tmp", "wb")
+    try:
+        for elem in iter_elements(filename, DEFAULT_BACKEND, metrics):
+            if elem.tag not in CHILD_TAGS:
+                marshal.dump(to_record(elem), fo)
+            yield elem
+        complete = True
+    finally:
+        fo.close()
+        if complete:
+            result_cache.commit(path)
+        else:
+            result_cache.discard(path)
+
+def iter_cached_elements(filename, metrics=None):
+    """
+    Same as iter_elements, the elements come from the tokens entry of the
+    file if there is one, else it is written while the file is parsed.
+    """
+    if hasattr(filename, "read"):
+        # No name to hash, parse the file object
+        return iter_elements(filename, DEFAULT_BACKEND, metrics)
+    path = os.path.join(result_cache.cache_dir(filename),
+                        "{0}.tokens".format(result_cache.file_hash(filename)))
+    if not os.path.exists(path):
+        return iter_recorded(filename, path, metrics)
+    elements = iter_replayed(path)
+    if metrics is not None:
+        elements = iter_measured(elements, metrics)
+    return elements
+
+
+if __name__ == "__main__":
+    pprint.pprint(available_backends())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file runs the stages of a processing in threads linked by bounded
+queues, so reading the file, shaping the documents and writing them can
+overlap (the threads wait for the disk without holding the interpreter).
+
+Each stage is a function reading the items of its input queue and putting
+its results into its output queue:
+
+    reader --> [parsed] --> shaper --> [encoded] --> writer
+
+The queues are bounded, so a fast stage waits for the slower one after
+it (backpressure) and the memory stays bounded by the size of the queues.
+
+A MeasuredQueue records its depth each time an item is put and the time
+spent waiting by its producer (the queue was full) and by its consumer
+(the queue was empty). A stage whose input queue is mostly full and whose
+output queue is mostly empty is the bottleneck.
+
+When a stage fails, the pipeline sets its "stopped" event, shared by all
+the queues. The stages waiting on a queue check it every POLL_INTERVAL
+seconds and raise Stopped, nothing is put into the queues to wake them up.
+"""
+
+from Queue import Queue, Empty, Full
+import sys
+import threading
+import time
+
+# Number of batches kept in each queue
+QUEUE_SIZE = 8
+# Seconds between two checks of the stopped event by a waiting stage
+POLL_INTERVAL = 0.1
+
+# Put at the end of the items
+END = None
+
+
+class Stopped(Exception):
+    """Raised in a stage waiting on a queue when another stage has failed"""
+
+
+class MeasuredQueue(object):
+
+    def __init__(self, name, maxsize=QUEUE_SIZE, stopped=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.queue = Queue(maxsize)
+        self.puts = 0
+        self.depth_total = 0
+        self.depth_max = 0
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+        if stopped is None:
+            stopped = threading.Event()
+        self.stopped = stopped
+
+    def put(self, item):
+        depth = self.queue.qsize()
+        self.puts += 1
+        self.depth_total += depth
+        self.depth_max = max(self.depth_max, depth)
+        if self.stopped.is_set():
+            raise Stopped()
+        try:
+            self.queue.put_nowait(item)
+            return
+        except Full:
+            pass
+        start = time.time()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(item, timeout=POLL_INTERVAL)
+                    return
+                except Full:
+                    pass
+            raise Stopped()
+        finally:
+            self.put_wait += time.time() - start
+
+    def get(self):
+        if self.stopped.is_set():
+            raise Stopped()
+        try:
+            return self.queue.get_nowait()
+        except Empty:
+            pass
+        start = time.time()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    return self.queue.get(timeout=POLL_INTERVAL)
+                except Empty:
+                    pass
+            raise Stopped()
+        finally:
+            self.get_wait += time.time() - start
+
+    def __iter__(self):
+        # The items until END
+        while True:
+            item = self.get()
+            if item is END:
+                return
+            yield item
+
+    def stats(self):
+        return {"size": self.maxsize,
+                "mean_depth": self.depth_total / float(max(self.puts, 1)),
+                "max_depth": self.depth_max,
+                "producer_wait_seconds": self.put_wait,
+                "consumer_wait_seconds": self.get_wait}
+
+
+class Pipeline(object):
+
+    def __init__(self):
+        self.threads = []
+        self.queues = []
+        self.seconds = {}
+        self.error = None
+        self.stopped = threading.Event()
+
+    def queue(self, name, maxsize=QUEUE_SIZE):
+        queue = MeasuredQueue(name, maxsize, self.stopped)
+        self.queues.append(queue)
+        return queue
+
+    def stage(self, name, function, *args):
+        """Run function(*args) in a thread, the last arg being its output queue"""
+        output = args[-1] if args and isinstance(args[-1], MeasuredQueue) else None
+
+        def run():
+            start = time.time()
+            try:
+                function(*args)
+                if output is not None:
+                    output.put(END)
+            except Stopped:
+                pass
+            except BaseException:
+                if self.error is None:
+                    self.error = sys.exc_info()
+                # Stop the stages waiting on the queues
+                self.stopped.set()
+            finally:
+                self.seconds[name] = time.time() - start
+
+        thread = threading.Thread(target=run, name=name)
+        thread.daemon = True
+        self.threads.append(thread)
+
+    def run(self):
+        for thread in self.threads:
+            thread.start()
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def stats(self):
+        return {"stage_seconds": dict(self.seconds),
+                "queues": dict((queue.name, queue.stats()) for queue in self.queues)}
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file keeps the results of the previous runs in a cache directory, so
+rerunning the audit or the transform after changing the cleaning rules
+doesn't parse the xml file again.
+
+The entries of the cache are named after the content of their inputs:
+- "<file hash>.tokens" : the top level elements of an osm file, written and
+  read by the "cache" backend of osm_reader, so any entry point can use them
+- "<file hash>-<rules hash>.json" : the output of data_shanghai.process_map,
+  the rules hash being computed from the cleaning rules, so only the runs
+  whose rules have changed shape the documents again. "<entry>.meta" keeps
+  the number of documents of the output, so a run reusing it doesn't read
+  it back. Only the MAX_RESULTS most recently used outputs are kept, the
+  older ones are removed when a new one is stored.
+
+The hash of a file is the sha1 of its content. It is kept in "hashes.json"
+with the size and the modification time of the file, so an unchanged file
+is read only once.
+
+The cache directory is "$OSM_CACHE_DIR", or ".osm_cache" beside the file.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+
+# Changed when the format of the entries changes
+CACHE_VERSION = "2"
+HASH_BLOCK_SIZE = 1024 * 1024
+# Number of outputs kept in a cache directory
+MAX_RESULTS = 10
+
+result_name_re = re.compile(r'^[0-9a-f]{40}-[0-9a-f]{40}\.\w+$')
+
+def cache_dir(filename):
+    directory = os.environ.get("OSM_CACHE_DIR")
+    if directory is None:
+        directory = os.path.join(os.path.dirname(os.path.abspath(filename)), ".osm_cache")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return directory
+
+def hash_values(*values):
+    # sha1 of the json of the values
+    sha1 = hashlib.sha1(CACHE_VERSION)
+    for value in values:
+        sha1.update(json.dumps(value, sort_keys=True))
+    return sha1.hexdigest()
+
+def file_hash(filename):
+    """sha1 of the content of a file, only computed again if it has changed"""
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    index_path = os.path.join(cache_dir(filename), "hashes.json")
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    known = index.get(path)
+    if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime:
+        return known[2]
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            sha1.update(block)
+    index[path] = [stat.st_size, stat.st_mtime, sha1.hexdigest()]
+    with open(index_path + ".tmp", "w") as fo:
+        json.dump(index, fo)
+    os.rename(index_path + ".tmp", index_path)
+    return index[path][2]
+
+def commit(path):
+    # An entry is only visible once it is complete
+    os.rename(path + ".tmp", path)
+
+def discard(path):
+    if os.path.exists(path + ".tmp"):
+        os.remove(path + ".tmp")
+
+
+########################### RESULTS #######################################
+
+def result_path(filename, rules_hash, extension="json"):
+    return os.path.join(cache_dir(filename), "{0}-{1}.{2}".format(
+        file_hash(filename), rules_hash, extension))
+
+def fetch(path, file_out):
+    """
+    Copy a cached result to file_out, return its number of documents, or
+    None if there is none
+    """
+    if not os.path.exists(path) or not os.path.exists(path + ".meta"):
+        return None
+    with open(path + ".meta", "r") as f:
+        meta = json.load(f)
+    shutil.copyfile(path, file_out + ".tmp")
+    os.rename(file_out + ".tmp", file_out)
+    # The modification time gives the last use, for evict
+    os.utime(path, None)
+    return meta["documents"]
+
+def store(file_out, path, documents, max_results=MAX_RESULTS):
+    """Save file_out, of the given number of documents, as a cached result"""
+    with open(path + ".meta.tmp", "w") as fo:
+        json.dump({"documents": documents}, fo)
+    commit(path + ".meta")
+    shutil.copyfile(file_out, path + ".tmp")
+    commit(path)
+    evict(os.path.dirname(path), max_results)
+
+def evict(directory, max_results=MAX_RESULTS):
+    """Remove the least recently used results beyond max_results"""
+    results = [os.path.join(directory, name) for name in os.listdir(directory)
+               if result_name_re.match(name)]
+    results.sort(key=os.path.getmtime, reverse=True)
+    for path in results[max_results:]:
+        os.remove(path)
+        if os.path.exists(path + ".meta"):
+            os.remove(path + ".meta")
+
+
+if __name__ == "__main__":
+    print file_hash('example.osm')
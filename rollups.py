@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file computes the overview statistics of the README while the
+documents are shaped, instead of querying MongoDB afterwards.
+
+For each shaped document, StatsRollup.add updates:
+- the number of documents, nodes and ways
+                        (db.osm.find({"type":"node"}).count() ...)
+- the documents with a name, an English name and a phone
+                        (db.osm.find({"name.en":{"$exists":1}}).count() ...)
+- the number of documents by user, which gives the number of unique users
+  and the top contributors
+                        (db.osm.distinct("created.user").length ...)
+- the breakdown of "created_by" and "source"
+- the banks by "brand", or by "name.main" if the brand isn't known
+                        (db.osm.aggregate([{"$match":{"amenity":"bank"}}, ...]))
+
+summary() gives all of them as a dictionary, which process_map writes into
+"<file_in>.stats.json".
+"""
+
+from collections import defaultdict
+import io
+import json
+
+# Number of values kept in the top lists of the summary
+TOP = 10
+
+def top_counts(counts, n=TOP):
+    items = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+    return [{"_id": key, "count": count} for key, count in items]
+
+
+class StatsRollup(object):
+
+    def __init__(self):
+        self.documents = 0
+        self.types = defaultdict(int)
+        self.with_name = 0
+        self.with_name_en = 0
+        self.with_phone = 0
+        self.users = defaultdict(int)
+        self.created_by = defaultdict(int)
+        self.sources = defaultdict(int)
+        self.banks = defaultdict(int)
+
+    def add(self, doc):
+        self.documents += 1
+        self.types[doc["type"]] += 1
+        if "name" in doc:
+            self.with_name += 1
+            if "en" in doc["name"]:
+                self.with_name_en += 1
+        if "phone" in doc:
+            self.with_phone += 1
+        user = doc["created"].get("user")
+        if user is not None:
+            self.users[user] += 1
+        if "created_by" in doc:
+            self.created_by[doc["created_by"]] += 1
+        if "source" in doc:
+            self.sources[doc["source"]] += 1
+        if doc.get("amenity") == "bank":
+            self.banks[doc.get("brand", doc.get("name", {}).get("main"))] += 1
+
+    def summary(self, n=TOP):
+        return {"documents": self.documents,
+                "nodes": self.types["node"],
+                "ways": self.types["way"],
+                "with_name": self.with_name,
+                "with_name_en": self.with_name_en,
+                "with_phone": self.with_phone,
+                "unique_users": len(self.users),
+                "top_users": top_counts(self.users, n),
+                "top_created_by": top_counts(self.created_by, n),
+                "top_sources": top_counts(self.sources, n),
+                "top_banks": top_counts(self.banks, n)}
+
+    def write(self, path):
+        with io.open(path, "w", encoding="utf8") as fo:
+            fo.write(unicode(json.dumps(self.summary(), ensure_ascii=False,
+                                        indent=2, sort_keys=True)))
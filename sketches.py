@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file provides fixed memory summaries of streams of values.
+
+SpaceSaving keeps the approximate top k most frequent values of a stream
+(the "Space-Saving" heavy hitters algorithm of Metwally et al.):
+- at most k values are tracked, whatever the number of distinct values
+- a value seen for the first time when k values are already tracked
+  replaces the least frequent one, and inherits its count as "error"
+- the count of a tracked value is never below its real count, and never
+  above its real count + error
+- a few examples (element id, value) are kept for each tracked value
+- the least frequent value is found with a heap of (count, value), which
+  is only updated when a value is replaced: an entry whose count is
+  outdated is pushed back with the current count, so adding a tracked
+  value is only an increment
+
+HyperLogLog estimates the number of distinct values of a stream (Flajolet
+et al.) in a fixed memory of 2^p one byte registers:
+- each value is hashed on 64 bits, the first p bits select a register which
+  keeps the maximum rank of the first 1 bit in the other bits
+- the standard error of the estimate is about 1.04 / sqrt(2^p), so 0.8%
+  with the default p = 14 (16 KB), whatever the number of values
+"""
+
+import hashlib
+import heapq
+import math
+import struct
+import sys
+
+
+class SpaceSaving(object):
+
+    def __init__(self, k=100, examples=3):
+        self.k = k
+        self.max_examples = examples
+        # Total number of values seen
+        self.total = 0
+        # value -> [count, error, examples]
+        self.counters = {}
+        # (count, value) of each tracked value, the count being at most
+        # the current one
+        self.heap = []
+
+    def pop_smallest(self):
+        # Remove the least frequent value from the heap, return its count
+        while True:
+            count, key = heapq.heappop(self.heap)
+            current = self.counters[key][0]
+            if current == count:
+                del self.counters[key]
+                return count
+            heapq.heappush(self.heap, (current, key))
+
+    def add(self, key, value=None, elem_id=None):
+        self.total += 1
+        counter = self.counters.get(key)
+        if counter is None:
+            if len(self.counters) < self.k:
+                counter = [0, 0, []]
+            else:
+                # Replace the least frequent value
+                count = self.pop_smallest()
+                counter = [count, count, []]
+            self.counters[key] = counter
+            counter[0] += 1
+            heapq.heappush(self.heap, (counter[0], key))
+        else:
+            counter[0] += 1
+        if len(counter[2]) < self.max_examples:
+            counter[2].append({"id": elem_id, "value": value})
+
+    def __len__(self):
+        return len(self.counters)
+
+    def __iter__(self):
+        return iter(self.counters)
+
+    def top(self, n=None):
+        """The tracked values, the most frequent first"""
+        items = sorted(self.counters.items(), key=lambda item: (-item[1][0], item[0]))
+        if n is not None:
+            items = items[:n]
+        return [{"value": key, "count": counter[0], "error": counter[1],
+                 "examples": counter[2]}
+                for key, counter in items]
+
+    def size(self):
+        # Bytes of the counters and of the heap, without the values themselves
+        return (sys.getsizeof(self.counters) + sys.getsizeof(self.heap)
+                + sum(sys.getsizeof(c) for c in self.counters.values())
+                + sum(sys.getsizeof(entry) for entry in self.heap))
+
+
+class HyperLogLog(object):
+
+    def __init__(self, p=14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value):
+        if isinstance(value, unicode):
+            value = value.encode("utf8")
+        x = struct.unpack("<Q", hashlib.md5(str(value)).digest()[:8])[0]
+        index = x >> (64 - self.p)
+        # Rank of the first 1 bit in the remaining 64 - p bits
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = 64 - self.p - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        for i in xrange(self.m):
+            if other.registers[i] > self.registers[i]:
+                self.registers[i] = other.registers[i]
+
+    def count(self):
+        """Estimated number of distinct values"""
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(b"\x00")
+        # Small cardinalities: linear counting of the empty registers
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / float(zeros))
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+    def size(self):
+        # Bytes of the registers
+        return len(self.registers)
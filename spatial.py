@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file extracts a bounding box of the map and splits the shaped documents
+into spatial tiles, while the map is parsed.
+
+- the nodes outside of the bounding box are dropped before being shaped,
+  so their tags are never cleaned
+- the ways are kept if at least one of their nodes is kept, and they are
+  put into the tile where most of their kept nodes are
+- the positions of the kept nodes are stored in a node_index file, to find
+  the nodes of the ways without keeping them in a dictionary
+
+Two tilings are available:
+- GridTiling(size) : a fixed grid of size x size degrees, tile "row_col"
+- QuadkeyTiling(zoom) : the quadkeys of the web map tiles at a zoom level
+
+The documents of each tile are written into "<file_in>.<tile>.json". With
+a tiling, the ways none of whose nodes are in the map can't be placed, they
+are written into "<file_in>.unplaced.json".
+"""
+
+from collections import OrderedDict
+import io
+import math
+import pprint
+
+import data_shanghai
+import node_index
+import osm_reader
+
+# Tile of the ways without any known node
+UNPLACED = "unplaced"
+# Number of tile files kept open at the same time
+MAX_OPEN_FILES = 64
+
+
+class GridTiling(object):
+    def __init__(self, size):
+        self.size = size
+
+    def key(self, lat, lon):
+        row = int(math.floor(lat / self.size))
+        col = int(math.floor(lon / self.size))
+        return "{0}_{1}".format(row, col)
+
+
+class QuadkeyTiling(object):
+    def __init__(self, zoom):
+        self.zoom = zoom
+
+    def key(self, lat, lon):
+        # Web mercator tile of the position, as in the Bing maps tile system
+        n = 2 ** self.zoom
+        lat = max(min(lat, 85.05112878), -85.05112878)
+        sin_lat = math.sin(math.radians(lat))
+        x = int((lon + 180.0) / 360.0 * n)
+        y = int((0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * n)
+        x = max(min(x, n - 1), 0)
+        y = max(min(y, n - 1), 0)
+        digits = []
+        for i in range(self.zoom, 0, -1):
+            mask = 1 << (i - 1)
+            digit = 0
+            if x & mask:
+                digit += 1
+            if y & mask:
+                digit += 2
+            digits.append(str(digit))
+        return "".join(digits)
+
+
+def in_bbox(lat, lon, bbox):
+    # bbox is [min_lat, min_lon, max_lat, max_lon]
+    return bbox[0] <= lat <= bbox[2] and bbox[1] <= lon <= bbox[3]
+
+def most_common(keys):
+    # Most common key, the first one seen in case of a tie
+    counts = {}
+    best = None
+    for key in keys:
+        counts[key] = counts.get(key, 0) + 1
+        if best is None or counts[key] > counts[best]:
+            best = key
+    return best
+
+def iter_tiled(file_in, bbox=None, tiling=None, backend=osm_reader.DEFAULT_BACKEND):
+    """
+    Yield (tile, document) for the nodes and ways in the bounding box.
+    The tile is None if no tiling is given, UNPLACED for the ways whose
+    nodes are all missing.
+    """
+    builder = node_index.NodeIndexBuilder("{0}.nodes.idx".format(file_in))
+    index = None
+    for element in osm_reader.iter_top_level(file_in, backend):
+        if element.tag == "node":
+            lat = float(element.attrib["lat"])
+            lon = float(element.attrib["lon"])
+            # Drop the node before cleaning its tags
+            if bbox is not None and not in_bbox(lat, lon, bbox):
+                continue
+            if index is None:
+                builder.add(int(element.attrib["id"]), lat, lon)
+            tile = None
+            if tiling is not None:
+                tile = tiling.key(lat, lon)
+        elif element.tag == "way":
+            if index is None:
+                index = builder.finish()
+            positions = []
+            for nd in element.iter("nd"):
+                pos = index.lookup(int(nd.attrib["ref"]))
+                if pos is not None:
+                    positions.append(pos)
+            # Drop the way if none of its nodes is kept
+            if bbox is not None and not positions:
+                continue
+            tile = None
+            if tiling is not None:
+                if positions:
+                    tile = most_common(tiling.key(lat, lon) for lat, lon in positions)
+                else:
+                    tile = UNPLACED
+        else:
+            continue
+        el = data_shanghai.shape_element(element)
+        if el:
+            yield tile, el
+    if index is None:
+        index = builder.finish()
+    index.close()
+
+class TileFiles(object):
+    """
+    The output files of the tiles, the least recently used one being closed
+    when more than max_open are open. A closed file is opened again in
+    append mode.
+    """
+
+    def __init__(self, file_in, max_open=MAX_OPEN_FILES):
+        self.file_in = file_in
+        self.max_open = max_open
+        self.files = OrderedDict()
+        self.counts = {}
+
+    def path(self, tile):
+        if tile is None:
+            return "{0}.json".format(self.file_in)
+        return "{0}.{1}.json".format(self.file_in, tile)
+
+    def get(self, tile):
+        fo = self.files.pop(tile, None)
+        if fo is None:
+            if len(self.files) >= self.max_open:
+                self.files.popitem(last=False)[1].close()
+            mode = "a" if tile in self.counts else "w"
+            fo = io.open(self.path(tile), mode, encoding="utf8")
+            self.counts.setdefault(tile, 0)
+        self.files[tile] = fo
+        return fo
+
+    def write(self, tile, line):
+        self.get(tile).write(line)
+        self.counts[tile] += 1
+
+    def close(self):
+        for fo in self.files.values():
+            fo.close()
+        self.files.clear()
+
+
+def process_map_tiles(file_in, bbox=None, tiling=None, backend=osm_reader.DEFAULT_BACKEND,
+                      max_open=MAX_OPEN_FILES):
+    """
+    Write the documents of each tile into "<file_in>.<tile>.json", or into
+    "<file_in>.json" without tiling. Returns the number of documents by tile.
+    """
+    files = TileFiles(file_in, max_open)
+    try:
+        for tile, el in iter_tiled(file_in, bbox, tiling, backend):
+            files.write(tile, data_shanghai.to_json_line(el))
+    finally:
+        files.close()
+    return files.counts
+
+
+if __name__ == "__main__":
+    # Puxi, cut into tiles of 0.05 degrees
+    counts = process_map_tiles('example.osm', bbox=[31.15, 121.40, 31.30, 121.50],
+                               tiling=GridTiling(0.05))
+    pprint.pprint(counts)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file generates synthetic osm files which look like the Shanghai extract,
+to test and benchmark the project without the real 351 MB file.
+
+The distributions follow what we found in the Shanghai data:
+- about 9 nodes for 1 way, all the nodes before the ways, sorted by id
+- most of the nodes without tags, the ways with 2 to 20 "nd" references
+- a few hundred users, one of them (XBear) with a large part of the elements
+- "source" (mostly PGS) and "created_by" (mostly almien_coastlines) tags
+- "name", "name:en" and "name:zh" mixing Chinese and English, and banks
+  written in different ways (工商银行, 中国工商银行, ICBC...)
+- "addr:*" tags with the messy values described in the README, like
+  "201315 上海", "20032", "浦建路207弄", "NO.588 binhe road", "26号",
+  "1366～1370", "103;104" or "+8657584601405"
+- a few keys with problematic characters or with two ":"
+
+The same seed always gives the same file.
+
+Usage: python synthetic_osm.py [file.osm] [elements]
+"""
+
+import io
+import random
+import sys
+from xml.sax.saxutils import quoteattr
+
+# Bounding box of Shanghai
+MIN_LAT, MAX_LAT = 30.7, 31.87
+MIN_LON, MAX_LON = 120.85, 122.2
+
+NODES_PER_WAY = 9
+
+def u(s):
+    return s.decode("utf8")
+
+CITIES = [u("上海"), u("上海市"), "Shanghai", "Shanghai Shi",
+          "Huinanzhen, Pudong, Shanghai", "Hangzhou", "Wuxi"]
+STREETS = [u("浦建路207弄"), u("南京东路"), u("淮海中路"), u("世纪大道"),
+           "NO.588 binhe road", "Huaihai Rd.", "Century Avenue", "Zhongshan Rd",
+           "Nanjing Road (W)", "Hongqiao Lu"]
+POSTCODES = ["200100", "200032", "201315", u("201315 上海"), "20032", "21351",
+             "312044", "310014"]
+HOUSENUMBERS = ["12", "588", "26-28", u("26号"), u("72弄"), u("1366～1370"),
+                "103;104", "+8657584601405", "U2cake"]
+NAMES = [u("新白鹿酒店"), u("人民广场"), u("静安寺"), u("闻涛路KFC"),
+         u("浙江出版联合集团大楼Zhejiang publishing united group"),
+         u("新白鹿酒店 New White Deer Restaurant"), "Starbucks", "Family Mart"]
+NAMES_EN = ["New White Deer Restaurant", "People's Square", "Jing'an Temple",
+            "Nanjing Rd", "Huaihai Road (W.)", u("静安寺"), "Century Ave"]
+NAMES_ZH = [u("新白鹿酒店"), u("人民广场"), u("静安寺"), "Jing An Temple"]
+BANKS = [u("中国银行"), u("工商银行"), u("中国工商银行"), "ICBC", u("农业银行"),
+         u("中国农业银行"), u("建设银行"), u("中国建设银行"), u("招商银行")]
+AMENITIES = ["restaurant", "cafe", "school", "parking", "toilets", "fuel"]
+SOURCES = ["PGS"] * 16 + ["Bing"] * 3 + ["bing", "GPS"]
+CREATED_BY = ["almien_coastlines"] * 20 + ["JOSM"] * 5 + ["Potlatch 0.10f"]
+OTHER_TAGS = [("highway", "residential"), ("highway", "primary"),
+              ("building", "yes"), ("natural", "coastline"), ("phone", "+86 21 6321 1234"),
+              ("fixme key", "x"), ("addr:street:name", "x"), ("name:zh:pinyin", "x")]
+
+def make_users(rnd, count=1200):
+    # Zipf like weights, the first user is XBear
+    users = [("42", "XBear")]
+    for i in range(1, count):
+        users.append((str(100000 + i * 37), "user{0}".format(i)))
+    weights = [1.0 / (i + 1) for i in range(count)]
+    total = sum(weights)
+    cumulative = []
+    acc = 0.0
+    for w in weights:
+        acc += w / total
+        cumulative.append(acc)
+    return users, cumulative
+
+def pick_user(rnd, users, cumulative):
+    x = rnd.random()
+    low, high = 0, len(cumulative) - 1
+    while low < high:
+        mid = (low + high) // 2
+        if cumulative[mid] < x:
+            low = mid + 1
+        else:
+            high = mid
+    return users[low]
+
+def random_tags(rnd, is_way):
+    tags = []
+    # Most of the nodes have no tags at all
+    if not is_way and rnd.random() > 0.1:
+        return tags
+    if rnd.random() < 0.5:
+        tags.append(("source", rnd.choice(SOURCES)))
+    if rnd.random() < 0.2:
+        tags.append(("created_by", rnd.choice(CREATED_BY)))
+    if rnd.random() < 0.3:
+        if rnd.random() < 0.1:
+            tags.append(("amenity", "bank"))
+            tags.append(("name", rnd.choice(BANKS)))
+        else:
+            if rnd.random() < 0.3:
+                tags.append(("amenity", rnd.choice(AMENITIES)))
+            tags.append(("name", rnd.choice(NAMES)))
+        if rnd.random() < 0.5:
+            tags.append(("name:en", rnd.choice(NAMES_EN)))
+        if rnd.random() < 0.3:
+            tags.append(("name:zh", rnd.choice(NAMES_ZH)))
+    if rnd.random() < 0.1:
+        tags.append(("addr:city", rnd.choice(CITIES)))
+        tags.append(("addr:street", rnd.choice(STREETS)))
+        if rnd.random() < 0.7:
+            tags.append(("addr:postcode", rnd.choice(POSTCODES)))
+        if rnd.random() < 0.7:
+            tags.append(("addr:housenumber", rnd.choice(HOUSENUMBERS)))
+    if rnd.random() < 0.3:
+        tags.append(rnd.choice(OTHER_TAGS))
+    return tags
+
+def attributes(element_id, user, rnd):
+    uid, name = user
+    return u'id="{0}" version="{1}" timestamp="20{2:02d}-{3:02d}-{4:02d}T{5:02d}:{6:02d}:{7:02d}Z" ' \
+           u'changeset="{8}" uid="{9}" user={10}'.format(
+               element_id, rnd.randint(1, 5), rnd.randint(8, 15), rnd.randint(1, 12),
+               rnd.randint(1, 28), rnd.randint(0, 23), rnd.randint(0, 59),
+               rnd.randint(0, 59), rnd.randint(1, 30000000), uid, quoteattr(name))
+
+def write_tags(fo, tags):
+    for k, v in tags:
+        fo.write(u'\t\t<tag k={0} v={1}/>\n'.format(quoteattr(k), quoteattr(v)))
+
+def generate(filename, elements=100000, seed=0):
+    """Write a synthetic osm file of about the given number of elements"""
+    rnd = random.Random(seed)
+    users, cumulative = make_users(rnd)
+    ways = max(1, elements // (NODES_PER_WAY + 1))
+    nodes = elements - ways
+    first_node = 1000000
+    with io.open(filename, "w", encoding="utf8") as fo:
+        fo.write(u"<?xml version='1.0' encoding='UTF-8'?>\n")
+        fo.write(u'<osm version="0.6" generator="synthetic_osm">\n')
+        fo.write(u'\t<bounds minlat="{0}" minlon="{1}" maxlat="{2}" maxlon="{3}"/>\n'.format(
+            MIN_LAT, MIN_LON, MAX_LAT, MAX_LON))
+        for i in xrange(nodes):
+            attrs = attributes(first_node + i, pick_user(rnd, users, cumulative), rnd)
+            lat = rnd.uniform(MIN_LAT, MAX_LAT)
+            lon = rnd.uniform(MIN_LON, MAX_LON)
+            tags = random_tags(rnd, False)
+            position = u'lat="{0:.7f}" lon="{1:.7f}"'.format(lat, lon)
+            if tags:
+                fo.write(u'\t<node {0} {1}>\n'.format(attrs, position))
+                write_tags(fo, tags)
+                fo.write(u'\t</node>\n')
+            else:
+                fo.write(u'\t<node {0} {1}/>\n'.format(attrs, position))
+        for i in xrange(ways):
+            attrs = attributes(100000000 + i, pick_user(rnd, users, cumulative), rnd)
+            fo.write(u'\t<way {0}>\n'.format(attrs))
+            start = rnd.randint(0, max(0, nodes - 20))
+            for ref in xrange(start, min(nodes, start + rnd.randint(2, 20))):
+                fo.write(u'\t\t<nd ref="{0}"/>\n'.format(first_node + ref))
+            write_tags(fo, random_tags(rnd, True))
+            fo.write(u'\t</way>\n')
+        fo.write(u'</osm>\n')
+    return nodes + ways
+
+
+if __name__ == "__main__":
+    # Never written over the real extract by default
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'synthetic.osm'
+    elements = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    print generate(filename, elements), "elements written into", filename
@@ -8,10 +8,11 @@ We use 3 regular expressions to check for certain patterns in the tags.
 We would like to see if we have tags like "addr:street", "name:en" and
 if we have any tags with problematic characters.
 """
-import xml.etree.ElementTree as ET
 import pprint
 import re
 
+import osm_reader
+
 #regular expression
 lower = re.compile(r'^([a-z]|_)*$')
 lower_colon = re.compile(r'^([a-z]|_)*:([a-z]|_)*$')
@@ -37,14 +38,14 @@ def key_type(element, keys):
             
     return keys
 
-def process_map(filename):
+def process_map(filename, backend=osm_reader.DEFAULT_BACKEND, metrics=None):
     # initialise the keys dictionary
     keys = {"lower": 0,
             "lower_colon": 0,
             "problemchars": 0,
             "other": 0}
     # iterative parsing
-    for _, element in ET.iterparse(filename):
+    for element in osm_reader.iter_elements(filename, backend, metrics):
         keys = key_type(element, keys)
 
     return keys   
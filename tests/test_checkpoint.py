@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the checkpointed processing of data_shanghai.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import data_shanghai
+import osm_chunks
+import synthetic_osm
+
+CHUNK_SIZE = 32 * 1024
+
+
+EMPTY_OSM = b"""<?xml version='1.0' encoding='UTF-8'?>
+<osm version="0.6">
+ <bounds minlat="30.7" minlon="120.85" maxlat="31.87" maxlon="122.2"/>
+</osm>
+"""
+
+
+class Crash(Exception):
+    pass
+
+
+def read(path):
+    with io.open(path, "rb") as f:
+        return f.read()
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.osm = os.path.join(self.directory, "small.osm")
+        self.json = self.osm + ".json"
+        self.checkpoint = self.json + ".checkpoint"
+        synthetic_osm.generate(self.osm, 2000)
+        data_shanghai.process_map(self.osm)
+        self.expected = read(self.json)
+        os.remove(self.json)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def interrupt(self, after):
+        # Run until the shaping of the element number after
+        shape_element = data_shanghai.shape_element
+        calls = []
+
+        def crashing_shape(element, *args):
+            calls.append(1)
+            if len(calls) == after:
+                raise Crash()
+            return shape_element(element, *args)
+
+        data_shanghai.shape_element = crashing_shape
+        try:
+            self.assertRaises(Crash, data_shanghai.process_map_checkpointed,
+                              self.osm, chunk_size=CHUNK_SIZE)
+        finally:
+            data_shanghai.shape_element = shape_element
+
+    def test_uninterrupted(self):
+        count = data_shanghai.process_map_checkpointed(self.osm, chunk_size=CHUNK_SIZE)
+        self.assertEqual(count, self.expected.count(b"\n"))
+        self.assertEqual(read(self.json), self.expected)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resumed(self):
+        self.interrupt(1500)
+        self.assertTrue(os.path.exists(self.checkpoint))
+        written = read(self.json).count(b"\n")
+        self.assertTrue(0 < written < 1500)
+        count = data_shanghai.process_map_checkpointed(self.osm, resume=True,
+                                                       chunk_size=CHUNK_SIZE)
+        self.assertTrue(count < self.expected.count(b"\n"))
+        self.assertEqual(read(self.json), self.expected)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resumed_without_output(self):
+        self.interrupt(1500)
+        os.remove(self.json)
+        count = data_shanghai.process_map_checkpointed(self.osm, resume=True,
+                                                       chunk_size=CHUNK_SIZE)
+        self.assertEqual(count, self.expected.count(b"\n"))
+        self.assertEqual(read(self.json), self.expected)
+
+    def test_empty_file(self):
+        with io.open(self.osm, "wb") as f:
+            f.write(EMPTY_OSM)
+        self.assertEqual(data_shanghai.process_map_checkpointed(self.osm), 0)
+        self.assertEqual(read(self.json), b"")
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_changed_input(self):
+        self.interrupt(1500)
+        # The file is generated again, with other elements
+        synthetic_osm.generate(self.osm, 2100)
+        self.assertRaises(ValueError, data_shanghai.process_map_checkpointed, self.osm,
+                          resume=True, chunk_size=CHUNK_SIZE)
+        self.assertTrue(os.path.exists(self.checkpoint))
+
+    def test_wrong_last_element(self):
+        self.interrupt(1500)
+        with io.open(self.checkpoint, "rb") as f:
+            checkpoint = json.load(f)
+        self.assertTrue(checkpoint["last_id"].startswith("node/"))
+        checkpoint["last_id"] = "node/0"
+        data_shanghai.write_checkpoint(self.checkpoint, checkpoint)
+        self.assertRaises(ValueError, data_shanghai.process_map_checkpointed, self.osm,
+                          resume=True, chunk_size=CHUNK_SIZE)
+
+    def test_last_element_id(self):
+        chunks = osm_chunks.find_chunks(self.osm, CHUNK_SIZE)
+        self.assertEqual(osm_chunks.last_element_id(self.osm, chunks[0][0]), None)
+        for start, end in chunks:
+            for element in osm_chunks.iter_chunk_elements(self.osm, start, end):
+                last_id = "{0}/{1}".format(element.tag, element.attrib["id"])
+            self.assertEqual(osm_chunks.last_element_id(self.osm, end), last_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
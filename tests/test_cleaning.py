@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the cleaning of the values in data_shanghai.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import unittest
+
+import data_shanghai
+import osm_reader
+from data_shanghai import process_address, process_name
+
+
+def shape_node(tags):
+    node = osm_reader.Element("node", {"id": "1", "lat": "31.2", "lon": "121.4"})
+    node.children = [osm_reader.Element("tag", {"k": k, "v": v}) for k, v in tags]
+    return data_shanghai.shape_element(node)
+
+
+class StreetTest(unittest.TestCase):
+
+    def test_last_word_is_updated(self):
+        self.assertEqual(process_address("street", u"Lu Xun Rd"), u"Lu Xun Road")
+        self.assertEqual(process_address("street", u"Huaihai Rd."), u"Huaihai Road")
+        self.assertEqual(process_address("street", u"Hongqiao Lu"), u"Hongqiao Road")
+        self.assertEqual(process_address("street", u"Nanjing Road (W)"), u"Nanjing Road West")
+        self.assertEqual(process_address("street", u"NO.588 binhe road"), u"binhe Road")
+
+    def test_other_words_are_kept(self):
+        for value in [u"Lu Xun Park", u"St. Ignatius Cathedral", u"St. Paul Street",
+                      u"road safety center", u"Century Avenue"]:
+            self.assertEqual(process_address("street", value), value)
+
+    def test_chinese_street(self):
+        self.assertEqual(process_address("street", u"浦建路207弄"), u"浦建路")
+
+
+class NameTest(unittest.TestCase):
+
+    def test_english_name(self):
+        self.assertEqual(process_name("en", u"Lu Xun Rd"), u"Lu Xun Road")
+        self.assertEqual(process_name("en", u"Huaihai Road (W.)"), u"Huaihai Road West")
+        for value in [u"Lu Xun Park", u"St. Ignatius Cathedral", u"St. Paul Street",
+                      u"road safety center", u"People's Square"]:
+            self.assertEqual(process_name("en", value), value)
+
+    def test_chinese_name(self):
+        self.assertEqual(process_name("zh", u"静安寺"), u"静安寺")
+        self.assertEqual(process_name("zh", u"Jing An Temple"), None)
+
+    def test_bank_name(self):
+        self.assertEqual(data_shanghai.canonical_brand(u"ICBC"), u"中国工商银行")
+        self.assertEqual(data_shanghai.canonical_brand(u"新白鹿酒店"), None)
+
+    def test_bank_brand(self):
+        for name, brand in [(u"中国银行(徐汇支行)", u"中国银行"),
+                            (u"ICBC ATM", u"中国工商银行"),
+                            (u"上海农商银行", None)]:
+            el = shape_node([("name", name), ("amenity", "bank")])
+            # The branch stays in the name
+            self.assertEqual(el["name"]["main"], name)
+            self.assertEqual(el.get("brand"), brand)
+        el = shape_node([("name", u"徐汇支行"), ("brand", u"工行"), ("amenity", "bank")])
+        self.assertEqual(el["brand"], u"中国工商银行")
+        el = shape_node([("name", u"ICBC"), ("amenity", "atm")])
+        self.assertNotIn("brand", el)
+
+
+class CityTest(unittest.TestCase):
+
+    def test_expected_city_order(self):
+        self.assertEqual(process_address("city", u"上海市 Shanghai"), u"上海")
+        self.assertEqual(process_address("city", u"Shanghai 上海市"), u"上海")
+        self.assertEqual(process_address("city", u"Huinanzhen, Pudong, Shanghai"), u"Shanghai")
+
+    def test_other_city(self):
+        self.assertEqual(process_address("city", u"Hangzhou"), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the columnar export, the .npy files are read without numpy.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+from array import array
+import ast
+import io
+import json
+import math
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import columnar
+import data_shanghai
+import synthetic_osm
+
+
+def read_npy(path):
+    # Return the header dictionary and the values of a .npy file
+    with io.open(path, "rb") as f:
+        data = f.read()
+    assert data[:8] == b"\x93NUMPY\x01\x00"
+    header_length = struct.unpack("<H", data[8:10])[0]
+    header = ast.literal_eval(data[10:10 + header_length].strip())
+    body = data[10 + header_length:]
+    typecode = {"f8": "d", "i4": "i"}.get(header["descr"][1:], columnar.INT64)
+    values = array(typecode)
+    values.fromstring(body)
+    return header, values, len(body)
+
+
+class ColumnarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.osm = os.path.join(self.directory, "small.osm")
+        self.columns = columnar.columns_dir(self.osm)
+        synthetic_osm.generate(self.osm, 1000)
+        self.docs = list(data_shanghai.iter_shaped(self.osm))
+        # Small buffers, so the columns are written in several parts
+        self.buffer_size = columnar.BUFFER_SIZE
+        columnar.BUFFER_SIZE = 100
+
+    def tearDown(self):
+        columnar.BUFFER_SIZE = self.buffer_size
+        shutil.rmtree(self.directory)
+
+    def test_headers_and_values(self):
+        count = columnar.export(self.osm)
+        nodes = [doc for doc in self.docs if doc["type"] == "node"]
+        ways = [doc for doc in self.docs if doc["type"] == "way"]
+        self.assertEqual(count, {"node": len(nodes), "way": len(ways)})
+        for doc_type, docs in [("node", nodes), ("way", ways)]:
+            for name, typecode in columnar.COLUMNS[doc_type]:
+                header, values, size = read_npy(os.path.join(
+                    self.columns, "{0}s_{1}.npy".format(doc_type, name)))
+                self.assertEqual(header["descr"], columnar.dtype(typecode))
+                self.assertEqual(header["fortran_order"], False)
+                self.assertEqual(header["shape"], (len(docs),))
+                self.assertEqual(size, len(docs) * array(typecode).itemsize)
+                if name == "id":
+                    self.assertEqual(list(values), [int(doc["id"]) for doc in docs])
+        _, lats, _ = read_npy(os.path.join(self.columns, "nodes_lat.npy"))
+        self.assertEqual(list(lats), [doc["pos"][0] for doc in nodes])
+
+    def test_refs(self):
+        columnar.export(self.osm)
+        _, offsets, _ = read_npy(os.path.join(self.columns, "ways_refs_offsets.npy"))
+        header, values, _ = read_npy(os.path.join(self.columns, "ways_refs_values.npy"))
+        ways = [doc for doc in self.docs if doc["type"] == "way"]
+        self.assertEqual(len(offsets), len(ways) + 1)
+        self.assertEqual(offsets[0], 0)
+        self.assertEqual(offsets[-1], len(values))
+        self.assertEqual(header["shape"], (len(values),))
+        for i, way in enumerate(ways):
+            self.assertEqual(list(values[offsets[i]:offsets[i + 1]]),
+                             [int(ref) for ref in way["node_refs"]])
+
+    def test_dictionaries(self):
+        columnar.export(self.osm)
+        with io.open(os.path.join(self.columns, "dictionaries.json"), "r", encoding="utf8") as f:
+            dictionaries = json.load(f)
+        self.assertTrue(dictionaries["amenity"])
+        _, codes, _ = read_npy(os.path.join(self.columns, "nodes_amenity.npy"))
+        nodes = [doc for doc in self.docs if doc["type"] == "node"]
+        for doc, code in zip(nodes, codes):
+            if "amenity" in doc:
+                self.assertEqual(dictionaries["amenity"][code], doc["amenity"])
+            else:
+                self.assertEqual(code, columnar.MISSING)
+
+    def test_empty(self):
+        count = columnar.export_documents([], self.columns)
+        self.assertEqual(count, {"node": 0, "way": 0})
+        header, values, _ = read_npy(os.path.join(self.columns, "nodes_id.npy"))
+        self.assertEqual(header["shape"], (0,))
+        _, offsets, _ = read_npy(os.path.join(self.columns, "ways_refs_offsets.npy"))
+        self.assertEqual(list(offsets), [0])
+
+    @unittest.skipIf(columnar.numpy is None, "numpy isn't installed")
+    def test_load(self):
+        columnar.export(self.osm)
+        columns = columnar.load(self.columns)
+        nodes = [doc for doc in self.docs if doc["type"] == "node"]
+        ways = [doc for doc in self.docs if doc["type"] == "way"]
+        self.assertEqual(columns["nodes_id"].tolist(), [int(doc["id"]) for doc in nodes])
+        self.assertEqual(columnar.way_refs(columns, 0).tolist(),
+                         [int(ref) for ref in ways[0]["node_refs"]])
+
+    @unittest.skipIf(columnar.numpy is None, "numpy isn't installed")
+    def test_grid_counts(self):
+        columnar.export(self.osm)
+        cells, counts = columnar.grid_counts(columnar.load(self.columns), 0.1)
+        expected = {}
+        for doc in self.docs:
+            if doc["type"] == "node":
+                cell = (int(math.floor(doc["pos"][0] / 0.1)),
+                        int(math.floor(doc["pos"][1] / 0.1)))
+                expected[cell] = expected.get(cell, 0) + 1
+        self.assertEqual(dict((tuple(cell), count) for cell, count in
+                              zip(cells.tolist(), counts.tolist())), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the compact documents.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import unittest
+
+import compact_docs
+from compact_docs import CompactDoc, StringPool, is_int
+
+DOC = {"id": "4294967296", "type": "node", "pos": [31.2, 121.4],
+       "created": {"version": "2", "changeset": "17206049", "user": "linuxUser16",
+                   "uid": "1219059", "timestamp": "2013-08-03T16:43:42Z"},
+       "address": {"housenumber": u"１２", "postcode": "007", "street": u"①"},
+       "name": {"main": u"中国工商银行", "en": "ICBC"},
+       "node_refs": ["1", "0", "305896090"],
+       "ref": "0", "level": "1234567890123456789", "layer": "-1"}
+
+
+class CompactDocTest(unittest.TestCase):
+
+    def test_is_int(self):
+        self.assertTrue(is_int("0"))
+        self.assertTrue(is_int("17206049"))
+        self.assertTrue(is_int(u"305896090"))
+        for value in [u"１２", u"①", u"٣", "007", "-1", "+1", "1.0", "", " 1",
+                      "1234567890123456789", 12]:
+            self.assertFalse(is_int(value), value)
+
+    def test_round_trip(self):
+        doc = CompactDoc(DOC, StringPool())
+        self.assertEqual(doc.to_dict(), DOC)
+        self.assertEqual(doc.get("address"), DOC["address"])
+        self.assertEqual(doc.get("missing"), None)
+
+    def test_round_trip_32_bits(self):
+        # As with the 32 bits "l" arrays of Windows
+        max_int = compact_docs.MAX_INT
+        compact_docs.MAX_INT = 2 ** 31 - 1
+        try:
+            doc = CompactDoc(DOC, StringPool())
+            self.assertEqual(doc.to_dict(), DOC)
+            self.assertIn("4294967296", doc.values)
+        finally:
+            compact_docs.MAX_INT = max_int
+
+
+if __name__ == "__main__":
+    unittest.main()
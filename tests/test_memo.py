@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the memoized cleaning functions.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import unittest
+
+import data_shanghai
+from memo import memoize
+
+
+class MemoizeTest(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        calls = []
+
+        @memoize(10)
+        def double(x):
+            calls.append(x)
+            return 2 * x
+
+        self.assertEqual([double(x) for x in [1, 2, 1, 1, 3, 2]], [2, 4, 2, 2, 6, 4])
+        self.assertEqual(calls, [1, 2, 3])
+        stats = double.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (3, 3, 3))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_none_is_cached(self):
+        calls = []
+
+        @memoize(10)
+        def nothing(x):
+            calls.append(x)
+
+        nothing(1)
+        nothing(1)
+        self.assertEqual(calls, [1])
+
+    def test_bounded(self):
+        @memoize(4)
+        def square(x):
+            return x * x
+
+        for x in range(10):
+            self.assertEqual(square(x), x * x)
+            self.assertTrue(len(square.cache.data) <= 4)
+        stats = square.cache.stats()
+        self.assertEqual(stats["misses"], 10)
+        self.assertEqual(stats["clears"], 2)
+        # The values put after the last clear are still cached
+        self.assertEqual(square(9), 81)
+        self.assertEqual(square.cache.stats()["hits"], 1)
+
+
+class CacheStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        data_shanghai.classify_key.cache.clear()
+        data_shanghai.clean_value.cache.clear()
+        data_shanghai.canonical_brand.cache.clear()
+
+    def test_cache_stats(self):
+        for k in ["addr:street", "name:en", "addr:street", "name", "addr:street"]:
+            data_shanghai.classify_key(k)
+        self.assertEqual(data_shanghai.classify_key("addr:street"), ("address", "street"))
+        stats = data_shanghai.cache_stats()
+        self.assertEqual(sorted(stats), ["brands", "keys", "values"])
+        self.assertEqual((stats["keys"]["hits"], stats["keys"]["misses"]), (3, 3))
+        self.assertEqual(stats["keys"]["size"], 3)
+        self.assertEqual(stats["keys"]["maxsize"], data_shanghai.KEY_CACHE_SIZE)
+        self.assertEqual(stats["values"]["hits"] + stats["values"]["misses"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Offline tests of mongo_loader, against mongomock.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mongomock
+
+import mongo_loader
+import synthetic_osm
+
+
+class Crash(Exception):
+    pass
+
+
+class MongoLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.osm = os.path.join(self.directory, "small.osm")
+        synthetic_osm.generate(self.osm, 300)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def ids(self, client):
+        return sorted(doc["_id"] for doc in client.osm.osm.find({}, {"_id": 1}))
+
+    def test_fresh_load(self):
+        client = mongomock.MongoClient()
+        count = mongo_loader.load(self.osm, client=client, batch_size=50)
+        self.assertEqual(count, client.osm.osm.count_documents({}))
+        self.assertTrue(count > 0)
+        self.assertEqual(client.osm.load_state.count_documents({}), 0)
+        indexes = client.osm.osm.index_information()
+        self.assertIn("created.user_1", indexes)
+        self.assertIn("type_1", indexes)
+
+    def test_resume_after_crash(self):
+        expected = mongomock.MongoClient()
+        total = mongo_loader.load(self.osm, client=expected, batch_size=50)
+
+        client = mongomock.MongoClient()
+        insert_batch = mongo_loader.insert_batch
+        calls = []
+
+        def crashing_insert(collection, batch):
+            # The third batch is half inserted, then the loader dies
+            calls.append(1)
+            if len(calls) == 3:
+                insert_batch(collection, batch[:20])
+                raise Crash()
+            return insert_batch(collection, batch)
+
+        mongo_loader.insert_batch = crashing_insert
+        try:
+            self.assertRaises(Crash, mongo_loader.load, self.osm, client=client, batch_size=50)
+        finally:
+            mongo_loader.insert_batch = insert_batch
+        self.assertEqual(client.osm.osm.count_documents({}), 120)
+        self.assertEqual(client.osm.load_state.count_documents({}), 1)
+
+        count = mongo_loader.load(self.osm, client=client, batch_size=50)
+        self.assertEqual(count, total - 120)
+        self.assertEqual(self.ids(client), self.ids(expected))
+        self.assertEqual(client.osm.load_state.count_documents({}), 0)
+
+    def test_resume_with_unknown_last_id(self):
+        client = mongomock.MongoClient()
+        mongo_loader.set_last_id(client.osm, self.osm, "node/does-not-exist")
+        self.assertRaises(ValueError, mongo_loader.load, self.osm, client=client)
+
+
+if __name__ == "__main__":
+    unittest.main()
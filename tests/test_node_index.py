@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the node coordinate index of node_index.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import node_index
+
+
+def node(node_id, lat, lon):
+    return {"type": "node", "id": str(node_id), "pos": [lat, lon]}
+
+def way(way_id, refs):
+    return {"type": "way", "id": str(way_id), "node_refs": [str(ref) for ref in refs]}
+
+
+class NodeIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "nodes.idx")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def build(self, nodes):
+        builder = node_index.NodeIndexBuilder(self.path)
+        for node_id, lat, lon in nodes:
+            builder.add(node_id, lat, lon)
+        return builder.finish()
+
+    def test_lookup(self):
+        index = self.build([(1, 31.2, 121.4), (5, 31.25, 121.45), (2 ** 40, -33.5, -70.6)])
+        try:
+            self.assertEqual(len(index), 3)
+            self.assertEqual(index.lookup(1), (31.2, 121.4))
+            self.assertEqual(index.lookup(5), (31.25, 121.45))
+            self.assertEqual(index.lookup(2 ** 40), (-33.5, -70.6))
+            for missing in [0, 3, 6, 2 ** 41]:
+                self.assertEqual(index.lookup(missing), None)
+        finally:
+            index.close()
+        self.assertFalse(os.path.exists(self.path + ".ids.tmp"))
+        self.assertFalse(os.path.exists(self.path + ".coords.tmp"))
+
+    def test_unsorted(self):
+        # More nodes than a batch of the builder, in a shuffled order
+        nodes = [(i * 7919 % 25000, i / 1000.0, -i / 1000.0) for i in range(25000)]
+        self.assertTrue(len(nodes) > node_index.BATCH_SIZE)
+        index = self.build(nodes)
+        try:
+            self.assertEqual([index.ids[i] for i in range(len(index))], range(25000))
+            for node_id, lat, lon in nodes[::97]:
+                self.assertEqual(index.lookup(node_id), (lat, lon))
+        finally:
+            index.close()
+
+    def test_empty(self):
+        index = self.build([])
+        try:
+            self.assertEqual(len(index), 0)
+            self.assertEqual(index.lookup(1), None)
+        finally:
+            index.close()
+
+    def test_not_an_index(self):
+        with open(self.path, "wb") as f:
+            f.write("x" * node_index.HEADER.size)
+        self.assertRaises(ValueError, node_index.NodeIndex, self.path)
+
+    def test_iter_with_geometry(self):
+        docs = [node(1, 31.2, 121.4),
+                node(2, 31.3, 121.3),
+                way(10, [1, 2, 3]),
+                # Too late to be in the index
+                node(3, 31.0, 121.0),
+                way(11, [3])]
+        result = list(node_index.iter_with_geometry(docs, self.path))
+        self.assertEqual(result[2]["node_pos"], [[31.2, 121.4], [31.3, 121.3], None])
+        self.assertEqual(result[2]["bbox"], [31.2, 121.3, 31.3, 121.4])
+        self.assertEqual(result[4]["node_pos"], [None])
+        self.assertNotIn("bbox", result[4])
+        self.assertNotIn("node_pos", result[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
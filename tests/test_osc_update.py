@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the versions of the changes applied by osc_update, to the json
+file and to a mongomock collection.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mongomock
+
+import data_shanghai
+import mongo_loader
+import osc_update
+
+CREATED = 'timestamp="2013-08-03T16:43:42Z" changeset="5" uid="42" user="XBear"'
+
+OSM = u"""<?xml version='1.0' encoding='UTF-8'?>
+<osm version="0.6">
+ <node id="1" lat="31.2" lon="121.4" version="2" {0}/>
+ <node id="2" lat="31.21" lon="121.41" version="1" {0}>
+  <tag k="amenity" v="cafe"/>
+ </node>
+ <node id="3" lat="31.3" lon="121.5" version="3" {0}/>
+ <way id="10" version="1" {0}>
+  <nd ref="1"/>
+  <nd ref="2"/>
+ </way>
+</osm>
+""".format(CREATED)
+
+OSC = u"""<?xml version='1.0' encoding='UTF-8'?>
+<osmChange version="0.6">
+ <modify>
+  <node id="1" lat="0" lon="0" version="1" {0}/>
+  <node id="2" lat="31.21" lon="121.41" version="2" {0}>
+   <tag k="amenity" v="restaurant"/>
+  </node>
+ </modify>
+ <delete>
+  <node id="99" lat="0" lon="0" version="4" {0}/>
+  <way id="10" version="2" {0}/>
+ </delete>
+ <create>
+  <node id="4" lat="31.4" lon="121.6" version="1" {0}/>
+ </create>
+</osmChange>
+""".format(CREATED)
+
+
+def operation(op, _id, version, doc=None):
+    result = {"op": op, "_id": _id, "version": version}
+    if doc is not None:
+        result["doc"] = doc
+    return result
+
+
+class LatestOperationsTest(unittest.TestCase):
+
+    def test_latest_version_kept(self):
+        operations = [operation("upsert", "node/1", "2", {"v": 2}),
+                      operation("upsert", "node/1", "3", {"v": 3}),
+                      operation("upsert", "node/1", "1", {"v": 1}),
+                      operation("delete", "way/1", None),
+                      operation("upsert", "way/1", "1", {"v": 1})]
+        latest = osc_update.latest_operations(operations)
+        self.assertEqual(sorted(latest), ["node/1", "way/1"])
+        self.assertEqual(latest["node/1"]["doc"], {"v": 3})
+        # A missing version is the oldest one
+        self.assertEqual(latest["way/1"]["op"], "upsert")
+
+
+class ApplyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.osm = os.path.join(self.directory, "small.osm")
+        self.osc = os.path.join(self.directory, "small.osc")
+        self.json = self.osm + ".json"
+        with io.open(self.osm, "w", encoding="utf8") as f:
+            f.write(OSM)
+        with io.open(self.osc, "w", encoding="utf8") as f:
+            f.write(OSC)
+        data_shanghai.process_map(self.osm)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_json(self):
+        with io.open(self.json, "r", encoding="utf8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_apply_to_json(self):
+        before = self.read_json()
+        result = osc_update.apply_to_json(osc_update.iter_operations(self.osc), self.json)
+        self.assertEqual(result, {"upserted": 2, "deleted": 1})
+        after = self.read_json()
+        # The older version of node 1 is ignored, the unknown node 99 and
+        # the deleted way are gone, node 2 stays at its place and node 4
+        # is appended
+        self.assertEqual([data_shanghai.document_id(el) for el in after],
+                         ["node/1", "node/2", "node/3", "node/4"])
+        self.assertEqual(after[0], before[0])
+        self.assertEqual(after[1]["amenity"], "restaurant")
+        self.assertEqual(after[1]["created"]["version"], "2")
+        self.assertEqual(after[2], before[2])
+        self.assertEqual(after[3]["pos"], [31.4, 121.6])
+
+    def test_mongo_same_as_json(self):
+        client = mongomock.MongoClient()
+        mongo_loader.load(self.osm, client=client)
+        result = osc_update.apply_to_mongo(osc_update.iter_operations(self.osc),
+                                           client.osm.osm, batch_size=2)
+        osc_update.apply_to_json(osc_update.iter_operations(self.osc), self.json)
+        expected = dict((data_shanghai.document_id(el), el) for el in self.read_json())
+        docs = {}
+        for doc in client.osm.osm.find():
+            docs[doc.pop("_id")] = doc
+        self.assertEqual(docs, expected)
+        self.assertEqual(result, {"upserted": 2, "deleted": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
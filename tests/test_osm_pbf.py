@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the PBF decoder of osm_pbf.
+
+The same elements are written as an osm file and as a PBF file, encoded
+here field by field as described by the OSM PBF format, and the elements
+read from both files must be the same.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import calendar
+import io
+import os
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+import zlib
+from xml.sax.saxutils import quoteattr
+
+import osm_pbf
+import osm_reader
+
+BOUNDS = {"minlat": "30.7000000", "minlon": "120.8500000",
+          "maxlat": "31.8700000", "maxlon": "122.2000000"}
+
+INFO_1 = {"version": "2", "timestamp": "2013-08-03T16:43:42Z", "changeset": "17206049",
+          "uid": "1219059", "user": u"linuxUser16"}
+INFO_2 = {"version": "1", "timestamp": "2014-01-03T16:43:42Z", "changeset": "1",
+          "uid": "42", "user": u"XBear"}
+INFO_3 = {"version": "5", "timestamp": "2015-06-01T00:00:00Z", "changeset": "900",
+          "uid": "7", "user": u"其他"}
+
+def node(node_id, lat, lon, info=None, tags=()):
+    attrib = {"id": str(node_id), "lat": lat, "lon": lon}
+    attrib.update(info or {})
+    return ("node", attrib, [("tag", {"k": k, "v": v}) for k, v in tags])
+
+def way(way_id, refs, info, tags=()):
+    attrib = {"id": str(way_id)}
+    attrib.update(info)
+    return ("way", attrib, [("nd", {"ref": str(ref)}) for ref in refs]
+            + [("tag", {"k": k, "v": v}) for k, v in tags])
+
+def relation(relation_id, members, info, tags=()):
+    attrib = {"id": str(relation_id)}
+    attrib.update(info)
+    return ("relation", attrib,
+            [("member", {"type": t, "ref": str(ref), "role": role}) for t, ref, role in members]
+            + [("tag", {"k": k, "v": v}) for k, v in tags])
+
+# The first block has the default coordinates granularity, dense nodes
+# with info, ways and a relation
+BLOCK_1 = {"date_granularity": 2000,
+           "dense": [node(1, "31.2000000", "121.4000000", INFO_1,
+                          [(u"name", u"中国工商银行"), (u"amenity", u"bank")]),
+                     node(2, "31.2100000", "121.4100000", INFO_1),
+                     node(5, "-33.4500000", "-70.6600000", INFO_2, [(u"name", u"Santiago")])],
+           "ways": [way(10, [1, 2, 5, 1], INFO_2, [(u"source", u"PGS")]),
+                    way(-3, [2], INFO_3)],
+           "relations": [relation(100, [("way", 10, u"outer"), ("node", 5, u""),
+                                        ("relation", 101, u"sub")],
+                                  INFO_3, [(u"type", u"multipolygon")])]}
+# The second block has other granularities and offsets, dense nodes
+# without info and plain nodes
+BLOCK_2 = {"granularity": 1000, "lat_offset": 300000000, "lon_offset": -200000000,
+           "date_granularity": 500,
+           "dense": [node(20, "31.2000030", "121.4000010"),
+                     node(21, "31.2000040", "121.3999990", tags=[(u"highway", u"crossing")])],
+           "nodes": [node(-7, "31.0000000", "121.0000000", INFO_3, [(u"name:en", u"Bund")]),
+                     node(30, "31.5000000", "121.5000000")]}
+
+######################## ENCODER OF THE TEST FILE ###########################
+
+def varint(n):
+    if n < 0:
+        n += 1 << 64
+    out = []
+    while True:
+        b = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(chr(b | 0x80))
+        else:
+            out.append(chr(b))
+            return "".join(out)
+
+def zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+def field_varint(number, n):
+    return varint(number << 3) + varint(n)
+
+def field_bytes(number, data):
+    return varint(number << 3 | 2) + varint(len(data)) + data
+
+def field_packed(number, values):
+    return field_bytes(number, "".join(varint(n) for n in values))
+
+def delta(values):
+    result = []
+    last = 0
+    for value in values:
+        result.append(value - last)
+        last = value
+    return result
+
+def nano(coordinate):
+    return int(round(float(coordinate) * 10 ** 7)) * 100
+
+def seconds(timestamp):
+    return calendar.timegm(time.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ"))
+
+
+class BlockEncoder(object):
+
+    def __init__(self, block):
+        self.block = block
+        self.granularity = block.get("granularity", 100)
+        self.date_granularity = block.get("date_granularity", 1000)
+        self.strings = [u""]
+
+    def string(self, value):
+        if value not in self.strings:
+            self.strings.append(value)
+        return self.strings.index(value)
+
+    def position(self, attrib, name, offset):
+        return (nano(attrib[name]) - self.block.get(offset, 0)) // self.granularity
+
+    def date(self, attrib):
+        return seconds(attrib["timestamp"]) * 1000 // self.date_granularity
+
+    def info(self, attrib):
+        return (field_varint(1, int(attrib["version"]))
+                + field_varint(2, self.date(attrib))
+                + field_varint(3, int(attrib["changeset"]))
+                + field_varint(4, int(attrib["uid"]))
+                + field_varint(5, self.string(attrib["user"])))
+
+    def tags(self, children):
+        tags = [child for tag, child in children if tag == "tag"]
+        return (field_packed(2, [self.string(t["k"]) for t in tags])
+                + field_packed(3, [self.string(t["v"]) for t in tags]))
+
+    def dense(self, nodes):
+        attribs = [attrib for _, attrib, _ in nodes]
+        keys_vals = []
+        for _, _, children in nodes:
+            for _, t in children:
+                keys_vals += [self.string(t["k"]), self.string(t["v"])]
+            keys_vals.append(0)
+        data = field_packed(1, [zigzag(n) for n in delta([int(a["id"]) for a in attribs])])
+        if "version" in attribs[0]:
+            data += field_bytes(5, field_packed(1, [int(a["version"]) for a in attribs])
+                + field_packed(2, [zigzag(n) for n in delta([self.date(a) for a in attribs])])
+                + field_packed(3, [zigzag(n) for n in delta([int(a["changeset"]) for a in attribs])])
+                + field_packed(4, [zigzag(n) for n in delta([int(a["uid"]) for a in attribs])])
+                + field_packed(5, [zigzag(n) for n in
+                                   delta([self.string(a["user"]) for a in attribs])]))
+        data += field_packed(8, [zigzag(n) for n in
+                                 delta([self.position(a, "lat", "lat_offset") for a in attribs])])
+        data += field_packed(9, [zigzag(n) for n in
+                                 delta([self.position(a, "lon", "lon_offset") for a in attribs])])
+        data += field_packed(10, keys_vals)
+        return field_bytes(2, data)
+
+    def node(self, element):
+        _, attrib, children = element
+        data = field_varint(1, zigzag(int(attrib["id"]))) + self.tags(children)
+        if "version" in attrib:
+            data += field_bytes(4, self.info(attrib))
+        data += field_varint(8, zigzag(self.position(attrib, "lat", "lat_offset")))
+        data += field_varint(9, zigzag(self.position(attrib, "lon", "lon_offset")))
+        return field_bytes(1, data)
+
+    def way(self, element):
+        _, attrib, children = element
+        refs = [int(child["ref"]) for tag, child in children if tag == "nd"]
+        return field_bytes(3, field_varint(1, int(attrib["id"])) + self.tags(children)
+                           + field_bytes(4, self.info(attrib))
+                           + field_packed(8, [zigzag(n) for n in delta(refs)]))
+
+    def relation(self, element):
+        _, attrib, children = element
+        members = [child for tag, child in children if tag == "member"]
+        return field_bytes(4, field_varint(1, int(attrib["id"])) + self.tags(children)
+                           + field_bytes(4, self.info(attrib))
+                           + field_packed(8, [self.string(m["role"]) for m in members])
+                           + field_packed(9, [zigzag(n) for n in
+                                              delta([int(m["ref"]) for m in members])])
+                           + field_packed(10, [osm_pbf.MEMBER_TYPES.index(m["type"])
+                                               for m in members]))
+
+    def encode(self):
+        groups = []
+        if "dense" in self.block:
+            groups.append(self.dense(self.block["dense"]))
+        if "nodes" in self.block:
+            groups.append("".join(self.node(n) for n in self.block["nodes"]))
+        if "ways" in self.block:
+            groups.append("".join(self.way(w) for w in self.block["ways"]))
+        if "relations" in self.block:
+            groups.append("".join(self.relation(r) for r in self.block["relations"]))
+        # The strings are only known once the groups are encoded
+        data = field_bytes(1, "".join(field_bytes(1, s.encode("utf8")) for s in self.strings))
+        data += "".join(field_bytes(2, group) for group in groups)
+        for number, name in [(17, "granularity"), (18, "date_granularity"),
+                             (19, "lat_offset"), (20, "lon_offset")]:
+            if name in self.block:
+                data += field_varint(number, self.block[name])
+        return data
+
+def blob(blob_type, data, compressed=True):
+    if compressed:
+        body = field_varint(2, len(data)) + field_bytes(3, zlib.compress(data))
+    else:
+        body = field_bytes(1, data)
+    header = field_bytes(1, blob_type) + field_varint(3, len(body))
+    return struct.pack(">i", len(header)) + header + body
+
+def header_block():
+    # HeaderBBox: left, right, top, bottom
+    bbox = (field_varint(1, zigzag(nano(BOUNDS["minlon"])))
+            + field_varint(2, zigzag(nano(BOUNDS["maxlon"])))
+            + field_varint(3, zigzag(nano(BOUNDS["maxlat"])))
+            + field_varint(4, zigzag(nano(BOUNDS["minlat"]))))
+    return field_bytes(1, bbox) + field_bytes(4, "OsmSchema-V0.6")
+
+def write_pbf(path):
+    with open(path, "wb") as f:
+        f.write(blob("OSMHeader", header_block()))
+        f.write(blob("OSMData", BlockEncoder(BLOCK_1).encode()))
+        f.write(blob("OSMData", BlockEncoder(BLOCK_2).encode(), compressed=False))
+
+def xml_element(element):
+    tag, attrib, children = element
+    attributes = u"".join(u" {0}={1}".format(k, quoteattr(v)) for k, v in sorted(attrib.items()))
+    if not children:
+        return u"<{0}{1}/>\n".format(tag, attributes)
+    return u"<{0}{1}>\n{2}</{0}>\n".format(tag, attributes,
+                                          u"".join(xml_element(c + ([],)) for c in children))
+
+def write_osm(path):
+    elements = [("bounds", BOUNDS, [])]
+    for block in [BLOCK_1, BLOCK_2]:
+        for group in ["dense", "nodes", "ways", "relations"]:
+            elements.extend(block.get(group, []))
+    with io.open(path, "w", encoding="utf8") as f:
+        f.write(u"<?xml version='1.0' encoding='UTF-8'?>\n<osm>\n")
+        for element in elements:
+            f.write(xml_element(element))
+        f.write(u"</osm>\n")
+
+########################### TESTS ##########################################
+
+def read_elements(path):
+    # (tag, attributes) of all the elements, in the order they are yielded
+    return [(elem.tag, dict(elem.attrib)) for elem in osm_reader.iter_elements(path)]
+
+
+class PbfTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.osm = os.path.join(self.directory, "small.osm")
+        self.pbf = os.path.join(self.directory, "small.osm.pbf")
+        write_osm(self.osm)
+        write_pbf(self.pbf)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_as_osm(self):
+        expected = read_elements(self.osm)
+        self.assertEqual(len([e for e in expected if e[0] in osm_reader.TOP_LEVEL_TAGS]), 10)
+        self.assertEqual(read_elements(self.pbf), expected)
+
+    def test_attributes(self):
+        elements = dict(((elem.tag, elem.attrib["id"]), elem)
+                        for elem in osm_pbf.iter_pbf(open(self.pbf, "rb"))
+                        if elem.tag in osm_reader.TOP_LEVEL_TAGS)
+        self.assertEqual(elements[("node", "5")].attrib["lon"], "-70.6600000")
+        self.assertEqual(elements[("node", "-7")].attrib["user"], u"其他")
+        self.assertEqual(elements[("node", "20")].attrib,
+                         {"id": "20", "lat": "31.2000030", "lon": "121.4000010"})
+        self.assertNotIn("timestamp", elements[("node", "21")].attrib)
+        self.assertEqual([nd.attrib["ref"] for nd in elements[("way", "10")].iter("nd")],
+                         ["1", "2", "5", "1"])
+        self.assertEqual(elements[("way", "-3")].attrib["timestamp"], "2015-06-01T00:00:00Z")
+        self.assertEqual([(m.attrib["type"], m.attrib["ref"], m.attrib["role"])
+                          for m in elements[("relation", "100")].iter("member")],
+                         [("way", "10", "outer"), ("node", "5", ""), ("relation", "101", "sub")])
+
+    def test_bounds(self):
+        bounds = next(osm_pbf.iter_pbf(open(self.pbf, "rb")))
+        self.assertEqual((bounds.tag, bounds.attrib), ("bounds", BOUNDS))
+
+    def test_read_varint(self):
+        for n in [0, 1, 127, 128, 300, 2 ** 35, 2 ** 63 + 5]:
+            self.assertEqual(osm_pbf.read_varint(varint(n) + "x", 0), (n, len(varint(n))))
+        for n in [0, -1, 1, -2 ** 40, 2 ** 40]:
+            self.assertEqual(osm_pbf.zigzag(zigzag(n)), n)
+            self.assertEqual(osm_pbf.signed(osm_pbf.read_varint(varint(n), 0)[0]), n)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the query engine of osm_query, against a scan of all the documents.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import data_shanghai
+import osm_query
+import synthetic_osm
+
+# Not on the cell boundaries, the cells at the edges are partly in the box
+BOX = [31.0051, 121.0033, 31.2987, 121.4046]
+
+QUERIES = [{},
+           {"type": "node"},
+           {"type": "way", "source": "PGS"},
+           {"name.en": {"$exists": 1}},
+           {"name.en": {"$exists": 0}},
+           {"amenity": {"$exists": 0}, "type": "way"},
+           {"address": {"$exists": 1}},
+           {"amenity": {"$in": ["bank", "cafe", "unknown"]}},
+           {"created.user": {"$in": ["XBear", "user1"]}},
+           {"name.main": {"$exists": 1}, "amenity": "bank"},
+           # Nested paths which aren't indexed
+           {"address.city": u"上海"},
+           {"created.version": "1"},
+           {"created.changeset": {"$exists": 1}, "type": "way"},
+           {"address.city": {"$in": ["Shanghai", "Hangzhou"]}, "type": "node"},
+           {"pos": {"$within": BOX}},
+           {"pos": {"$within": BOX}, "created.user": "XBear"},
+           {"brand": u"中国工商银行"},
+           {"unknown": "x"},
+           {"unknown": {"$exists": 0}}]
+
+GROUP_PATHS = ["type", "amenity", "created.user", "name.main", "address.city", "brand"]
+
+
+def scan_find(docs, query):
+    return [doc for doc in docs
+            if all(osm_query.matches(osm_query.get_path(doc, path), condition)
+                   for path, condition in query.items())]
+
+def scan_group_by(docs, path):
+    counts = {}
+    for doc in docs:
+        value = osm_query.get_path(doc, path)
+        counts[value] = counts.get(value, 0) + 1
+    items = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [{"_id": value, "count": count} for value, count in items]
+
+
+class QueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.osm = os.path.join(self.directory, "small.osm")
+        self.json = self.osm + ".json"
+        synthetic_osm.generate(self.osm, 2000)
+        data_shanghai.process_map(self.osm)
+        self.docs = self.read_docs()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_docs(self):
+        with io.open(self.json, "r", encoding="utf8") as f:
+            return [json.loads(line) for line in f]
+
+    def check(self, db, docs):
+        for query in QUERIES:
+            expected = scan_find(docs, query)
+            result = db.find(query)
+            self.assertEqual(result.count(), len(expected), query)
+            self.assertEqual(result.docs(), expected, query)
+            for path in GROUP_PATHS:
+                self.assertEqual(result.group_by(path), scan_group_by(expected, path),
+                                 (query, path))
+                self.assertEqual(result.distinct(path),
+                                 sorted(set(osm_query.get_path(doc, path) for doc in expected)
+                                        - set([None])), (query, path))
+
+    def test_queries(self):
+        # Not all empty, and not all the documents
+        counts = [len(scan_find(self.docs, query)) for query in QUERIES]
+        self.assertTrue(all(0 < count < len(self.docs) for count in counts[1:-2]), counts)
+        db = osm_query.open_index(self.json)
+        try:
+            self.check(db, self.docs)
+        finally:
+            db.close()
+
+    def test_built_while_written(self):
+        os.remove(self.json)
+        data_shanghai.process_map(self.osm, index=True)
+        db = osm_query.open_index(self.json, rebuild=False)
+        try:
+            self.check(db, self.docs)
+        finally:
+            db.close()
+
+    def test_group_by_limit(self):
+        db = osm_query.open_index(self.json)
+        try:
+            self.assertEqual(db.find().group_by("created.user", 3),
+                             scan_group_by(self.docs, "created.user")[:3])
+        finally:
+            db.close()
+
+    def test_rebuilt_after_change(self):
+        osm_query.open_index(self.json).close()
+        catalog = os.path.join(osm_query.index_dir(self.json), "catalog.json")
+        built = os.path.getmtime(catalog)
+        # An index of the same json isn't built again
+        time.sleep(0.01)
+        osm_query.open_index(self.json).close()
+        self.assertEqual(os.path.getmtime(catalog), built)
+        # The json is written again with fewer documents
+        docs = [doc for doc in self.docs if doc.get("amenity") != "bank"]
+        with io.open(self.json, "w", encoding="utf8") as fo:
+            for doc in docs:
+                fo.write(data_shanghai.to_json_line(doc))
+        db = osm_query.open_index(self.json)
+        try:
+            self.assertEqual(db.find({"amenity": "bank"}).count(), 0)
+            self.check(db, docs)
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the compressed inputs of osm_reader.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import bz2
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from distutils.spawn import find_executable
+
+import osm_reader
+import synthetic_osm
+
+
+def read(path):
+    with io.open(path, "rb") as f:
+        return f.read()
+
+def read_source(source):
+    f, to_close = osm_reader.open_source(source)
+    try:
+        blocks = []
+        while True:
+            block = f.read(1000)
+            if not block:
+                return "".join(blocks)
+            blocks.append(block)
+    finally:
+        if to_close:
+            f.close()
+
+def read_elements(source):
+    return [(elem.tag, dict(elem.attrib)) for elem in osm_reader.iter_elements(source)]
+
+
+class OpenSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.osm = os.path.join(self.directory, "small.osm")
+        synthetic_osm.generate(self.osm, 300)
+        self.data = read(self.osm)
+        self.programs = osm_reader.PARALLEL_BZIP2
+
+    def tearDown(self):
+        osm_reader.PARALLEL_BZIP2 = self.programs
+        shutil.rmtree(self.directory)
+
+    def write_bz2(self):
+        # Three streams, as written by the parallel bzip2 programs
+        path = self.osm + ".bz2"
+        third = len(self.data) // 3
+        with open(path, "wb") as f:
+            for part in [self.data[:third], self.data[third:2 * third], self.data[2 * third:]]:
+                f.write(bz2.compress(part))
+        return path
+
+    def test_plain(self):
+        self.assertEqual(read_source(self.osm), self.data)
+
+    def test_gzip(self):
+        path = self.osm + ".gz"
+        with gzip.open(path, "wb") as f:
+            f.write(self.data)
+        self.assertEqual(read_source(path), self.data)
+        self.assertEqual(read_elements(path), read_elements(self.osm))
+
+    def test_multi_stream_bz2(self):
+        osm_reader.PARALLEL_BZIP2 = []
+        path = self.write_bz2()
+        self.assertEqual(read_source(path), self.data)
+        self.assertEqual(read_elements(path), read_elements(self.osm))
+
+    @unittest.skipUnless(find_executable("bzip2"), "bzip2 isn't installed")
+    def test_multi_stream_bz2_program(self):
+        # bzip2 reads all the streams as lbzip2 and pbzip2 do
+        osm_reader.PARALLEL_BZIP2 = ["bzip2"]
+        path = self.write_bz2()
+        f, to_close = osm_reader.open_source(path)
+        self.assertTrue(isinstance(f, osm_reader.ProcessOutput))
+        data = f.read(len(self.data) + 1)
+        f.close()
+        self.assertEqual(data, self.data)
+
+    @unittest.skipUnless(find_executable("bzip2"), "bzip2 isn't installed")
+    def test_failed_program(self):
+        osm_reader.PARALLEL_BZIP2 = ["bzip2"]
+        path = self.write_bz2()
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 100)
+        self.assertRaises(IOError, read_source, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
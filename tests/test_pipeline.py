@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the stop of a pipeline when one of its stages fails.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import data_shanghai
+import pipeline
+import synthetic_osm
+
+# Seconds after which a pipeline is considered blocked
+TIMEOUT = 30
+
+
+class Failure(Exception):
+    pass
+
+
+def run_with_timeout(test, function, *args, **kwargs):
+    # Run function in a thread, which must end with an exception
+    errors = []
+
+    def run():
+        try:
+            function(*args, **kwargs)
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    thread.join(TIMEOUT)
+    test.assertFalse(thread.is_alive(), "the pipeline is blocked")
+    return errors
+
+
+class PipelineTest(unittest.TestCase):
+
+    def run_failing(self, fail_stage, queue_size):
+        stages = pipeline.Pipeline()
+        first = stages.queue("first", queue_size)
+        second = stages.queue("second", queue_size)
+        received = []
+
+        def produce(output):
+            for i in range(100):
+                if fail_stage == "produce" and i == 3:
+                    raise Failure()
+                output.put(i)
+
+        def transform(items, output):
+            for i, item in enumerate(items):
+                if fail_stage == "transform" and i == 3:
+                    raise Failure()
+                output.put(item * 2)
+
+        def consume(items):
+            for i, item in enumerate(items):
+                if fail_stage == "consume" and i == 3:
+                    raise Failure()
+                received.append(item)
+
+        stages.stage("produce", produce, first)
+        stages.stage("transform", transform, first, second)
+        stages.stage("consume", consume, second)
+        errors = run_with_timeout(self, stages.run)
+        return errors, received
+
+    def test_success(self):
+        errors, received = self.run_failing(None, 1)
+        self.assertEqual(errors, [])
+        self.assertEqual(received, [2 * i for i in range(100)])
+
+    def test_failing_stage(self):
+        for fail_stage in ["produce", "transform", "consume"]:
+            for queue_size in [1, 2, 8]:
+                errors, received = self.run_failing(fail_stage, queue_size)
+                self.assertEqual([type(e) for e in errors], [Failure])
+
+
+class PipelinedProcessMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.osm = os.path.join(self.directory, "small.osm")
+        synthetic_osm.generate(self.osm, 5000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_failing_shape(self):
+        # The reader is blocked on the full parsed queue when the shaping
+        # of the third batch fails
+        shape_batch = data_shanghai.shape_batch
+        calls = []
+
+        def failing_shape_batch(args):
+            calls.append(1)
+            if len(calls) == 3:
+                raise Failure()
+            return shape_batch(args)
+
+        data_shanghai.shape_batch = failing_shape_batch
+        try:
+            errors = run_with_timeout(self, data_shanghai.process_map_pipelined,
+                                      self.osm, queue_size=1)
+        finally:
+            data_shanghai.shape_batch = shape_batch
+        self.assertEqual([type(e) for e in errors], [Failure])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the variants of process_map, which must all write the same output.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import data_shanghai
+import synthetic_osm
+from metrics import Metrics
+
+
+def read(path):
+    with io.open(path, "rb") as f:
+        return f.read()
+
+
+class ProcessMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.environ["OSM_CACHE_DIR"] = os.path.join(self.directory, "cache")
+        self.osm = os.path.join(self.directory, "small.osm")
+        self.json = self.osm + ".json"
+        synthetic_osm.generate(self.osm, 1000)
+        self.count = data_shanghai.process_map(self.osm)
+        self.expected = read(self.json)
+        os.remove(self.json)
+
+    def tearDown(self):
+        del os.environ["OSM_CACHE_DIR"]
+        shutil.rmtree(self.directory)
+
+    def check(self, count):
+        self.assertEqual(count, self.count)
+        self.assertEqual(read(self.json), self.expected)
+        os.remove(self.json)
+
+    def test_pipelined(self):
+        metrics = Metrics("pipelined", interval=float("inf"))
+        self.check(data_shanghai.process_map(self.osm, pipelined=True, metrics=metrics))
+        self.assertIn("pipeline", metrics.report())
+        self.check(data_shanghai.process_map(self.osm, pipelined=True, processes=2))
+
+    def test_pipelined_cache(self):
+        self.check(data_shanghai.process_map(self.osm, pipelined=True, cache=True))
+        self.check(data_shanghai.process_map(self.osm, pipelined=True, cache=True))
+
+    def test_pipelined_unsupported_options(self):
+        self.assertRaises(ValueError, data_shanghai.process_map, self.osm,
+                          keep_data=True, pipelined=True)
+        self.assertRaises(ValueError, data_shanghai.process_map, self.osm,
+                          index=True, pipelined=True)
+        for profile in ["cprofile", "sample"]:
+            metrics = Metrics("pipelined", interval=float("inf"), profile=profile)
+            self.assertRaises(ValueError, data_shanghai.process_map, self.osm,
+                              pipelined=True, metrics=metrics)
+            self.assertRaises(ValueError, data_shanghai.process_map_pipelined, self.osm,
+                              metrics=metrics)
+        self.assertFalse(os.path.exists(self.json))
+
+    def test_parallel(self):
+        metrics = Metrics("parallel", interval=float("inf"))
+        self.check(data_shanghai.process_map_parallel(self.osm, 2, 16 * 1024, metrics=metrics))
+        self.assertEqual(metrics.report()["elements"]["node"] + metrics.report()["elements"]["way"],
+                         self.count)
+
+    def test_checkpointed(self):
+        self.check(data_shanghai.process_map_checkpointed(self.osm, chunk_size=16 * 1024))
+
+    def test_chunks_of_compressed_file(self):
+        compressed = self.osm + ".gz"
+        with gzip.open(compressed, "wb") as f:
+            f.write(read(self.osm))
+        self.assertRaises(ValueError, data_shanghai.process_map_parallel, compressed, 2)
+        self.assertRaises(ValueError, data_shanghai.process_map_checkpointed, compressed)
+        self.assertFalse(os.path.exists(compressed + ".json"))
+        # The streaming path reads it
+        self.assertEqual(data_shanghai.process_map(compressed), self.count)
+        self.assertEqual(read(compressed + ".json"), self.expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
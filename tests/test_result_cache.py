@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the cache of the results of process_map.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import data_shanghai
+import osm_reader
+import result_cache
+import synthetic_osm
+
+
+def read(path):
+    with io.open(path, "rb") as f:
+        return f.read()
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.environ["OSM_CACHE_DIR"] = os.path.join(self.directory, "cache")
+        self.osm = os.path.join(self.directory, "small.osm")
+        synthetic_osm.generate(self.osm, 500)
+
+    def tearDown(self):
+        del os.environ["OSM_CACHE_DIR"]
+        shutil.rmtree(self.directory)
+
+    def test_cached_output(self):
+        count = data_shanghai.process_map(self.osm, cache=True)
+        expected = read(self.osm + ".json")
+        os.remove(self.osm + ".json")
+        # Same count without reading the output back
+        self.assertEqual(data_shanghai.process_map(self.osm, cache=True), count)
+        self.assertEqual(read(self.osm + ".json"), expected)
+        self.assertEqual(data_shanghai.process_map(self.osm), count)
+        self.assertEqual(read(self.osm + ".json"), expected)
+
+    def test_cache_backend(self):
+        def records(backend):
+            return [osm_reader.to_record(elem)
+                    for elem in osm_reader.iter_top_level(self.osm, backend)]
+        expected = records("etree")
+        # Recorded, then replayed
+        self.assertEqual(records("cache"), expected)
+        self.assertEqual(records("cache"), expected)
+
+    def test_eviction(self):
+        cache = result_cache.cache_dir(self.osm)
+        output = os.path.join(self.directory, "output.json")
+        with io.open(output, "wb") as fo:
+            fo.write(b"{}\n")
+        paths = [os.path.join(cache, "{0:040x}-{0:040x}.json".format(i)) for i in range(5)]
+        for i, path in enumerate(paths):
+            result_cache.store(output, path, 1)
+            os.utime(path, (i, i))
+        # Used again, so kept
+        self.assertEqual(result_cache.fetch(paths[0], output), 1)
+        result_cache.evict(cache, 3)
+        self.assertEqual([os.path.exists(path) for path in paths],
+                         [True, False, False, True, True])
+        self.assertFalse(os.path.exists(paths[1] + ".meta"))
+        self.assertEqual(result_cache.fetch(paths[1], output), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the stream summaries of sketches.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import random
+import unittest
+
+from sketches import SpaceSaving
+
+
+class SpaceSavingTest(unittest.TestCase):
+
+    def check(self, stream, k):
+        summary = SpaceSaving(k)
+        real = {}
+        for value in stream:
+            summary.add(value)
+            real[value] = real.get(value, 0) + 1
+        self.assertTrue(len(summary) <= k)
+        self.assertEqual(len(summary.heap), len(summary))
+        self.assertEqual(sum(c[0] for c in summary.counters.values()), len(stream))
+        for value, counter in summary.counters.items():
+            self.assertTrue(real[value] <= counter[0] <= real[value] + counter[1])
+        return summary, real
+
+    def test_exact_below_k(self):
+        summary, real = self.check(list("abracadabra"), 10)
+        self.assertEqual([(item["value"], item["count"], item["error"]) for item in summary.top()],
+                         [("a", 5, 0), ("b", 2, 0), ("r", 2, 0), ("c", 1, 0), ("d", 1, 0)])
+
+    def test_heavy_hitters(self):
+        rnd = random.Random(0)
+        stream = [int(rnd.paretovariate(0.8)) for i in xrange(20000)]
+        summary, real = self.check(stream, 50)
+        expected = sorted(real, key=lambda value: -real[value])[:5]
+        self.assertEqual([item["value"] for item in summary.top(5)], expected)
+
+    def test_many_distinct_values(self):
+        rnd = random.Random(1)
+        self.check([rnd.randint(0, 10000) for i in xrange(5000)], 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the tiling of spatial.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import spatial
+
+OSM = u"""<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <node id="1" lat="31.201" lon="121.401" version="1" user="a" uid="1" changeset="1" timestamp="2013-08-03T16:43:42Z"/>
+ <node id="2" lat="31.211" lon="121.411" version="1" user="a" uid="1" changeset="1" timestamp="2013-08-03T16:43:42Z"/>
+ <node id="3" lat="31.221" lon="121.421" version="1" user="a" uid="1" changeset="1" timestamp="2013-08-03T16:43:42Z"/>
+ <way id="10" version="1" user="a" uid="1" changeset="1" timestamp="2013-08-03T16:43:42Z">
+  <nd ref="1"/><nd ref="2"/><nd ref="1"/>
+ </way>
+ <way id="11" version="1" user="a" uid="1" changeset="1" timestamp="2013-08-03T16:43:42Z">
+  <nd ref="98"/><nd ref="99"/>
+ </way>
+</osm>
+"""
+
+
+class TilingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.osm = os.path.join(self.directory, "small.osm")
+        with io.open(self.osm, "w", encoding="utf8") as fo:
+            fo.write(OSM)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, counts):
+        files = spatial.TileFiles(self.osm)
+        contents = {}
+        for tile in counts:
+            with io.open(files.path(tile), "rb") as f:
+                contents[tile] = f.read()
+        return contents
+
+    def test_unplaced_ways(self):
+        counts = spatial.process_map_tiles(self.osm, tiling=spatial.GridTiling(0.01))
+        self.assertEqual(counts, {"3120_12140": 2, "3121_12141": 1, "3122_12142": 1,
+                                  spatial.UNPLACED: 1})
+        self.assertIn('"id": "11"', self.read(counts)[spatial.UNPLACED])
+        self.assertFalse(os.path.exists(self.osm + ".json"))
+
+    def test_reopened_files(self):
+        # With one open file at a time, the tiles are closed and appended to
+        expected = spatial.process_map_tiles(self.osm, tiling=spatial.GridTiling(0.01))
+        contents = self.read(expected)
+        counts = spatial.process_map_tiles(self.osm, tiling=spatial.GridTiling(0.01), max_open=1)
+        self.assertEqual(counts, expected)
+        self.assertEqual(self.read(counts), contents)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the translation stage, against a stub translation server.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import data_shanghai
+from metrics import Metrics
+from translation import (DictBackend, HttpBackend, StubServer, TranslationStage,
+                         split_mixed)
+
+OSM = u"""<?xml version='1.0' encoding='UTF-8'?>
+<osm>
+ <node id="1" lat="31.2" lon="121.4" version="1" timestamp="2013-08-03T16:43:42Z"
+       changeset="5" uid="42" user="XBear">
+  <tag k="name" v="人民广场 People's Square"/>
+ </node>
+ <node id="2" lat="31.2" lon="121.4" version="1" timestamp="2013-08-03T16:43:42Z"
+       changeset="5" uid="42" user="XBear">
+  <tag k="name" v="静安寺 Jing'an Temple"/>
+ </node>
+</osm>
+"""
+
+TRANSLATIONS = {u"浙江出版联合集团大楼": u"Zhejiang Publishing United Group Building",
+                u"人民广场": u"People's Square",
+                u"静安寺": u"Jing'an Temple"}
+
+
+def doc(doc_id, main, **names):
+    name = {"main": main}
+    name.update(names)
+    return {"type": "node", "id": str(doc_id), "name": name}
+
+
+class FailingBackend(object):
+
+    def translate(self, texts):
+        raise IOError("service unavailable")
+
+
+class BlockedBackend(object):
+    """Waits until released"""
+
+    def __init__(self):
+        self.released = threading.Event()
+
+    def translate(self, texts):
+        self.released.wait()
+        return [u""] * len(texts)
+
+
+class TranslationStageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.directory, "translations.json")
+        self.backend = DictBackend(TRANSLATIONS)
+        self.server = StubServer(self.backend).start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def submit_all(self, stage):
+        stage.submit(doc(1, u"浙江出版联合集团大楼Zhejiang publishing united group"))
+        stage.submit(doc(2, u"人民广场 People's Square"))
+        # Same Chinese part, sent once
+        stage.submit(doc(3, u"人民广场People Park"))
+        # Already split, or not mixed
+        stage.submit(doc(4, u"静安寺 Jing'an Temple", en=u"Jing'an Temple"))
+        stage.submit(doc(5, u"静安寺"))
+        # Wrong English part
+        stage.submit(doc(6, u"静安寺 Century Avenue"))
+
+    def test_split_mixed(self):
+        self.assertEqual(split_mixed(u"人民广场 People's Square"), (u"人民广场", u"People's Square"))
+        self.assertEqual(split_mixed(u"静安寺"), None)
+        self.assertEqual(split_mixed(u"People's Square"), None)
+
+    def test_splits(self):
+        stage = TranslationStage(HttpBackend(self.server.url), self.cache_path, batch_size=2)
+        self.submit_all(stage)
+        splits = stage.close()
+        self.assertEqual(sorted(split["_id"] for split in splits),
+                         ["node/1", "node/2", "node/3"])
+        self.assertEqual(stage.errors, 0)
+        self.assertEqual(stage.unfinished, 0)
+        # 3 distinct Chinese parts in batches of 2
+        self.assertEqual(self.backend.requests, 2)
+
+    def test_cache_reuse(self):
+        stage = TranslationStage(HttpBackend(self.server.url), self.cache_path)
+        self.submit_all(stage)
+        expected = stage.close()
+        requests = self.backend.requests
+        stage = TranslationStage(HttpBackend(self.server.url), self.cache_path)
+        self.submit_all(stage)
+        self.assertEqual(stage.close(), expected)
+        self.assertEqual(self.backend.requests, requests)
+
+    def test_errors(self):
+        stage = TranslationStage(FailingBackend(), self.cache_path, batch_size=1)
+        self.submit_all(stage)
+        self.assertEqual(stage.close(), [])
+        self.assertEqual(stage.errors, 3)
+        # Nothing saved, the names are sent again by the next run
+        self.assertFalse(os.path.exists(self.cache_path))
+
+    def test_close_timeout(self):
+        backend = BlockedBackend()
+        stage = TranslationStage(backend, self.cache_path)
+        self.submit_all(stage)
+        start = time.time()
+        self.assertEqual(stage.close(timeout=0.2), [])
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(stage.unfinished, 1)
+        backend.released.set()
+
+
+class ProcessMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.osm = os.path.join(self.directory, "small.osm")
+        self.splits = self.osm + ".name_splits.json"
+        with io.open(self.osm, "w", encoding="utf8") as f:
+            f.write(OSM)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stats_in_metrics(self):
+        metrics = Metrics("translation", interval=float("inf"))
+        stage = TranslationStage(DictBackend(TRANSLATIONS), batch_size=1)
+        data_shanghai.process_map(self.osm, translator=stage, metrics=metrics)
+        self.assertEqual(metrics.report()["translation"],
+                         {"batches": 2, "errors": 0, "unfinished": 0})
+        with io.open(self.splits, "r", encoding="utf8") as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_all_batches_failed(self):
+        metrics = Metrics("translation", interval=float("inf"))
+        stage = TranslationStage(FailingBackend(), batch_size=1)
+        self.assertRaises(IOError, data_shanghai.process_map, self.osm,
+                          translator=stage, metrics=metrics)
+        self.assertEqual(metrics.translation["errors"], 2)
+        self.assertFalse(os.path.exists(self.splits))
+
+
+if __name__ == "__main__":
+    unittest.main()
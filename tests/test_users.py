@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the user statistics, exact and estimated.
+
+Run from the project directory: python -m unittest discover -s tests -t .
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import osm_reader
+import synthetic_osm
+import users
+from sketches import HyperLogLog
+
+# Tolerated relative error of the HyperLogLog estimates, the standard
+# error being 0.8% with p = 14
+TOLERANCE = 0.03
+
+
+class UsersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.osm = os.path.join(self.directory, "small.osm")
+        synthetic_osm.generate(self.osm, 20000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_exact_mode(self):
+        counts = {}
+        names = {}
+        for element in osm_reader.iter_top_level(self.osm):
+            uid = element.attrib["uid"]
+            counts[uid] = counts.get(uid, 0) + 1
+            names.setdefault(uid, element.attrib["user"])
+        summary = users.user_stats(self.osm, n=5)
+        self.assertEqual(summary["unique_users"], len(counts))
+        expected = sorted(counts, key=lambda uid: (-counts[uid], int(uid)))[:5]
+        self.assertEqual([user["uid"] for user in summary["top_users"]], expected)
+        for user in summary["top_users"]:
+            self.assertEqual(user["elements"], counts[user["uid"]])
+            self.assertEqual(user["user"], names[user["uid"]])
+            self.assertEqual(user["nodes"] + user["ways"] + user["relations"], user["elements"])
+
+    def test_modes_agree(self):
+        result = users.compare_modes(self.osm)
+        count = result["set"]["unique_users"]
+        self.assertEqual(result["exact"]["unique_users"], count)
+        self.assertTrue(result["hll"]["error"] <= TOLERANCE, result["hll"])
+        # The exact mode, with the counters and the names, is smaller than
+        # the set of the uids
+        self.assertTrue(result["exact"]["memory_bytes"] < result["set"]["memory_bytes"], result)
+        exact = users.user_stats(self.osm, n=3)["top_users"]
+        approximate = users.user_stats(self.osm, mode="hll", n=3)["top_users"]
+        self.assertEqual([user["uid"] for user in approximate], [user["uid"] for user in exact])
+
+    def test_hyperloglog_accuracy(self):
+        for count in [100, 5000, 100000]:
+            hll = HyperLogLog()
+            for i in xrange(count):
+                hll.add(str(i))
+            error = abs(hll.count() - count) / float(count)
+            self.assertTrue(error <= TOLERANCE, (count, hll.count()))
+
+
+if __name__ == "__main__":
+    unittest.main()
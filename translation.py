@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file checks with a translation service if a Chinese-English mixed
+name can be split into "zh" and "en" names, for example:
+
+"浙江出版联合集团大楼Zhejiang publishing united group"
+    => "zh" : "浙江出版联合集团大楼", "en" : "Zhejiang publishing united group"
+
+The Chinese part is translated and compared with the English part, if
+enough of their words are the same, the split is accepted.
+
+Waiting for each request would greatly increase the process runtime, so
+TranslationStage works beside the shaping of the documents:
+- submit(doc) never waits, the Chinese parts are deduplicated and put in
+  batches, which are sent by a pool of threads
+- the translations are saved into a cache file, so a Chinese part is never
+  sent again, even by another run
+- close() waits for the last batches, at most CLOSE_TIMEOUT seconds, and
+  gives the accepted splits. The batches not translated by then are not
+  saved, so they are sent again by the next run
+- stats() gives the number of sent and failed batches, and of the worker
+  threads which were still running when close() stopped waiting
+
+The translation service is pluggable, any object with a translate(texts)
+method returning the list of the translations can be used:
+- HttpBackend  : posts {"q": [texts], "source": "zh", "target": "en"} as json
+                 to a url and reads {"translations": [translations]}
+- DictBackend  : translations from a dictionary
+StubServer serves a backend over http on localhost, to try HttpBackend
+without the real service.
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from Queue import Queue
+import io
+import json
+import os
+import re
+import threading
+import time
+import urllib2
+
+BATCH_SIZE = 50
+WORKERS = 4
+# Seconds waited by close() for the last translations
+CLOSE_TIMEOUT = 60.0
+# Part of the words of the English part found in the translation
+THRESHOLD = 0.5
+
+mixed_name_re = re.compile(ur'^([^A-Za-z]*[\u4e00-\u9fff][^A-Za-z]*?)\s*([A-Za-z][^\u4e00-\u9fff]*)$')
+word_re = re.compile(r'[a-z0-9]+')
+
+def split_mixed(value):
+    """(Chinese part, English part) of a mixed name, or None"""
+    m = mixed_name_re.match(value)
+    if m is None:
+        return None
+    return m.group(1).strip(), m.group(2).strip()
+
+def similarity(translation, en):
+    # Part of the words of en which are in the translation
+    words = set(word_re.findall(en.lower()))
+    if not words:
+        return 0.0
+    translated = set(word_re.findall(translation.lower()))
+    return len(words & translated) / float(len(words))
+
+
+########################### BACKENDS ######################################
+
+class HttpBackend(object):
+
+    def __init__(self, url, timeout=10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def translate(self, texts):
+        body = json.dumps({"q": texts, "source": "zh", "target": "en"})
+        request = urllib2.Request(self.url, body, {"Content-Type": "application/json"})
+        response = urllib2.urlopen(request, timeout=self.timeout)
+        try:
+            return json.load(response)["translations"]
+        finally:
+            response.close()
+
+
+class DictBackend(object):
+
+    def __init__(self, translations):
+        self.translations = translations
+        self.requests = 0
+
+    def translate(self, texts):
+        self.requests += 1
+        return [self.translations.get(text, u"") for text in texts]
+
+
+class StubServer(object):
+    """Serve a backend on localhost, in a thread"""
+
+    def __init__(self, backend, host="127.0.0.1", port=0):
+        stub_backend = backend
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                length = int(self.headers.getheader("content-length", 0))
+                texts = json.loads(self.rfile.read(length))["q"]
+                body = json.dumps({"translations": stub_backend.translate(texts)})
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        self.url = "http://{0}:{1}/translate".format(*self.server.server_address)
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+############################# CACHE #######################################
+
+class TranslationCache(object):
+    """Translations kept in a file, one json line by translation"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.translations = {}
+        self.lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with io.open(path, "r", encoding="utf8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.translations[record["text"]] = record["translation"]
+
+    def __contains__(self, text):
+        return text in self.translations
+
+    def get(self, text):
+        return self.translations.get(text)
+
+    def update(self, texts, translations):
+        with self.lock:
+            lines = []
+            for text, translation in zip(texts, translations):
+                self.translations[text] = translation
+                lines.append(json.dumps({"text": text, "translation": translation},
+                                        ensure_ascii=False) + u"\n")
+            if self.path is not None:
+                with io.open(self.path, "a", encoding="utf8") as fo:
+                    fo.write(u"".join(lines))
+
+
+############################# STAGE #######################################
+
+class TranslationStage(object):
+
+    def __init__(self, backend, cache_path=None, batch_size=BATCH_SIZE,
+                 workers=WORKERS, threshold=THRESHOLD):
+        self.backend = backend
+        self.cache = TranslationCache(cache_path)
+        self.batch_size = batch_size
+        self.threshold = threshold
+        # (document id, Chinese part, English part) of the candidates
+        self.candidates = []
+        # Chinese parts already sent, or to send in the current batch
+        self.queued = set()
+        self.batch = []
+        # Batches sent to the worker threads
+        self.batches = 0
+        # Failed batches, counted by the worker threads
+        self.errors = 0
+        self.errors_lock = threading.Lock()
+        # Worker threads still running when close() stopped waiting
+        self.unfinished = 0
+        self.queue = Queue()
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def work(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            try:
+                self.cache.update(batch, self.backend.translate(batch))
+            except Exception:
+                # Not saved, so the batch is sent again by the next run
+                with self.errors_lock:
+                    self.errors += 1
+
+    def submit(self, doc):
+        # Record a mixed name without "en", its translation is requested later
+        name = doc.get("name")
+        if not name or "main" not in name or "en" in name:
+            return
+        parts = split_mixed(name["main"])
+        if parts is None:
+            return
+        zh, en = parts
+        self.candidates.append(("{0}/{1}".format(doc["type"], doc["id"]), zh, en))
+        if zh in self.cache or zh in self.queued:
+            return
+        self.queued.add(zh)
+        self.batch.append(zh)
+        if len(self.batch) >= self.batch_size:
+            self.send_batch()
+
+    def send_batch(self):
+        self.queue.put(self.batch)
+        self.batches += 1
+        self.batch = []
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """
+        Wait for the translations, at most timeout seconds, and return the
+        accepted splits of the translated names
+        """
+        if self.batch:
+            self.send_batch()
+        for thread in self.threads:
+            self.queue.put(None)
+        deadline = time.time() + timeout
+        for thread in self.threads:
+            thread.join(max(deadline - time.time(), 0))
+        # The daemon threads left behind don't prevent the exit
+        self.unfinished = sum(1 for thread in self.threads if thread.is_alive())
+        splits = []
+        for doc_id, zh, en in self.candidates:
+            translation = self.cache.get(zh)
+            if translation and similarity(translation, en) >= self.threshold:
+                splits.append({"_id": doc_id, "name": {"zh": zh, "en": en}})
+        return splits
+
+    def stats(self):
+        return {"batches": self.batches,
+                "errors": self.errors,
+                "unfinished": self.unfinished}
+
+    def write(self, splits, path):
+        # One json line by accepted split
+        with io.open(path, "w", encoding="utf8") as fo:
+            for split in splits:
+                fo.write(json.dumps(split, ensure_ascii=False) + u"\n")
+
+
+if __name__ == "__main__":
+    backend = DictBackend({u"浙江出版联合集团大楼": u"Zhejiang Publishing United Group Building"})
+    server = StubServer(backend).start()
+    stage = TranslationStage(HttpBackend(server.url))
+    stage.submit({"type": "way", "id": "1",
+                  "name": {"main": u"浙江出版联合集团大楼Zhejiang publishing united group"}})
+    print stage.close()
+    server.stop()
@@ -6,10 +6,32 @@ This file finds out how many unique users
 have contributed to the map in this particular area!
 
 The function process_map returns a set of unique user IDs ("uid")
+
+The function user_stats also counts the nodes, ways and relations of each
+user, which gives the top contributors in the same pass, with a UserStats:
+- "exact" : the users are kept in arrays, in the order they are found:
+            the uid as an integer, 3 counters, and the end of the name in
+            one utf8 pool of all the names. An open addressing hash table
+            of user numbers finds the user of a uid. A user takes about 40
+            bytes with its name, less than its uid string in a set
+- "hll"   : fixed memory, the number of users is estimated by a HyperLogLog
+            and the top contributors by a SpaceSaving (see sketches)
+compare_modes gives the number of users and the memory of the set, of the
+exact mode and of the HyperLogLog mode.
 """
-import xml.etree.ElementTree as ET
+from array import array
 import pprint
 import re
+import sys
+
+import osm_reader
+from sketches import HyperLogLog, SpaceSaving
+
+TOP_LEVEL_TAGS = ["node", "way", "relation"]
+# Number of top contributors in the results
+TOP = 10
+INITIAL_CAPACITY = 64
+EMPTY = -1
 
 def get_user(element):
     uid = None
@@ -19,10 +41,10 @@ def get_user(element):
     return uid
 
 
-def process_map(filename):
+def process_map(filename, backend=osm_reader.DEFAULT_BACKEND, metrics=None):
     users = set()
     # iterative parsing
-    for _, element in ET.iterparse(filename):
+    for element in osm_reader.iter_elements(filename, backend, metrics):
         user = get_user(element)
         if user != None:
             users.add(user)
@@ -30,6 +52,139 @@ def process_map(filename):
     return users
 
 
+class UserStats(object):
+
+    def __init__(self, mode="exact", p=14, k=100):
+        self.mode = mode
+        if mode == "exact":
+            # uid, nodes, ways and relations of each user
+            self.uids = array("l")
+            self.counts = array("i")
+            # The names of the users one after another, and where each ends
+            self.names = bytearray()
+            self.name_ends = array("i")
+            self.allocate(INITIAL_CAPACITY)
+        elif mode == "hll":
+            self.distinct = HyperLogLog(p)
+            self.heavy = SpaceSaving(k, examples=1)
+        else:
+            raise ValueError("Unknown mode: {0}".format(mode))
+
+    def allocate(self, capacity):
+        # Hash table of the user numbers
+        self.capacity = capacity
+        self.table = array("i", [EMPTY]) * capacity
+        for user, uid in enumerate(self.uids):
+            self.table[self.slot(uid)] = user
+
+    def slot(self, uid):
+        # Linear probing from the hash of the uid
+        mask = self.capacity - 1
+        i = (uid * 2654435761) & mask
+        table = self.table
+        uids = self.uids
+        while table[i] != EMPTY and uids[table[i]] != uid:
+            i = (i + 1) & mask
+        return i
+
+    def name(self, user):
+        start = self.name_ends[user - 1] if user else 0
+        return self.names[start:self.name_ends[user]].decode("utf8")
+
+    def add(self, element):
+        if element.tag not in TOP_LEVEL_TAGS or "uid" not in element.attrib:
+            return
+        uid = element.attrib["uid"]
+        if self.mode == "hll":
+            self.distinct.add(uid)
+            self.heavy.add(uid, element.attrib.get("user"))
+            return
+        uid = int(uid)
+        i = self.slot(uid)
+        user = self.table[i]
+        if user == EMPTY:
+            # Keep the load of the table under 2/3
+            if 3 * (len(self.uids) + 1) > 2 * self.capacity:
+                self.allocate(2 * self.capacity)
+                i = self.slot(uid)
+            user = self.table[i] = len(self.uids)
+            self.uids.append(uid)
+            self.counts.extend((0, 0, 0))
+            name = element.attrib.get("user", u"")
+            if isinstance(name, unicode):
+                name = name.encode("utf8")
+            self.names.extend(name)
+            self.name_ends.append(len(self.names))
+        self.counts[3 * user + TOP_LEVEL_TAGS.index(element.tag)] += 1
+
+    def count(self):
+        """Number of unique users, estimated in the "hll" mode"""
+        if self.mode == "hll":
+            return self.distinct.count()
+        return len(self.uids)
+
+    def top(self, n=TOP):
+        """The users with the most elements"""
+        if self.mode == "hll":
+            return [{"uid": item["value"], "user": item["examples"][0]["value"],
+                     "elements": item["count"], "error": item["error"]}
+                    for item in self.heavy.top(n)]
+        elements = [sum(self.counts[3 * user:3 * user + 3]) for user in xrange(len(self.uids))]
+        best = sorted(xrange(len(self.uids)), key=lambda user: (-elements[user], self.uids[user]))
+        users = []
+        for user in best[:n]:
+            nodes, ways, relations = self.counts[3 * user:3 * user + 3]
+            users.append({"uid": str(self.uids[user]), "user": self.name(user),
+                          "nodes": nodes, "ways": ways, "relations": relations,
+                          "elements": elements[user]})
+        return users
+
+    def memory(self):
+        # Bytes used by the tracker, with the names of the users in the
+        # "exact" mode, the names of the SpaceSaving examples being shared
+        # with the parsed elements
+        if self.mode == "hll":
+            return self.distinct.size() + self.heavy.size()
+        return sum(sys.getsizeof(a) for a in [self.table, self.uids, self.counts,
+                                               self.names, self.name_ends])
+
+    def summary(self, n=TOP):
+        return {"mode": self.mode,
+                "unique_users": self.count(),
+                "top_users": self.top(n),
+                "memory_bytes": self.memory()}
+
+
+def user_stats(filename, mode="exact", n=TOP, backend=osm_reader.DEFAULT_BACKEND,
+               metrics=None):
+    """The number of users and the top n contributors, in one pass"""
+    stats = UserStats(mode)
+    for element in osm_reader.iter_top_level(filename, backend, metrics):
+        stats.add(element)
+    return stats.summary(n)
+
+def set_memory(users):
+    return sys.getsizeof(users) + sum(sys.getsizeof(uid) for uid in users)
+
+def compare_modes(filename, backend=osm_reader.DEFAULT_BACKEND):
+    """Number of users and memory of the set, the exact and the hll modes"""
+    users = set()
+    exact = UserStats("exact")
+    approximate = UserStats("hll")
+    for element in osm_reader.iter_top_level(filename, backend):
+        user = get_user(element)
+        if user != None:
+            users.add(user)
+        exact.add(element)
+        approximate.add(element)
+    count = len(users)
+    return {"set": {"unique_users": count, "memory_bytes": set_memory(users)},
+            "exact": {"unique_users": exact.count(), "memory_bytes": exact.memory()},
+            "hll": {"unique_users": approximate.count(),
+                    "error": abs(approximate.count() - count) / float(max(count, 1)),
+                    "memory_bytes": approximate.memory()}}
+
+
 if __name__ == "__main__":
     # find users
     users = process_map('example.osm')
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This file provides the writers of the shaped documents, one per output format:
+
+- "json"     : json lines, same as the original output of process_map
+- "json.gz"  : json lines compressed with gzip
+- "json.zst" : json lines compressed with zstandard, only if it is installed
+- "bson"     : BSON documents, which can be loaded by mongorestore,
+               only if the bson module of pymongo is installed
+- "msgpack"  : MessagePack documents, only if msgpack is installed
+
+The writers keep the encoded documents in a buffer and write them by
+batches, to avoid a small write for each document. The compact documents
+of compact_docs are converted to dicts when they are encoded.
+open_writer and iter_documents use the extension of the format to write
+and read back "<file_in>.<format>".
+"""
+
+import gzip
+import io
+import json
+
+try:
+    import bson
+except ImportError:
+    bson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Number of documents encoded before each write
+BATCH_SIZE = 1000
+
+
+class BatchWriter(object):
+    """Base writer, the subclasses define open_file and encode"""
+
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.f = self.open_file(path)
+        self.buffer = []
+        self.count = 0
+        # Bytes written or in the buffer, the offset of the next document
+        self.position = 0
+
+    def open_file(self, path):
+        return io.open(path, "wb")
+
+    def encode(self, doc):
+        raise NotImplementedError
+
+    def write(self, doc):
+        if hasattr(doc, "to_dict"):
+            doc = doc.to_dict()
+        data = self.encode(doc)
+        self.buffer.append(data)
+        self.position += len(data)
+        self.count += 1
+        if len(self.buffer) == self.batch_size:
+            self.flush()
+
+    def write_encoded(self, data, count):
+        # Write a batch of documents already encoded
+        self.flush()
+        self.f.write(data)
+        self.position += len(data)
+        self.count += count
+
+    def flush(self):
+        self.f.write(b"".join(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def to_json_line(el):
+    # Make sure the Chinese characters can be correctly written
+    jdata = unicode(json.dumps(el, ensure_ascii=False))
+    return jdata + "\n"
+
+def encode_json(doc):
+    return to_json_line(doc).encode("utf8")
+
+def encode_bson(doc):
+    return bson.BSON.encode(doc)
+
+def encode_msgpack(doc):
+    return msgpack.packb(doc, use_bin_type=True)
+
+
+class JsonLinesWriter(BatchWriter):
+    def encode(self, doc):
+        return encode_json(doc)
+
+
+class GzipJsonLinesWriter(JsonLinesWriter):
+    def open_file(self, path):
+        return gzip.open(path, "wb")
+
+
+class ZstdJsonLinesWriter(JsonLinesWriter):
+    def open_file(self, path):
+        self.raw = io.open(path, "wb")
+        return zstandard.ZstdCompressor().stream_writer(self.raw)
+
+    def close(self):
+        JsonLinesWriter.close(self)
+        self.raw.close()
+
+
+class BSONWriter(BatchWriter):
+    def encode(self, doc):
+        return encode_bson(doc)
+
+
+class MsgPackWriter(BatchWriter):
+    def encode(self, doc):
+        return encode_msgpack(doc)
+
+
+WRITERS = {"json": JsonLinesWriter,
+           "json.gz": GzipJsonLinesWriter,
+           "json.zst": ZstdJsonLinesWriter,
+           "bson": BSONWriter,
+           "msgpack": MsgPackWriter}
+
+# Encoding of a document by the writer of each format
+ENCODERS = {"json": encode_json,
+            "json.gz": encode_json,
+            "json.zst": encode_json,
+            "bson": encode_bson,
+            "msgpack": encode_msgpack}
+
+def available_formats():
+    formats = ["json", "json.gz"]
+    if bson is not None:
+        formats.append("bson")
+    if zstandard is not None:
+        formats.append("json.zst")
+    if msgpack is not None:
+        formats.append("msgpack")
+    return formats
+
+def output_path(file_in, fmt):
+    return "{0}.{1}".format(file_in, fmt)
+
+def open_writer(file_in, fmt="json", batch_size=BATCH_SIZE):
+    """Return the writer of "<file_in>.<fmt>" """
+    if fmt not in available_formats():
+        raise ValueError("Unknown or unavailable format: {0}".format(fmt))
+    return WRITERS[fmt](output_path(file_in, fmt), batch_size)
+
+def iter_json_lines(f):
+    for line in f:
+        yield json.loads(line.decode("utf8"))
+
+def iter_documents(path, fmt="json"):
+    """Read back the documents written in a format"""
+    if fmt == "json":
+        with io.open(path, "rb") as f:
+            for doc in iter_json_lines(f):
+                yield doc
+    elif fmt == "json.gz":
+        with gzip.open(path, "rb") as f:
+            for doc in iter_json_lines(f):
+                yield doc
+    elif fmt == "json.zst":
+        with io.open(path, "rb") as raw:
+            f = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw))
+            for doc in iter_json_lines(f):
+                yield doc
+    elif fmt == "bson":
+        with io.open(path, "rb") as f:
+            for doc in bson.decode_file_iter(f):
+                yield doc
+    elif fmt == "msgpack":
+        with io.open(path, "rb") as f:
+            for doc in msgpack.Unpacker(f, raw=False):
+                yield doc
+    else:
+        raise ValueError("Unknown format: {0}".format(fmt))